@@ -2,6 +2,8 @@
 ASGI config for aasp project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Server-sent event streams of code question submissions (see core/events.py) are served directly, everything else is
+passed to django.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.0/howto/deployment/asgi/
@@ -13,4 +15,13 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'aasp.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# imported once the apps are loaded
+from core.events import EVENTS_PATH, submission_events  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "http" and scope["path"].startswith(EVENTS_PATH):
+        return await submission_events(scope, receive, send)
+    return await django_application(scope, receive, send)
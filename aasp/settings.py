@@ -172,6 +172,105 @@ CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL")
 # judge0 settings
 JUDGE0_URL = os.environ.get("JUDGE0_URL")
 
+# pool of judge0 nodes, comma separated "<url>|<weight>|<lane>+<lane>" (weight and lanes are optional, a node without
+# lanes serves all of them, see ADMISSION_LANE_WEIGHTS), defaults to the single JUDGE0_URL
+JUDGE0_URLS = [url.strip() for url in os.environ.get("JUDGE0_URLS", JUDGE0_URL or "").split(",") if url.strip()]
+# seconds between health probes of the judge0 nodes
+JUDGE0_HEALTH_INTERVAL = float(os.environ.get("JUDGE0_HEALTH_INTERVAL", 10))
+# consecutive failures after which a node is ejected from the pool until a health probe succeeds
+JUDGE0_UNHEALTHY_THRESHOLD = int(os.environ.get("JUDGE0_UNHEALTHY_THRESHOLD", 3))
+
+# judge0 client connection pool, timeouts (seconds) and retries
+JUDGE0_POOL_SIZE = int(os.environ.get("JUDGE0_POOL_SIZE", 10))
+JUDGE0_CONNECT_TIMEOUT = float(os.environ.get("JUDGE0_CONNECT_TIMEOUT", 3.05))
+JUDGE0_READ_TIMEOUT = float(os.environ.get("JUDGE0_READ_TIMEOUT", 30))
+JUDGE0_MAX_RETRIES = int(os.environ.get("JUDGE0_MAX_RETRIES", 3))
+JUDGE0_RETRY_BACKOFF = float(os.environ.get("JUDGE0_RETRY_BACKOFF", 0.3))
+
+# max number of tokens per GET /submissions/batch call (MAX_SUBMISSION_BATCH_SIZE in judge0.conf, default 20)
+JUDGE0_BATCH_SIZE = int(os.environ.get("JUDGE0_BATCH_SIZE", 20))
+
+# max number of solution code outputs cached for custom test case inputs
+SOLUTION_OUTPUT_CACHE_SIZE = int(os.environ.get("SOLUTION_OUTPUT_CACHE_SIZE", 10000))
+
+# reuse the results of identical submissions (same code, language, test case and limits) instead of calling judge0 again
+SUBMISSION_RESULT_REUSE = os.environ.get("SUBMISSION_RESULT_REUSE", "1") == "1"
+# concurrency questions are nondeterministic (data races, thread counts), so they are excluded by default
+SUBMISSION_RESULT_REUSE_CONCURRENCY = os.environ.get("SUBMISSION_RESULT_REUSE_CONCURRENCY", "0") == "1"
+
+# admission control of judge0 submissions (one test case is one submission), see core/admission.py
+ADMISSION_CONTROL = os.environ.get("ADMISSION_CONTROL", "1") == "1"
+# per user token bucket (submissions per second, burst), users exceeding it are rejected
+ADMISSION_USER_RATE = float(os.environ.get("ADMISSION_USER_RATE", 1))
+ADMISSION_USER_BURST = int(os.environ.get("ADMISSION_USER_BURST", 40))
+# global token bucket, submissions beyond it are queued and sent to judge0 at this rate
+ADMISSION_GLOBAL_RATE = float(os.environ.get("ADMISSION_GLOBAL_RATE", 20))
+ADMISSION_GLOBAL_BURST = int(os.environ.get("ADMISSION_GLOBAL_BURST", 200))
+# priority lanes (graded, educator, practice): queued submissions of each lane sent per round of the drain
+ADMISSION_LANE_WEIGHTS = {
+    lane: int(weight) for lane, weight in
+    (item.split(":") for item in os.environ.get("ADMISSION_LANE_WEIGHTS", "graded:6,educator:3,practice:1").split(","))
+}
+# fraction of ADMISSION_GLOBAL_BURST that a lane must leave for higher priority lanes when it is admitted or dispatched
+ADMISSION_LANE_RESERVES = {
+    lane: float(reserve) for lane, reserve in
+    (item.split(":") for item in os.environ.get("ADMISSION_LANE_RESERVES", "graded:0,educator:0.1,practice:0.3").split(","))
+}
+# max number of queued submissions (requests are rejected when full) and seconds between drains of the queue
+ADMISSION_QUEUE_SIZE = int(os.environ.get("ADMISSION_QUEUE_SIZE", 2000))
+ADMISSION_DRAIN_INTERVAL = float(os.environ.get("ADMISSION_DRAIN_INTERVAL", 1))
+
+# url of aasp as seen from judge0, enables judge0 callbacks for submissions (e.g. http://aasp_nginx)
+AASP_CALLBACK_URL = os.environ.get("AASP_CALLBACK_URL")
+
+# seconds to wait for a judge0 callback before falling back to polling judge0
+JUDGE0_CALLBACK_GRACE_PERIOD = int(os.environ.get("JUDGE0_CALLBACK_GRACE_PERIOD", 5))
+
+# background reconciliation of test cases that are still pending in judge0 (see core/judge0.py), independent of browsers
+# seconds between runs, max test cases polled per run, and seconds after a submission before it is polled
+RECONCILER_INTERVAL = float(os.environ.get("RECONCILER_INTERVAL", 5))
+RECONCILER_BATCH_SIZE = int(os.environ.get("RECONCILER_BATCH_SIZE", 500))
+RECONCILER_MIN_AGE = float(os.environ.get("RECONCILER_MIN_AGE", 10))
+# exponential backoff of each token that is still pending after a poll (seconds, doubled after every poll)
+RECONCILER_BACKOFF_BASE = float(os.environ.get("RECONCILER_BACKOFF_BASE", 2))
+RECONCILER_BACKOFF_MAX = float(os.environ.get("RECONCILER_BACKOFF_MAX", 300))
+# polls of a token that judge0 does not know (e.g. lost when judge0 was reset) before it is marked as Internal Error
+RECONCILER_MAX_MISSES = int(os.environ.get("RECONCILER_MAX_MISSES", 6))
+
+# bulk regrading of stored submissions against the current test cases (see core/regrade.py), max submissions re-sent to
+# judge0 per batch (fewer when their test cases to re-run exceed JUDGE0_BATCH_SIZE) and seconds between steps while
+# judge0 is saturated or results are pending
+REGRADE_BATCH_SIZE = int(os.environ.get("REGRADE_BATCH_SIZE", 50))
+REGRADE_INTERVAL = float(os.environ.get("REGRADE_INTERVAL", 5))
+
+# server-sent events of submission statuses (see core/events.py), seconds between re-reads of the database while waiting
+# for postgres notifications (or without them), seconds between polls of judge0 while results are not pushed by judge0
+# callbacks, and max duration of a stream
+EVENTS_REFRESH_INTERVAL = float(os.environ.get("EVENTS_REFRESH_INTERVAL", 15))
+EVENTS_FALLBACK_INTERVAL = float(os.environ.get("EVENTS_FALLBACK_INTERVAL", 2))
+EVENTS_POLL_INTERVAL = float(os.environ.get("EVENTS_POLL_INTERVAL", 1))
+EVENTS_MAX_DURATION = float(os.environ.get("EVENTS_MAX_DURATION", 300))
+
+# automatic submission of attempts whose duration has lapsed (see submit_expired_attempts), seconds between sweeps,
+# grace period (seconds) after the end of the duration, and attempts scored per task
+AUTO_SUBMIT_INTERVAL = float(os.environ.get("AUTO_SUBMIT_INTERVAL", 15))
+AUTO_SUBMIT_GRACE_PERIOD = float(os.environ.get("AUTO_SUBMIT_GRACE_PERIOD", 30))
+AUTO_SUBMIT_BATCH_SIZE = int(os.environ.get("AUTO_SUBMIT_BATCH_SIZE", 100))
+
+# periodic tasks (celery beat, run embedded in the worker with -B)
+CELERY_BEAT_SCHEDULE = {
+    "reconcile-test-case-attempts": {
+        "task": "core.tasks.reconcile_test_case_attempts",
+        "schedule": RECONCILER_INTERVAL,
+        "options": {"expires": RECONCILER_INTERVAL},
+    },
+    "submit-expired-attempts": {
+        "task": "core.tasks.submit_expired_attempts",
+        "schedule": AUTO_SUBMIT_INTERVAL,
+        "options": {"expires": AUTO_SUBMIT_INTERVAL},
+    },
+}
+
 FORMAT_MODULE_PATH = [
     'aasp.formats',
 ]
@@ -12,5 +12,14 @@ python3 manage.py collectstatic --no-input
 # migrate
 python3 manage.py migrate --no-input
 
+# run uvicorn for the server-sent event streams (/api/events/), restarted if it exits
+(
+    while true; do
+        uvicorn aasp.asgi:application --host 0.0.0.0 --port 8001
+        echo "uvicorn exited with status $?, restarting" >&2
+        sleep 1
+    done
+) &
+
 # run gunicorn
 gunicorn --bind 0.0.0.0:8000 aasp.wsgi
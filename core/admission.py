@@ -0,0 +1,316 @@
+# admission control in front of judge0: token buckets and a bounded submission queue
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from core.models import RateLimitBucket, QueuedSubmission, SolutionOutputCache, TestCaseAttempt
+
+# prefix of placeholder tokens handed out for queued submissions, replaced by judge0 tokens once dispatched
+QUEUED_TOKEN_PREFIX = "queued-"
+
+GLOBAL_BUCKET_KEY = "global"
+
+# priority classes of judge0 traffic, highest priority first
+LANES = [lane for lane, _ in QueuedSubmission.LANES]
+
+
+class RateLimited(Exception):
+    """
+    The user has exceeded their own rate limit, the request is rejected rather than queued.
+    """
+
+
+class QueueFull(Exception):
+    """
+    Judge0 is saturated and the submission queue is full, the request is rejected.
+    """
+
+
+def admission_enabled():
+    return settings.ADMISSION_CONTROL
+
+
+def get_user_bucket_key(user):
+    return f"user-{user.id}"
+
+
+def take_tokens(buckets, cost, reserve=0):
+    """
+    Takes cost tokens from each of the buckets [(key, rate, capacity), ...] if all of them have enough tokens,
+    leaving at least reserve tokens in each of them.
+    Either all or none of the buckets are charged. Returns the keys of the buckets that did not have enough tokens.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        rows = [(get_bucket(key, capacity), rate, capacity) for key, rate, capacity in buckets]
+
+        # refill according to the time since the last update
+        for bucket, rate, capacity in rows:
+            bucket.tokens = min(capacity, bucket.tokens + (now - bucket.updated).total_seconds() * rate)
+            bucket.updated = now
+
+        # a request larger than the bucket is admitted once the bucket is full
+        empty = [bucket.key for bucket, rate, capacity in rows if bucket.tokens < min(cost + reserve, capacity)]
+        if not empty:
+            for bucket, rate, capacity in rows:
+                bucket.tokens -= cost
+
+        for bucket, rate, capacity in rows:
+            bucket.save(update_fields=['tokens', 'updated'])
+    return empty
+
+
+def refund_tokens(buckets, cost):
+    """
+    Gives cost tokens back to each of the buckets [(key, rate, capacity), ...], e.g. for submissions that were not sent.
+    """
+    with transaction.atomic():
+        for key, rate, capacity in buckets:
+            bucket = get_bucket(key, capacity)
+            bucket.tokens = min(capacity, bucket.tokens + cost)
+            bucket.save(update_fields=['tokens'])
+
+
+def get_bucket(key, capacity):
+    """
+    Returns the bucket locked for update, created full if it does not exist yet. Must be called in a transaction.
+    """
+    bucket = RateLimitBucket.objects.select_for_update().filter(key=key).first()
+    if bucket:
+        return bucket
+    try:
+        with transaction.atomic():
+            RateLimitBucket.objects.create(key=key, tokens=capacity, updated=timezone.now())
+    except IntegrityError:
+        # created concurrently by another request
+        pass
+    return RateLimitBucket.objects.select_for_update().get(key=key)
+
+
+def get_global_bucket():
+    return GLOBAL_BUCKET_KEY, settings.ADMISSION_GLOBAL_RATE, settings.ADMISSION_GLOBAL_BURST
+
+
+def get_user_bucket(user):
+    return get_user_bucket_key(user), settings.ADMISSION_USER_RATE, settings.ADMISSION_USER_BURST
+
+
+def get_lane_reserve(lane):
+    """
+    Tokens of the global bucket that a lane must leave for higher priority lanes (ADMISSION_LANE_RESERVES is
+    a fraction of ADMISSION_GLOBAL_BURST), so that graded submissions are admitted even when practice runs spike.
+    """
+    return settings.ADMISSION_LANE_RESERVES.get(lane, 0) * settings.ADMISSION_GLOBAL_BURST
+
+
+def admit(user, cost, lane):
+    """
+    Decides if cost judge0 submissions by the user in the lane may be sent to judge0 right away.
+    Returns True if admitted and False if they have to be queued (judge0 is saturated, or submissions of this lane or
+    a higher priority lane are already queued).
+    Raises RateLimited if the user has exceeded their own rate limit, and QueueFull if the submissions would have to be
+    queued but the queue is full (the tokens of the user are given back).
+    """
+    if not admission_enabled():
+        return True
+
+    user_bucket = get_user_bucket(user)
+    if take_tokens([user_bucket], cost):
+        raise RateLimited()
+
+    # submissions that are already queued go first
+    higher_lanes = LANES[:LANES.index(lane) + 1]
+    if not QueuedSubmission.objects.filter(lane__in=higher_lanes, time_dispatched__isnull=True).exists() and \
+            not take_tokens([get_global_bucket()], cost, reserve=get_lane_reserve(lane)):
+        return True
+
+    if queue_full():
+        refund_tokens([user_bucket], cost)
+        raise QueueFull()
+    return False
+
+
+def release(user, cost):
+    """
+    Gives back the tokens charged by admit for cost admitted submissions that could not be sent to judge0.
+    """
+    if admission_enabled():
+        refund_tokens([get_user_bucket(user), get_global_bucket()], cost)
+
+
+def queue_full():
+    return pending_queue_size() >= settings.ADMISSION_QUEUE_SIZE
+
+
+def enqueue(user, kind, lane, params, cq_submission=None):
+    """
+    Adds judge0 submissions to the queue of a lane.
+    Raises QueueFull if the queue already holds ADMISSION_QUEUE_SIZE submissions (of all lanes).
+    """
+    if queue_full():
+        raise QueueFull()
+    return QueuedSubmission.objects.create(user=user, kind=kind, lane=lane, params=params, cq_submission=cq_submission)
+
+
+def get_queued_token(queued_submission, index=None):
+    """
+    Placeholder token of a queued submission, "queued-<id>" for the whole submission or "queued-<id>-<index>" for one
+    of its test cases.
+    """
+    if index is None:
+        return f"{QUEUED_TOKEN_PREFIX}{queued_submission.id}"
+    return f"{QUEUED_TOKEN_PREFIX}{queued_submission.id}-{index}"
+
+
+def is_queued_token(token):
+    return bool(token) and token.startswith(QUEUED_TOKEN_PREFIX)
+
+
+def get_queue_position(queued_submission):
+    """
+    1-based position in the queue of its lane, or 0 if it was already sent to judge0.
+    """
+    if queued_submission.time_dispatched:
+        return 0
+    return QueuedSubmission.objects.filter(lane=queued_submission.lane, time_dispatched__isnull=True,
+                                           id__lte=queued_submission.id).count()
+
+
+def resolve_queued_token(token):
+    """
+    Returns (token, position) for a placeholder token. The token is the judge0 token (or "<token>:<expected_output_token>"
+    for runs with a custom input) once dispatched, otherwise None with the position in the queue.
+    """
+    queued_id, _, index = token[len(QUEUED_TOKEN_PREFIX):].partition("-")
+    queued_submission = QueuedSubmission.objects.get(id=int(queued_id))
+    if not queued_submission.tokens:
+        return None, get_queue_position(queued_submission)
+    if index:
+        return queued_submission.tokens[int(index)], 0
+    return ":".join(queued_submission.tokens), 0
+
+
+def get_submission_queue_position(cq_submission):
+    """
+    Position in the queue of a CodeQuestionSubmission, or 0 if it is not queued.
+    """
+    queued_submission = QueuedSubmission.objects.filter(cq_submission=cq_submission, time_dispatched__isnull=True).first()
+    return get_queue_position(queued_submission) if queued_submission else 0
+
+
+def pending_queue_size():
+    return QueuedSubmission.objects.filter(time_dispatched__isnull=True).count()
+
+
+def drain_stalled():
+    """
+    True if the queue has not been drained recently (the global bucket is only used by the drain task while
+    submissions are queued), e.g. because the drain task was lost when a worker restarted.
+    """
+    bucket = RateLimitBucket.objects.filter(key=GLOBAL_BUCKET_KEY).first()
+    return not bucket or timezone.now() - bucket.updated > timedelta(seconds=settings.ADMISSION_DRAIN_INTERVAL * 10)
+
+
+def purge_dispatched(older_than):
+    """
+    Deletes queued submissions that were sent to judge0 before older_than (their tokens are no longer needed).
+    """
+    QueuedSubmission.objects.filter(time_dispatched__lt=older_than, tokens__isnull=False).delete()
+
+
+def get_dispatching():
+    """
+    Queued submissions that were claimed by dispatch_next and are being sent to judge0 (they have no tokens yet).
+    """
+    return QueuedSubmission.objects.filter(time_dispatched__isnull=False, tokens__isnull=True)
+
+
+def requeue_stalled_dispatches():
+    """
+    Puts the submissions whose dispatch did not finish (e.g. the worker was restarted while sending them to judge0) back
+    in the queue, once the POST would have timed out. They are judged twice if they had reached judge0.
+    """
+    timeout = 2 * (settings.JUDGE0_CONNECT_TIMEOUT * (settings.JUDGE0_MAX_RETRIES + 1) + settings.JUDGE0_READ_TIMEOUT)
+    return get_dispatching().filter(time_dispatched__lt=timezone.now() - timedelta(seconds=timeout)) \
+        .update(time_dispatched=None)
+
+
+def dispatch_queued_submissions(pool):
+    """
+    Sends queued submissions to judge0 as long as the global token bucket allows.
+    Lanes are served weighted round robin (ADMISSION_LANE_WEIGHTS submissions of each lane per round), in order within
+    a lane, so that graded submissions keep a bounded latency without starving practice runs. A lane stops being served
+    once the global bucket is down to its reserve (see get_lane_reserve), higher priority lanes may still be served.
+    Returns the number of queued submissions that were dispatched.
+    """
+    dispatched = 0
+    # lanes that hit their reserve of the global bucket, they continue in the next drain
+    blocked = set()
+    while True:
+        dispatched_in_round = 0
+        for lane in LANES:
+            if lane in blocked:
+                continue
+            for _ in range(settings.ADMISSION_LANE_WEIGHTS.get(lane, 1)):
+                result = dispatch_next(pool, lane)
+                if result is None:
+                    blocked.add(lane)
+                    break
+                # lane is empty
+                if not result:
+                    break
+                dispatched_in_round += 1
+
+        if not dispatched_in_round:
+            return dispatched
+        dispatched += dispatched_in_round
+
+
+def dispatch_next(pool, lane):
+    """
+    Sends the oldest queued submission of a lane to the judge0 node chosen by the pool (see core/judge0.py).
+    The submission is claimed and the global token bucket charged in a short transaction, so that judge0 is called
+    without holding the lock of the bucket. If judge0 cannot be reached, it is put back in the queue and the tokens are
+    given back.
+    The placeholder tokens of the TestCaseAttempts of a queued CodeQuestionSubmission (and of the solution output cache
+    entry of a run) are replaced by the judge0 tokens.
+    Returns True if dispatched, False if the lane is empty and None if the global token bucket is down to the reserve
+    of the lane.
+    """
+    with transaction.atomic():
+        queued_submission = QueuedSubmission.objects.select_for_update(skip_locked=True) \
+            .filter(lane=lane, time_dispatched__isnull=True).order_by('id').first()
+        if not queued_submission:
+            return False
+        cost = len(queued_submission.params)
+        if take_tokens([get_global_bucket()], cost, reserve=get_lane_reserve(lane)):
+            return None
+
+        queued_submission.time_dispatched = timezone.now()
+        queued_submission.save(update_fields=['time_dispatched'])
+
+    try:
+        node, data = pool.submit("/submissions/batch?base64_encoded=false", {"submissions": queued_submission.params},
+                                 lane=lane, count=cost)
+    except requests.exceptions.RequestException:
+        QueuedSubmission.objects.filter(id=queued_submission.id).update(time_dispatched=None)
+        refund_tokens([get_global_bucket()], cost)
+        raise
+    tokens = [x['token'] for x in data]
+
+    with transaction.atomic():
+        queued_submission.tokens = [pool.qualify_token(node, token) for token in tokens]
+        queued_submission.save(update_fields=['tokens'])
+
+        # replace the placeholder tokens of the test case attempts
+        for index, token in enumerate(tokens):
+            placeholder = get_queued_token(queued_submission, index)
+            if queued_submission.cq_submission_id:
+                TestCaseAttempt.objects.filter(cq_submission_id=queued_submission.cq_submission_id, token=placeholder) \
+                    .update(token=token, judge0_node=node.name)
+            else:
+                SolutionOutputCache.objects.filter(token=placeholder).update(token=token)
+    return True
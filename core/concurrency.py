@@ -1,17 +1,86 @@
+import functools
 import re
 
+# placeholder in harness preludes for the minimum number of threads of the test case
+MIN_THREADS_PLACEHOLDER = "TEST_CASE.MIN_THREADS"
+
+# matches the entry point of a C/C++ program up to its opening brace, e.g.
+# "int main() {", "int main(void)\n{", "int main(int argc, char *argv[]) {"
+C_MAIN_PATTERN = re.compile(r'\bint\s+main\s*\([^)]*\)\s*\{')
+
+# comments and string/character literals of C/C++, which are skipped when looking for the entry point
+C_SKIPPED_PATTERN = re.compile(r'//[^\n]*|/\*.*?\*/|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'', re.S)
+
+
+class ConcurrencyHarness:
+    """
+    Instrumentation for concurrency questions in one language.
+    The prelude (thread counting and timing functions) is prepended to the code and main_prologue is
+    inserted at the start of the entry point, which is found with main_pattern outside of the comments and literals
+    matched by skipped_pattern.
+    The harness writes its markers to stderr, so that the stdout of the user's code is left untouched.
+    """
+
+    def __init__(self, lang_id, compiler_options, prelude, main_prologue, main_pattern=C_MAIN_PATTERN,
+                 skipped_pattern=C_SKIPPED_PATTERN):
+        self.lang_id = lang_id
+        self.compiler_options = compiler_options
+        self.prelude = prelude
+        self.main_prologue = main_prologue
+        self.main_pattern = main_pattern
+        # comments and literals are consumed before they can match the entry point
+        self.scan_pattern = re.compile(f"{skipped_pattern.pattern}|(?P<main>{main_pattern.pattern})",
+                                       skipped_pattern.flags | main_pattern.flags)
+
+    def get_prelude(self, min_threads):
+        return get_harness_prelude(self.lang_id, min_threads)
+
+    def find_entry_point(self, code):
+        """
+        Returns the match of the entry point in the code, or None if it has none.
+        """
+        for match in self.scan_pattern.finditer(code):
+            if match.group("main") is not None:
+                return match
+        return None
+
+    def instrument(self, code, min_threads):
+        """
+        Returns the code with the prelude prepended and the prologue inserted (once) at the start of main.
+        """
+        match = self.find_entry_point(code)
+        if match:
+            code = code[:match.end()] + " " + self.main_prologue + code[match.end():]
+        return self.get_prelude(min_threads) + code
+
+
+# harnesses of supported languages by judge0 language id, see register_harness
+HARNESSES = {}
+
+
+def register_harness(harness):
+    HARNESSES[harness.lang_id] = harness
+    get_harness_prelude.cache_clear()
+    return harness
+
+
+@functools.lru_cache(maxsize=256)
+def get_harness_prelude(lang_id, min_threads):
+    """
+    Prelude of a language with the minimum number of threads filled in, built once per (language, min_threads).
+    """
+    return HARNESSES[lang_id].prelude.replace(MIN_THREADS_PLACEHOLDER, str(min_threads))
+
+
 def modify_concurrency_params(params, code, lang_id, test_case):
     params = append_concurrency_compiler_options(params, lang_id, test_case)
     params = process_concurrency_code(params, lang_id, code, test_case)
     return params
 
 def append_concurrency_compiler_options(params, lang_id, test_case):
-    # C
-    if lang_id == 75:
-        params['compiler_options'] = "-pthread -fsanitize=thread"
-    # C++
-    elif lang_id == 76:
-        params['compiler_options'] = "-fsanitize=thread"
+    harness = HARNESSES.get(lang_id)
+    if harness and harness.compiler_options:
+        params['compiler_options'] = harness.compiler_options
 
     # params["max_processes_and_or_threads"] = test_case.max_threads
     params["max_processes_and_or_threads"] = 50
@@ -20,9 +89,17 @@ def append_concurrency_compiler_options(params, lang_id, test_case):
     return params
 
 def process_concurrency_code(params, lang_id, code, test_case):
-    # C
-    if lang_id == 75:
-        c_counter_init = """
+    harness = HARNESSES.get(lang_id)
+    if harness:
+        params['source_code'] = harness.instrument(code, test_case.min_threads)
+    return params
+
+
+# C
+register_harness(ConcurrencyHarness(
+    lang_id=75,
+    compiler_options="-pthread -fsanitize=thread",
+    prelude="""
 #include <stdio.h>
 #include <stdlib.h>
 #include <pthread.h>
@@ -33,8 +110,7 @@ pthread_mutex_t createMtx = PTHREAD_MUTEX_INITIALIZER;
 pthread_mutex_t joinMtx = PTHREAD_MUTEX_INITIALIZER;
 int numThreadsCreated = 0;
 long long processStartTime;
-"""
-        c_time_functions = """
+
 long long getCurrentTime() {
     struct timeval currentTime;
     gettimeofday(&currentTime, NULL);
@@ -48,15 +124,14 @@ long long getTimeElapsed() {
 
 void setThreadStart(pthread_t _thread) {
     long long timeElapsed = getTimeElapsed();
-    printf("AASP_STARTED_THREAD_%lu_%lu_AASP", _thread, timeElapsed);
+    fprintf(stderr, "AASP_STARTED_THREAD_%lu_%lu_AASP", _thread, timeElapsed);
 }
 
 void setThreadEnd(pthread_t threadId) {
     long long timeElapsed = getTimeElapsed();
-    printf("AASP_ENDED_THREAD_%lu_%lu_AASP", threadId, timeElapsed);
+    fprintf(stderr, "AASP_ENDED_THREAD_%lu_%lu_AASP", threadId, timeElapsed);
 }
-"""
-        c_counter_functions = """
+
 pthread_t createThread(void* (*func)(void*), void* args) {
     pthread_mutex_lock(&createMtx);
     
@@ -73,7 +148,7 @@ pthread_t createThread(void* (*func)(void*), void* args) {
         sprintf(AASP_NUM_THREADS_VALID_TOKEN, "AASP_%d_THREADS_CREATED_INSUFFICIENT", numThreadsCreated);
     }
     
-    printf("%s", AASP_NUM_THREADS_VALID_TOKEN);
+    fprintf(stderr, "%s", AASP_NUM_THREADS_VALID_TOKEN);
     
     pthread_mutex_unlock(&createMtx);
     return newThread;
@@ -85,13 +160,15 @@ void joinThread(pthread_t _thread) {
     setThreadEnd(_thread);
     pthread_mutex_unlock(&joinMtx);
 }
-"""
-        c_counter_functions = c_counter_functions.replace("TEST_CASE.MIN_THREADS", str(test_case.min_threads))
-        code = code.replace("int main() {", 'int main() { printf("AASP_0_THREADS_CREATED_INSUFFICIENT"); processStartTime = getCurrentTime();')
-        params['source_code'] = c_counter_init + c_time_functions + c_counter_functions + code
-    # C++
-    elif lang_id == 76:
-        cpp_counter_init = """
+""",
+    main_prologue='fprintf(stderr, "AASP_0_THREADS_CREATED_INSUFFICIENT"); processStartTime = getCurrentTime();',
+))
+
+# C++
+register_harness(ConcurrencyHarness(
+    lang_id=76,
+    compiler_options="-fsanitize=thread",
+    prelude="""
 #include <iostream>
 #include <thread>
 #include <mutex>
@@ -103,8 +180,7 @@ void joinThread(pthread_t _thread) {
 std::mutex createMtx;
 std::mutex joinMtx;
 int numThreadsCreated = 0;
-"""
-        cpp_time_functions = """
+
 std::chrono::microseconds::rep getCurrentTime() {
     return std::chrono::duration_cast<std::chrono::microseconds>(std::chrono::system_clock::now().time_since_epoch()).count();
 }
@@ -118,15 +194,14 @@ std::chrono::microseconds::rep getTimeElapsed() {
 void setThreadStart(std::thread& _thread) {
     std::thread::id threadId = _thread.get_id();
     std::chrono::microseconds::rep timeElapsed = getTimeElapsed();
-    std::cout << "AASP_STARTED_THREAD_" << threadId << "_" << timeElapsed << "_AASP";
+    std::cerr << "AASP_STARTED_THREAD_" << threadId << "_" << timeElapsed << "_AASP";
 }
 
 void setThreadEnd(std::thread::id threadId) {
     std::chrono::microseconds::rep timeElapsed = getTimeElapsed();
-    std::cout << "AASP_ENDED_THREAD_" << threadId << "_" << timeElapsed << "_AASP";
+    std::cerr << "AASP_ENDED_THREAD_" << threadId << "_" << timeElapsed << "_AASP";
 }
-"""
-        cpp_counter_functions = """
+
 template<typename Function, typename... Args>
 std::thread createThread(Function&& func, Args&&... args) {
     std::lock_guard<std::mutex> lock(createMtx);
@@ -139,7 +214,7 @@ std::thread createThread(Function&& func, Args&&... args) {
     } else if (numThreadsCreated < TEST_CASE.MIN_THREADS) {
         AASP_NUM_THREADS_VALID_TOKEN = "AASP_" + std::to_string(numThreadsCreated) + "_THREADS_CREATED_INSUFFICIENT";
     }
-    std::cout << AASP_NUM_THREADS_VALID_TOKEN;
+    std::cerr << AASP_NUM_THREADS_VALID_TOKEN;
     return newThread;
 }
 
@@ -149,37 +224,99 @@ void joinThread(std::thread& _thread) {
     _thread.join();
     setThreadEnd(threadId);
 }
-"""
-        cpp_counter_functions = cpp_counter_functions.replace("TEST_CASE.MIN_THREADS", str(test_case.min_threads))
-        
-        code = code.replace("int main() {", 'int main() { std::cout << "AASP_0_THREADS_CREATED_INSUFFICIENT";')
-        params['source_code'] = cpp_counter_init + cpp_time_functions + cpp_counter_functions + code
-    return params
+""",
+    main_prologue='std::cerr << "AASP_0_THREADS_CREATED_INSUFFICIENT";',
+))
+
+# markers printed by the harness: thread counter, thread start time and thread end time
+CONCURRENCY_MARKER_PATTERN = re.compile(
+    r'AASP_(\d+)_THREADS_CREATED_(SUFFICIENT|INSUFFICIENT)'
+    r'|AASP_(STARTED|ENDED)_THREAD_(\d+)_([0-9]+)_AASP'
+)
+
+
+def tokenize_concurrency_output(stdout):
+    """
+    Extracts the harness markers from the stdout of a concurrency question in a single scan.
+    Returns a dict with:
+    - stdout: the output of the user's code with all markers removed
+    - sufficient_threads: whether a "THREADS_CREATED_SUFFICIENT" marker was printed
+    - max_threads_used: the highest thread count printed
+    - thread_times: list of "start,end" times (microseconds since the process started) of each thread
+    """
+    output = []
+    position = 0
+    sufficient_threads = False
+    max_threads_used = 0
+    thread_starts = {}
+    thread_ends = []
+
+    for match in CONCURRENCY_MARKER_PATTERN.finditer(stdout):
+        output.append(stdout[position:match.start()])
+        position = match.end()
+
+        count, sufficiency, event, thread, time = match.groups()
+        if count is not None:
+            max_threads_used = max(max_threads_used, int(count))
+            sufficient_threads = sufficient_threads or sufficiency == "SUFFICIENT"
+        elif event == "STARTED":
+            thread_starts[thread] = [time]
+        else:
+            thread_ends.append((thread, time))
+    output.append(stdout[position:])
+
+    # a thread id can be reused after it was joined, end times are appended to the last start time of that id
+    for thread, time in thread_ends:
+        if thread in thread_starts:
+            thread_starts[thread].append(time)
+
+    return {
+        "stdout": "".join(output),
+        "sufficient_threads": sufficient_threads,
+        "max_threads_used": max_threads_used,
+        "thread_times": [",".join(times) for times in thread_starts.values()],
+    }
+
+def has_concurrency_markers(output):
+    return bool(output) and CONCURRENCY_MARKER_PATTERN.search(output) is not None
 
 def evaluate_concurrency_results(stdout, expected_output, status_id, stderr, max_threads):
-    sufficient_threads = re.search(r'AASP_\d+_THREADS_CREATED_SUFFICIENT', stdout) is not None
-    max_threads_used = get_max_threads_used(stdout)
+    """
+    Evaluates a concurrency question submission from the markers written by the harness to stderr.
+    Submissions made before the markers were moved to stderr have them in stdout, which is checked manually
+    against the expected output (judge0 could not compare it).
+    """
+    stdout = stdout or ""
+    tokens = tokenize_concurrency_output(stderr or "")
 
-    # remove thread counter tokens from output
-    stdout = re.sub(r'AASP_\d+_THREADS_CREATED_SUFFICIENT', '', stdout)
-    stdout = re.sub(r'AASP_\d+_THREADS_CREATED_INSUFFICIENT', '', stdout)
+    # output without thread counter and thread elapsed time tokens
+    stderr = tokens['stdout']
 
-    # remove thread elapsed time tokens from output
-    stdout, thread_times = process_concurrency_thread_times(stdout)
+    if has_concurrency_markers(stdout):
+        tokens = tokenize_concurrency_output(stdout)
+        stdout = tokens['stdout']
 
-    # manually evaluate correctness
-    valid = True
-    stdout_lines = stdout.strip().splitlines()
-    expected_output_lines = expected_output.strip().splitlines()
+        # manually evaluate correctness
+        valid = True
+        stdout_lines = stdout.strip().splitlines()
+        expected_output_lines = (expected_output or "").strip().splitlines()
 
-    if len(stdout_lines) == len(expected_output_lines):
-        for i in range(len(stdout_lines)):
-            if stdout_lines[i].strip() != expected_output_lines[i].strip():
-                valid = False
-                break
+        if len(stdout_lines) == len(expected_output_lines):
+            for i in range(len(stdout_lines)):
+                if stdout_lines[i].strip() != expected_output_lines[i].strip():
+                    valid = False
+                    break
+        accepted = valid and status_id == 4
+    else:
+        # stdout was compared against the expected output by judge0
+        accepted = status_id == 3
+
+    sufficient_threads = tokens['sufficient_threads']
+    max_threads_used = tokens['max_threads_used']
+    thread_times = tokens['thread_times']
 
     # check for sufficient thread usage        
-    if valid and status_id == 4:
+    if accepted:
         if sufficient_threads:
             status_id = 3
         else:
@@ -196,35 +333,15 @@ def evaluate_concurrency_results(stdout, expected_output, status_id, stderr, max
 
     return {
         "stdout": stdout,
+        "stderr": stderr,
         "status_id": status_id,
         "thread_times": thread_times,
+        "max_threads_used": max_threads_used,
     }
 
 def process_concurrency_thread_times(stdout):
-    thread_times = {}
-    started_tokens = re.findall(r'AASP_STARTED_THREAD_(\d+)_([0-9]+)_AASP', stdout)
-    for token in started_tokens:
-        thread_number = token[0]
-        start_time = token[1]
-        thread_times[thread_number] = [start_time]
-    stdout = re.sub(r'AASP_STARTED_THREAD_(\d+)_([0-9]+)_AASP', '', stdout)
-
-    ended_tokens = re.findall(r'AASP_ENDED_THREAD_(\d+)_([0-9]+)_AASP', stdout)
-    for token in ended_tokens:
-        thread_number = token[0]
-        end_time = token[1]
-        thread_times[thread_number].append(end_time)
-    stdout = re.sub(r'AASP_ENDED_THREAD_(\d+)_([0-9]+)_AASP', '', stdout)
-
-    thread_times = [",".join(times) for times in thread_times.values()]
-    return stdout, thread_times
+    tokens = tokenize_concurrency_output(stdout)
+    return tokens['stdout'], tokens['thread_times']
 
 def get_max_threads_used(stdout):
-    max_threads_used = 0
-    insufficient_tokens = re.findall(r'AASP_\d+_THREADS_CREATED_INSUFFICIENT', stdout)
-    for token in insufficient_tokens:
-        max_threads_used = max(max_threads_used, int(re.search(r'\d+', token).group(0)))
-    sufficient_tokens = re.findall(r'AASP_\d+_THREADS_CREATED_SUFFICIENT', stdout)
-    for token in sufficient_tokens:
-        max_threads_used = max(max_threads_used, int(re.search(r'\d+', token).group(0)))
-    return max_threads_used
\ No newline at end of file
+    return tokenize_concurrency_output(stdout)['max_threads_used']
@@ -0,0 +1,213 @@
+# push of CodeQuestionSubmission statuses to the candidate's page with server-sent events, served by aasp/asgi.py
+import asyncio
+import json
+from http.cookies import SimpleCookie
+from importlib import import_module
+from types import SimpleNamespace
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.db import close_old_connections, connection, transaction
+
+from core.admission import get_submission_queue_position
+from core.models import CodeQuestionSubmission, TestCaseAttempt
+
+# url of the event stream of a CodeQuestionSubmission, "/api/events/cq-submission/<cqs_id>/"
+EVENTS_PATH = "/api/events/cq-submission/"
+
+# postgres channel of the notifications, the payload is the id of a CodeQuestionSubmission
+EVENTS_CHANNEL = "aasp_cq_submission"
+
+
+def notifications_enabled():
+    """
+    Streams are notified with postgres LISTEN/NOTIFY, other databases are re-read every EVENTS_FALLBACK_INTERVAL seconds.
+    """
+    return connection.vendor == "postgresql"
+
+
+def publish_submission_events(cqs_ids):
+    """
+    Notifies the streams of the CodeQuestionSubmissions that their test cases changed, once the transaction is committed.
+    """
+    cqs_ids = [str(cqs_id) for cqs_id in set(cqs_ids)]
+    if not cqs_ids or not notifications_enabled():
+        return
+
+    def notify():
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, cqs_id) FROM unnest(%s::text[]) AS cqs_id", [EVENTS_CHANNEL, cqs_ids])
+
+    transaction.on_commit(notify)
+
+
+def get_submission_state(cqs_id):
+    """
+    Status of a CodeQuestionSubmission and its test cases, in the same format as get_cq_submission_status.
+    """
+    close_old_connections()
+    cqs = CodeQuestionSubmission.objects.get(id=cqs_id)
+    state = {
+        "result": "success",
+        "cqs_id": cqs.id,
+        "outcome": cqs.outcome,
+        "statuses": [list(x) for x in TestCaseAttempt.objects.filter(cq_submission=cqs).values_list('id', 'status', 'token')],
+        "finished": cqs.passed is not None,
+    }
+    position = get_submission_queue_position(cqs)
+    if position:
+        state["position"] = position
+    return state
+
+
+def poll_submission(cqs_id):
+    """
+    Fetches the pending test cases of a CodeQuestionSubmission from judge0 when their results are not pushed by judge0
+    callbacks, like get_cq_submission_status. Returns True if judge0 has to be polled.
+    """
+    # core.judge0 publishes the events of this module
+    from core.judge0 import polling_needed, refresh_test_case_attempts
+
+    close_old_connections()
+    cqs = CodeQuestionSubmission.objects.get(id=cqs_id)
+    if cqs.passed is not None or not polling_needed(cqs):
+        return False
+    try:
+        refresh_test_case_attempts(TestCaseAttempt.objects.filter(cq_submission=cqs))
+    except requests.exceptions.RequestException:
+        # judge0 is unreachable, polled again in the next iteration
+        pass
+    return True
+
+
+def is_stream_allowed(cookie_header, cqs_id):
+    """
+    Only the candidate of the submission may stream it (authenticated with the session cookie).
+    """
+    close_old_connections()
+    cookies = SimpleCookie(cookie_header)
+    if settings.SESSION_COOKIE_NAME not in cookies:
+        return False
+    session = import_module(settings.SESSION_ENGINE).SessionStore(cookies[settings.SESSION_COOKIE_NAME].value)
+    user = get_user(SimpleNamespace(session=session))
+    return user.is_authenticated and \
+        CodeQuestionSubmission.objects.filter(id=cqs_id, cq_attempt__assessment_attempt__candidate=user).exists()
+
+
+class NotificationListener:
+    """
+    One LISTEN connection per process, waking up the streams of the CodeQuestionSubmission of each notification.
+    """
+
+    def __init__(self):
+        self.connection = None
+        self.subscribers = {}
+
+    def start(self, loop):
+        if self.connection is not None or not notifications_enabled():
+            return
+        import psycopg2
+
+        self.connection = psycopg2.connect(**connection.get_connection_params())
+        self.connection.set_session(autocommit=True)
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {EVENTS_CHANNEL}")
+        loop.add_reader(self.connection.fileno(), self.read, loop)
+
+    def read(self, loop):
+        try:
+            self.connection.poll()
+        except Exception:
+            # connection lost, streams fall back to re-reading the database until it is restarted by the next stream
+            loop.remove_reader(self.connection.fileno())
+            self.connection = None
+            return
+        while self.connection.notifies:
+            notification = self.connection.notifies.pop(0)
+            for event in self.subscribers.get(notification.payload, ()):
+                event.set()
+
+    def subscribe(self, cqs_id):
+        event = asyncio.Event()
+        self.subscribers.setdefault(str(cqs_id), set()).add(event)
+        return event
+
+    def unsubscribe(self, cqs_id, event):
+        events = self.subscribers.get(str(cqs_id), set())
+        events.discard(event)
+        if not events:
+            self.subscribers.pop(str(cqs_id), None)
+
+
+listener = NotificationListener()
+
+
+async def send_response(send, status, body=b""):
+    await send({"type": "http.response.start", "status": status, "headers": [(b"content-type", b"text/plain")]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def submission_events(scope, receive, send):
+    """
+    ASGI application streaming the state of a CodeQuestionSubmission as server-sent events.
+    An event is sent when the state changes, and the stream ends once the submission is finished (or after
+    EVENTS_MAX_DURATION seconds, after which the page falls back to polling).
+    While the results are not pushed by judge0 callbacks, judge0 is polled every EVENTS_POLL_INTERVAL seconds.
+    """
+    cqs_id = scope["path"][len(EVENTS_PATH):].strip("/")
+    if not cqs_id.isdigit():
+        return await send_response(send, 404)
+    headers = dict(scope["headers"])
+    if not await sync_to_async(is_stream_allowed, thread_sensitive=False)(headers.get(b"cookie", b"").decode("latin-1"), int(cqs_id)):
+        return await send_response(send, 403)
+
+    await send({"type": "http.response.start", "status": 200, "headers": [
+        (b"content-type", b"text/event-stream"),
+        (b"cache-control", b"no-cache"),
+        (b"x-accel-buffering", b"no"),
+    ]})
+
+    loop = asyncio.get_running_loop()
+    try:
+        listener.start(loop)
+    except Exception:
+        pass
+    notified = listener.subscribe(cqs_id)
+    disconnected = asyncio.Event()
+
+    async def wait_for_disconnect():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+        disconnected.set()
+
+    watcher = asyncio.ensure_future(wait_for_disconnect())
+    interval = settings.EVENTS_REFRESH_INTERVAL if listener.connection else settings.EVENTS_FALLBACK_INTERVAL
+    deadline = loop.time() + settings.EVENTS_MAX_DURATION
+    try:
+        last_state = None
+        while not disconnected.is_set() and loop.time() < deadline:
+            notified.clear()
+            polled = await sync_to_async(poll_submission, thread_sensitive=False)(int(cqs_id))
+            state = await sync_to_async(get_submission_state, thread_sensitive=False)(int(cqs_id))
+            if state != last_state:
+                await send({"type": "http.response.body", "body": f"data: {json.dumps(state)}\n\n".encode(), "more_body": True})
+                last_state = state
+            if state["finished"]:
+                break
+
+            # wait for a notification, the client to go away, or the next refresh
+            waiters = [asyncio.ensure_future(notified.wait()), asyncio.ensure_future(disconnected.wait())]
+            timeout = settings.EVENTS_POLL_INTERVAL if polled else interval
+            done, pending = await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for waiter in pending:
+                waiter.cancel()
+            if not done and not polled:
+                # keeps proxies from closing an idle stream
+                await send({"type": "http.response.body", "body": b": keepalive\n\n", "more_body": True})
+    finally:
+        watcher.cancel()
+        listener.unsubscribe(cqs_id, notified)
+        if not disconnected.is_set():
+            await send({"type": "http.response.body", "body": b""})
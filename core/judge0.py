@@ -0,0 +1,667 @@
+# judge0 client and helpers shared by views and celery tasks
+import base64
+import hashlib
+import json
+import re
+import threading
+import time as timer
+from datetime import timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from urllib3.util.retry import Retry
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from core.admission import QUEUED_TOKEN_PREFIX
+from core.models import TestCaseAttempt, CodeQuestionSubmission
+from core.concurrency import evaluate_concurrency_results
+from core.events import publish_submission_events
+
+# status_ids of submissions that judge0 has not finished executing (In Queue, Processing)
+PENDING_STATUSES = [1, 2]
+
+# TestCaseAttempt fields written when a judge0 result is saved
+RESULT_FIELDS = ['status', 'stdout', 'time', 'memory', 'threads', 'thread_times']
+
+# results that depend on the load of judge0 rather than the code (Time Limit Exceeded, Internal Error) are never reused
+NON_REUSABLE_STATUSES = [5, 13]
+
+# status of test cases whose judge0 submission was lost (see refresh_test_case_attempts)
+INTERNAL_ERROR_STATUS = 13
+
+# prefix of placeholder tokens of TestCaseAttempts that are saved before their submissions are sent to judge0 (so that
+# judge0 callbacks find them), replaced by the judge0 tokens once sent
+SENDING_TOKEN_PREFIX = "sending-"
+
+
+class Judge0Client:
+    """
+    Judge0 API client with a pooled keep-alive session, connect/read timeouts and bounded retries.
+    Connection errors are retried for all requests, but a POST is never re-sent once it has reached judge0
+    (to avoid creating duplicate submissions).
+    Latency of every call is recorded per endpoint, see stats().
+    """
+
+    def __init__(self, base_url, pool_size=10, connect_timeout=3.05, read_timeout=30, max_retries=3, retry_backoff=0.3):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+
+        retry = Retry(total=max_retries, connect=max_retries, read=max_retries, status=max_retries,
+                      backoff_factor=retry_backoff, status_forcelist=[502, 503, 504],
+                      allowed_methods=["GET"], raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    def get(self, path):
+        return self.request("GET", path)
+
+    def post(self, path, json):
+        return self.request("POST", path, json=json)
+
+    def request(self, method, path, **kwargs):
+        """
+        Calls judge0 and returns the decoded json response.
+        """
+        endpoint = f"{method} {re.sub(r'/submissions/(?!batch)[^/?]+', '/submissions/{token}', path.split('?')[0])}"
+        start = timer.perf_counter()
+        try:
+            res = self.session.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+            data = res.json()
+        except Exception:
+            self._record(endpoint, timer.perf_counter() - start, error=True)
+            raise
+
+        self._record(endpoint, timer.perf_counter() - start)
+        return data
+
+    def _record(self, endpoint, elapsed, error=False):
+        with self._stats_lock:
+            stats = self._stats.setdefault(endpoint, {"count": 0, "errors": 0, "total_time": 0.0, "max_time": 0.0})
+            if error:
+                stats["errors"] += 1
+                return
+            stats["count"] += 1
+            stats["total_time"] += elapsed
+            stats["max_time"] = max(stats["max_time"], elapsed)
+
+    def stats(self):
+        """
+        Returns the number of calls, errors and the average/max latency (in seconds) of each endpoint.
+        """
+        with self._stats_lock:
+            return {
+                endpoint: dict(stats, avg_time=stats["total_time"] / stats["count"] if stats["count"] else 0)
+                for endpoint, stats in self._stats.items()
+            }
+
+
+# separator of the node name in tokens handed out to the browser, "<token>@<node>"
+NODE_TOKEN_SEPARATOR = "@"
+
+
+def is_connect_error(error):
+    """
+    True if a request to judge0 failed before it was sent (the node could not be connected to), so that it can safely be
+    sent to another node.
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if not isinstance(error, requests.exceptions.ConnectionError):
+        return False
+    # requests wraps the urllib3 error in a MaxRetryError
+    reason = error.args[0] if error.args else None
+    reason = getattr(reason, "reason", reason)
+    return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+
+class Judge0Node:
+    """
+    A judge0 server of the pool.
+    outstanding is the number of jobs queued or running on the node as of the last health probe, plus the submissions
+    being sent or sent to it by this process since.
+    """
+
+    def __init__(self, url, weight=1, lanes=None):
+        self.url = url
+        self.name = hashlib.sha1(url.encode("utf-8")).hexdigest()[:8]
+        self.weight = weight
+        self.lanes = lanes
+        self.client = Judge0Client(url, pool_size=settings.JUDGE0_POOL_SIZE,
+                                   connect_timeout=settings.JUDGE0_CONNECT_TIMEOUT, read_timeout=settings.JUDGE0_READ_TIMEOUT,
+                                   max_retries=settings.JUDGE0_MAX_RETRIES, retry_backoff=settings.JUDGE0_RETRY_BACKOFF)
+        self.healthy = True
+        self.failures = 0
+        self.outstanding = 0
+
+    @classmethod
+    def from_setting(cls, value):
+        """
+        Parses a node of JUDGE0_URLS, "<url>|<weight>|<lane>+<lane>".
+        """
+        url, weight, lanes = (value.split("|") + ["", ""])[:3]
+        return cls(url, weight=int(weight or 1), lanes=lanes.split("+") if lanes else None)
+
+    def serves(self, lane):
+        return not self.lanes or lane is None or lane in self.lanes
+
+    def load(self):
+        return (self.outstanding + 1) / self.weight
+
+
+class Judge0Pool:
+    """
+    Pool of judge0 nodes (JUDGE0_URLS).
+    New submissions are routed to the healthy node with the least outstanding jobs relative to its weight, among the nodes
+    serving the lane (priority class) of the submission. Status lookups go to the node that owns the token.
+    Nodes are probed every JUDGE0_HEALTH_INTERVAL seconds (GET /workers, which also reports their queue), and ejected
+    after JUDGE0_UNHEALTHY_THRESHOLD consecutive failures of probes or submissions until a probe succeeds again.
+    """
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self._nodes_by_name = {node.name: node for node in nodes}
+        self._lock = threading.Lock()
+        self._last_probe = None
+        self._probing = False
+
+    def is_multi_node(self):
+        return len(self.nodes) > 1
+
+    def get_node(self, name=None):
+        """
+        Returns the node with the given name, or the default (first) node for tokens without a node.
+        """
+        return self._nodes_by_name.get(name, self.nodes[0])
+
+    def choose(self, lane=None, exclude=()):
+        """
+        Returns the least loaded node for the lane, preferring healthy nodes.
+        """
+        self.probe_if_due()
+        with self._lock:
+            candidates = [node for node in self.nodes if node.serves(lane) and node.name not in exclude] or \
+                         [node for node in self.nodes if node.name not in exclude]
+            if not candidates:
+                return None
+            healthy = [node for node in candidates if node.healthy] or candidates
+            return min(healthy, key=lambda node: node.load())
+
+    def submit(self, path, json, lane=None, count=1):
+        """
+        POSTs count submissions to the node chosen for the lane. If the node cannot be connected to, the next one is tried.
+        Other errors are raised without failing over, the submissions may have been created on the node.
+        Returns (node, response data).
+        """
+        tried = set()
+        while True:
+            node = self.choose(lane, exclude=tried)
+            # counted while in flight, so that concurrent submissions are spread over the nodes
+            with self._lock:
+                node.outstanding += count
+            sent = False
+            try:
+                data = node.client.post(path, json)
+                sent = True
+            except requests.exceptions.RequestException as error:
+                if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+                    self.record_failure(node)
+                if not is_connect_error(error):
+                    raise
+                tried.add(node.name)
+                if len(tried) == len(self.nodes):
+                    raise
+                continue
+            finally:
+                if not sent:
+                    with self._lock:
+                        node.outstanding = max(0, node.outstanding - count)
+
+            with self._lock:
+                node.failures = 0
+            return node, data
+
+    def qualify_token(self, node, token):
+        """
+        Token handed out to the browser for a run, which is not stored in a TestCaseAttempt.
+        """
+        if not self.is_multi_node():
+            return token
+        return f"{token}{NODE_TOKEN_SEPARATOR}{node.name}"
+
+    def record_failure(self, node):
+        with self._lock:
+            node.failures += 1
+            if node.failures >= settings.JUDGE0_UNHEALTHY_THRESHOLD:
+                node.healthy = False
+
+    def probe_if_due(self):
+        """
+        Starts a health probe in the background if the last one is older than JUDGE0_HEALTH_INTERVAL.
+        A single node is never probed, there is nothing to route around.
+        """
+        if not self.is_multi_node():
+            return
+        now = timer.monotonic()
+        with self._lock:
+            if self._probing or (self._last_probe is not None and now - self._last_probe < settings.JUDGE0_HEALTH_INTERVAL):
+                return
+            self._probing = True
+            self._last_probe = now
+        threading.Thread(target=self.probe, daemon=True).start()
+
+    def probe(self):
+        try:
+            for node in self.nodes:
+                try:
+                    workers = node.client.get("/workers")
+                except Exception:
+                    self.record_failure(node)
+                    continue
+
+                with self._lock:
+                    node.healthy = True
+                    node.failures = 0
+                    # one entry per judge0 queue, with the number of jobs waiting and being executed
+                    if isinstance(workers, list):
+                        node.outstanding = sum(queue.get("size", 0) + queue.get("working", 0) for queue in workers)
+        finally:
+            self._probing = False
+
+    def stats(self):
+        """
+        Returns the state and call statistics (see Judge0Client.stats) of each node.
+        """
+        with self._lock:
+            return {
+                node.name: {"url": node.url, "weight": node.weight, "lanes": node.lanes, "healthy": node.healthy,
+                            "outstanding": node.outstanding, "calls": node.client.stats()}
+                for node in self.nodes
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Returns the Judge0Pool shared by this process, created from the JUDGE0_* settings on first use.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = Judge0Pool([Judge0Node.from_setting(value) for value in settings.JUDGE0_URLS])
+    return _pool
+
+
+def get_client(node_name=None):
+    """
+    Returns the Judge0Client of a node of the pool, the default node if no node is given.
+    """
+    return get_pool().get_node(node_name).client
+
+
+def get_token_client(token):
+    """
+    Returns (token, client of the node that owns it).
+    Tokens of runs carry their node ("<token>@<node>"), the node of TestCaseAttempt tokens is looked up.
+    """
+    token, _, node_name = token.partition(NODE_TOKEN_SEPARATOR)
+    if not node_name and get_pool().is_multi_node():
+        node_name = TestCaseAttempt.objects.filter(token=token).values_list('judge0_node', flat=True).first()
+    return token, get_client(node_name)
+
+
+def callbacks_enabled():
+    """
+    Judge0 callbacks are only used when AASP_CALLBACK_URL (the url of AASP as seen from judge0) is configured.
+    """
+    return bool(settings.AASP_CALLBACK_URL)
+
+
+def polling_needed(cq_submission):
+    """
+    True if the pending test cases of a CodeQuestionSubmission have to be fetched from judge0: callbacks are disabled, or
+    they did not all arrive within JUDGE0_CALLBACK_GRACE_PERIOD.
+    """
+    return not callbacks_enabled() or \
+        timezone.now() - cq_submission.time_submitted >= timedelta(seconds=settings.JUDGE0_CALLBACK_GRACE_PERIOD)
+
+
+def get_callback_key():
+    """
+    Shared secret appended to the callback url, derived from SECRET_KEY so that no additional configuration is needed.
+    """
+    return salted_hmac("core.judge0.callback", "judge0-callback").hexdigest()
+
+
+def verify_callback_key(key):
+    return key is not None and constant_time_compare(key, get_callback_key())
+
+
+def get_callback_url():
+    """
+    Returns the callback_url to be sent with each judge0 submission, or None if callbacks are disabled.
+    """
+    if not callbacks_enabled():
+        return None
+    return f"{settings.AASP_CALLBACK_URL.rstrip('/')}{reverse('judge0-callback')}?key={get_callback_key()}"
+
+
+def parse_callback_data(data):
+    """
+    Judge0 always sends callbacks base64 encoded, with the status as a nested object.
+    Returns the fields in the same (decoded) format as a GET /submissions/{token} call.
+    """
+    parsed = {
+        "token": data.get("token"),
+        "status_id": (data.get("status") or {}).get("id"),
+        "time": data.get("time"),
+        "memory": data.get("memory"),
+    }
+    for key in ["stdout", "stderr", "compile_output"]:
+        parsed[key] = decode_base64(data.get(key))
+    return parsed
+
+
+def decode_base64(value):
+    if not value:
+        return value
+    return base64.b64decode(value).decode("utf-8", errors="replace")
+
+
+def outputs_match(stdout, expected_output):
+    """
+    Compares an output against the expected output the same way judge0 does (ignoring trailing whitespace).
+    """
+    stdout_lines = [line.rstrip() for line in (stdout or "").strip().splitlines()]
+    expected_output_lines = [line.rstrip() for line in (expected_output or "").strip().splitlines()]
+    return stdout_lines == expected_output_lines
+
+
+def fetch_submissions(tokens, node_name=None):
+    """
+    Fetches the results of many judge0 submissions of a node with GET /submissions/batch, in chunks of JUDGE0_BATCH_SIZE
+    tokens.
+    Returns a dict of token -> {status_id, stdout, stderr, time, memory}, tokens that judge0 does not know are left out.
+    """
+    results = {}
+    client = get_client(node_name)
+    for i in range(0, len(tokens), settings.JUDGE0_BATCH_SIZE):
+        chunk = tokens[i:i + settings.JUDGE0_BATCH_SIZE]
+        response = client.get(f"/submissions/batch?tokens={','.join(chunk)}&base64_encoded=true&fields=token,status_id,stdout,stderr,time,memory")
+        for data in response.get("submissions", []):
+            # tokens that judge0 does not know of are returned as null
+            if not data:
+                continue
+            data["stdout"] = decode_base64(data.get("stdout"))
+            data["stderr"] = decode_base64(data.get("stderr"))
+            results[data.pop("token")] = data
+    return results
+
+
+def get_sending_token(cq_submission_id, index):
+    """
+    Placeholder token of a test case of a CodeQuestionSubmission until its submission is sent to judge0.
+    """
+    return f"{SENDING_TOKEN_PREFIX}{cq_submission_id}-{index}"
+
+
+def is_sending_token(token):
+    return bool(token) and token.startswith(SENDING_TOKEN_PREFIX)
+
+
+def refresh_test_case_attempts(test_case_attempts, max_misses=None):
+    """
+    Updates the pending TestCaseAttempts in the queryset (e.g. of one CodeQuestionSubmission or a whole assessment)
+    with batched judge0 calls (per node) and writes the finished ones back with a single bulk_update.
+    Test cases that are already in a terminal status, still queued (see core/admission.py) or being sent are not fetched.
+    The results are written with the row locks taken by judge0_callback, test cases that were updated in the meantime
+    are skipped.
+    With max_misses (see reconcile_test_case_attempts), tokens that judge0 returns as null and placeholders of test cases
+    that are still being sent count as missed polls, and the test cases are marked as Internal Error after max_misses
+    of them, instead of staying pending forever.
+    Nodes that cannot be reached are skipped, their test cases stay pending. Returns the list of TestCaseAttempts that
+    were updated.
+    """
+    pending = test_case_attempts.filter(status__in=PENDING_STATUSES).exclude(token__startswith=QUEUED_TOKEN_PREFIX)
+    if max_misses is None:
+        pending = pending.exclude(token__startswith=SENDING_TOKEN_PREFIX)
+    tcas = list(pending.values_list('id', 'token', 'judge0_node'))
+    if not tcas:
+        return []
+
+    tokens_by_node = {}
+    for _, token, node_name in tcas:
+        if not is_sending_token(token):
+            tokens_by_node.setdefault(node_name, []).append(token)
+
+    results = {}
+    errors = []
+    unreachable = set()
+    for node_name, tokens in tokens_by_node.items():
+        try:
+            results.update(fetch_submissions(tokens, node_name))
+        except requests.exceptions.RequestException as ex:
+            errors.append(ex)
+            unreachable.add(node_name)
+    if errors and len(errors) == len(tokens_by_node):
+        raise errors[0]
+
+    tokens = {tca_id: token for tca_id, token, _ in tcas}
+    finished = {tca_id: results[token] for tca_id, token, _ in tcas
+                if token in results and results[token]['status_id'] not in PENDING_STATUSES}
+
+    lost = []
+    if max_misses is not None:
+        missed = [tca_id for tca_id, token, node_name in tcas
+                  if is_sending_token(token) or (node_name not in unreachable and token not in results)]
+        if missed:
+            TestCaseAttempt.objects.filter(id__in=missed).update(missed_polls=F('missed_polls') + 1)
+            lost = list(TestCaseAttempt.objects.filter(id__in=missed, missed_polls__gte=max_misses)
+                        .values_list('id', flat=True))
+    if not finished and not lost:
+        return []
+
+    with transaction.atomic():
+        locked = TestCaseAttempt.objects.select_for_update(of=('self',)).select_related('test_case__code_question') \
+            .filter(id__in=list(finished) + lost, status__in=PENDING_STATUSES).order_by('id')
+        updated = []
+        for tca in locked:
+            if tca.token != tokens[tca.id]:
+                continue
+            if tca.id in finished:
+                if apply_test_case_result(tca, **finished[tca.id]):
+                    updated.append(tca)
+            else:
+                tca.status = INTERNAL_ERROR_STATUS
+                updated.append(tca)
+
+        if updated:
+            TestCaseAttempt.objects.bulk_update(updated, RESULT_FIELDS)
+            update_finished_submissions({tca.cq_submission_id for tca in updated})
+            publish_submission_events({tca.cq_submission_id for tca in updated})
+    return updated
+
+
+def reconcile_test_case_attempts():
+    """
+    Polls judge0 for the TestCaseAttempts that are still pending, so that results (and the "passed" flag of their
+    CodeQuestionSubmissions) do not depend on a browser polling get_cq_submission_status.
+    Up to RECONCILER_BATCH_SIZE test cases that are due are polled with batched calls. Tokens that are still pending are
+    polled again after an exponential backoff (RECONCILER_BACKOFF_BASE, doubled after every poll up to RECONCILER_BACKOFF_MAX).
+    Submissions younger than RECONCILER_MIN_AGE are left to judge0 callbacks and the browser. Test cases that were never
+    polled go first.
+    Tokens that judge0 does not know and test cases that were never sent (e.g. the web process died before sending them)
+    are marked as Internal Error after RECONCILER_MAX_MISSES polls, and submissions whose test cases are all completed
+    are finished if they were not (see finish_completed_submissions).
+    Returns the number of TestCaseAttempts that were updated.
+    """
+    now = timezone.now()
+    finish_completed_submissions(now - timedelta(seconds=settings.RECONCILER_MIN_AGE))
+    due = TestCaseAttempt.objects.filter(status__in=PENDING_STATUSES,
+                                         cq_submission__time_submitted__lte=now - timedelta(seconds=settings.RECONCILER_MIN_AGE)) \
+        .filter(Q(next_poll__isnull=True) | Q(next_poll__lte=now)).exclude(token__startswith=QUEUED_TOKEN_PREFIX)
+    tca_ids = list(due.order_by(F('next_poll').asc(nulls_first=True), 'id')
+                   .values_list('id', flat=True)[:settings.RECONCILER_BATCH_SIZE])
+    if not tca_ids:
+        return 0
+
+    try:
+        updated = refresh_test_case_attempts(TestCaseAttempt.objects.filter(id__in=tca_ids),
+                                             max_misses=settings.RECONCILER_MAX_MISSES)
+    except requests.exceptions.RequestException:
+        # judge0 is unreachable, back off all of them
+        updated = []
+
+    # back off the tokens that are still pending, one update per number of previous polls
+    still_pending = TestCaseAttempt.objects.filter(id__in=tca_ids, status__in=PENDING_STATUSES)
+    for poll_count in set(still_pending.values_list('poll_count', flat=True)):
+        backoff = min(settings.RECONCILER_BACKOFF_BASE * 2 ** poll_count, settings.RECONCILER_BACKOFF_MAX)
+        still_pending.filter(poll_count=poll_count) \
+            .update(poll_count=poll_count + 1, next_poll=now + timedelta(seconds=backoff))
+    return len(updated)
+
+
+def save_test_case_result(tca, status_id, stdout, stderr, time, memory):
+    """
+    Saves the result of a finished judge0 submission (one test case) to its TestCaseAttempt.
+    When all test cases of the CodeQuestionSubmission are complete, its "passed" flag is updated.
+    Returns False (and saves nothing) if the submission is still being processed by judge0.
+    """
+    if not apply_test_case_result(tca, status_id, stdout, stderr, time, memory):
+        return False
+
+    tca.save()
+    update_finished_submissions([tca.cq_submission_id])
+    publish_submission_events([tca.cq_submission_id])
+    return True
+
+
+def apply_test_case_result(tca, status_id, stdout, stderr, time, memory):
+    """
+    Sets the result of a finished judge0 submission on a TestCaseAttempt, without saving it.
+    Concurrency questions are post-processed with evaluate_concurrency_results.
+    Returns False if the submission is still being processed by judge0.
+    """
+    if status_id in PENDING_STATUSES:
+        return False
+
+    tca.status = status_id
+    tca.time = time
+    tca.memory = memory
+
+    # post processing for concurrency question
+    if tca.test_case.code_question.is_concurrency_question:
+        stdout = stdout or ""
+        concurrency_results = evaluate_concurrency_results(stdout, tca.test_case.stdout, status_id, stderr, tca.test_case.max_threads)
+        tca.status = concurrency_results['status_id']
+
+        # save number of threads used
+        tca.threads = concurrency_results['max_threads_used']
+        tca.thread_times = "|".join(concurrency_results['thread_times'])
+    tca.stdout = stdout
+    return True
+
+
+def result_reuse_enabled(code_question):
+    """
+    Results of identical submissions are reused if SUBMISSION_RESULT_REUSE is enabled.
+    Concurrency questions are nondeterministic, so they are only included if SUBMISSION_RESULT_REUSE_CONCURRENCY is enabled.
+    """
+    if not settings.SUBMISSION_RESULT_REUSE:
+        return False
+    return not code_question.is_concurrency_question or settings.SUBMISSION_RESULT_REUSE_CONCURRENCY
+
+
+def get_result_key(test_case, params):
+    """
+    Hash of a judge0 submission (the code, language, stdin, expected output and limits) and the test case it is for.
+    """
+    content = json.dumps({"test_case": test_case.id, "params": params}, sort_keys=True, default=str)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def find_reusable_results(result_keys):
+    """
+    Returns a dict of result_key -> a finished TestCaseAttempt with that key, for the keys that were judged before.
+    """
+    reusable = {}
+    tcas = TestCaseAttempt.objects.filter(result_key__in=result_keys) \
+        .exclude(status__in=PENDING_STATUSES + NON_REUSABLE_STATUSES).order_by('-id')
+    for tca in tcas:
+        reusable.setdefault(tca.result_key, tca)
+    return reusable
+
+
+def copy_test_case_result(source, tca):
+    """
+    Fills a TestCaseAttempt with the result (and token) of an identical one that was already judged, without saving it.
+    """
+    tca.token = source.token
+    tca.judge0_node = source.judge0_node
+    for field in RESULT_FIELDS:
+        setattr(tca, field, getattr(source, field))
+    return tca
+
+
+def update_finished_submissions(cqs_ids):
+    """
+    Updates the "passed" flag of the CodeQuestionSubmissions whose test cases have all been completed.
+    The submissions are locked before their test cases are checked: when the last test cases of a submission are saved
+    concurrently (e.g. by a callback and a poll), the transaction that gets the lock last sees the test cases committed
+    by the other one, so that one of them finishes the submission.
+    """
+    cqs_ids = sorted(set(cqs_ids))
+    if not cqs_ids:
+        return
+    with transaction.atomic():
+        list(CodeQuestionSubmission.objects.select_for_update().filter(id__in=cqs_ids).order_by('id')
+             .values_list('id', flat=True))
+        unfinished = set(TestCaseAttempt.objects.filter(cq_submission_id__in=cqs_ids, status__in=PENDING_STATUSES)
+                         .values_list('cq_submission_id', flat=True))
+        for cqs_id in cqs_ids:
+            if cqs_id not in unfinished:
+                update_cqs_passed_flag(cqs_id)
+
+
+def finish_completed_submissions(older_than):
+    """
+    Updates the "passed" flag of up to RECONCILER_BATCH_SIZE CodeQuestionSubmissions made before older_than that have no
+    pending test cases left but were not finished (e.g. by a transaction that failed after saving their last result).
+    Returns the number of submissions that were finished.
+    """
+    pending = TestCaseAttempt.objects.filter(cq_submission=OuterRef('pk'), status__in=PENDING_STATUSES)
+    cqs_ids = list(CodeQuestionSubmission.objects.filter(passed__isnull=True, time_submitted__lte=older_than)
+                   .exclude(Exists(pending)).order_by('id').values_list('id', flat=True)[:settings.RECONCILER_BATCH_SIZE])
+    update_finished_submissions(cqs_ids)
+    return len(cqs_ids)
+
+
+def update_cqs_passed_flag(cqs_id):
+    """
+    Update the "passed", "score" and "passed_count" fields of the CQS instance once all of its test cases have been
+    processed by judge0, then the score of its AssessmentAttempt if it was submitted and this was its last submission.
+    If it was already calculated previously, nothing will be done.
+    """
+    cqs = CodeQuestionSubmission.objects.select_related('cq_attempt__assessment_attempt').get(id=cqs_id)
+
+    # only continue if it was not previously calculated
+    if cqs.passed is None:
+        cqs.compute_results()
+        cqs.save(update_fields=['passed', 'score', 'passed_count'])
+
+        # the score of a submitted attempt is computed when its last submission is finished
+        cqs.cq_attempt.assessment_attempt.compute_score_if_complete()
@@ -0,0 +1,45 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from core.models import CodeQuestionSubmission, TestCaseAttempt
+
+
+class Command(BaseCommand):
+    help = "Populates the persisted score and passed_count of finished CodeQuestionSubmissions"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="submissions updated per query")
+        parser.add_argument("--all", action="store_true", help="recompute submissions that already have a score")
+
+    def handle(self, *args, **options):
+        # submissions still processing get their score once their last test case is processed
+        submissions = CodeQuestionSubmission.objects.filter(passed__isnull=False)
+        if not options["all"]:
+            submissions = submissions.filter(score__isnull=True)
+
+        updated = 0
+        last_id = 0
+        while True:
+            batch = list(submissions.filter(id__gt=last_id).order_by('id')[:options["batch_size"]])
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            # scores of the whole batch in one grouped query, submissions without test cases do not appear in it
+            results = TestCaseAttempt.objects.filter(cq_submission__in=batch).values('cq_submission_id').annotate(
+                passed_count=Count('id', filter=Q(status=3)),
+                score=Sum('test_case__score', filter=Q(status=3)),
+            )
+            results = {x['cq_submission_id']: x for x in results}
+            for cqs in batch:
+                result = results.get(cqs.id, {})
+                cqs.passed_count = result.get('passed_count', 0)
+                cqs.score = result.get('score') or 0
+
+            with transaction.atomic():
+                CodeQuestionSubmission.objects.bulk_update(batch, ['score', 'passed_count'])
+            updated += len(batch)
+            self.stdout.write(f"{updated} submissions updated")
+
+        self.stdout.write(f"Done, {updated} submissions updated")
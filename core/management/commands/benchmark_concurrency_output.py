@@ -0,0 +1,82 @@
+import random
+import re
+import timeit
+
+from django.core.management import BaseCommand
+
+from core.concurrency import tokenize_concurrency_output
+
+
+def legacy_tokenize_concurrency_output(stdout):
+    """
+    Previous marker extraction of evaluate_concurrency_results, get_max_threads_used and process_concurrency_thread_times
+    (one regex pass per marker type), used as the baseline.
+    """
+    sufficient_threads = re.search(r'AASP_\d+_THREADS_CREATED_SUFFICIENT', stdout) is not None
+    max_threads_used = 0
+    for token in re.findall(r'AASP_\d+_THREADS_CREATED_INSUFFICIENT', stdout):
+        max_threads_used = max(max_threads_used, int(re.search(r'\d+', token).group(0)))
+    for token in re.findall(r'AASP_\d+_THREADS_CREATED_SUFFICIENT', stdout):
+        max_threads_used = max(max_threads_used, int(re.search(r'\d+', token).group(0)))
+
+    stdout = re.sub(r'AASP_\d+_THREADS_CREATED_SUFFICIENT', '', stdout)
+    stdout = re.sub(r'AASP_\d+_THREADS_CREATED_INSUFFICIENT', '', stdout)
+
+    thread_times = {}
+    for thread_number, start_time in re.findall(r'AASP_STARTED_THREAD_(\d+)_([0-9]+)_AASP', stdout):
+        thread_times[thread_number] = [start_time]
+    stdout = re.sub(r'AASP_STARTED_THREAD_(\d+)_([0-9]+)_AASP', '', stdout)
+    for thread_number, end_time in re.findall(r'AASP_ENDED_THREAD_(\d+)_([0-9]+)_AASP', stdout):
+        thread_times[thread_number].append(end_time)
+    stdout = re.sub(r'AASP_ENDED_THREAD_(\d+)_([0-9]+)_AASP', '', stdout)
+    thread_times = [",".join(times) for times in thread_times.values()]
+
+    return {
+        "stdout": stdout,
+        "sufficient_threads": sufficient_threads,
+        "max_threads_used": max_threads_used,
+        "thread_times": thread_times,
+    }
+
+
+def generate_output(size, threads, min_threads):
+    """
+    Generates instrumented stdout of about size bytes, with the markers of the given number of threads spread across it.
+    """
+    rng = random.Random(0)
+    line = "the quick brown fox jumps over the lazy dog 0123456789\n"
+    lines = ["AASP_0_THREADS_CREATED_INSUFFICIENT"]
+    ids = [str(rng.randrange(10 ** 14, 10 ** 15)) for _ in range(threads)]
+    lines_per_thread = max(1, size // len(line) // max(threads, 1))
+
+    for i, thread_id in enumerate(ids):
+        sufficiency = "SUFFICIENT" if i + 1 >= min_threads else "INSUFFICIENT"
+        lines.append(f"AASP_STARTED_THREAD_{thread_id}_{i * 10}_AASPAASP_{i + 1}_THREADS_CREATED_{sufficiency}")
+        lines.extend([line] * lines_per_thread)
+    for i, thread_id in enumerate(ids):
+        lines.append(f"AASP_ENDED_THREAD_{thread_id}_{i * 10 + 500}_AASP")
+    return "".join(lines)
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark of the concurrency output tokenizer against the previous multi-pass implementation"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=float, nargs='+', default=[1, 4, 16], help="stdout sizes in MB")
+        parser.add_argument('--threads', type=int, default=64, help="number of threads in the output")
+        parser.add_argument('--repeat', type=int, default=5, help="number of runs per size (the best is reported)")
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        for size in options['size']:
+            stdout = generate_output(int(size * 1024 * 1024), threads, min_threads=threads // 2)
+
+            # both implementations must produce the same result
+            if tokenize_concurrency_output(stdout) != legacy_tokenize_concurrency_output(stdout):
+                self.stderr.write(self.style.ERROR(f"Results differ for {size} MB"))
+                return
+
+            single_pass = min(timeit.repeat(lambda: tokenize_concurrency_output(stdout), number=1, repeat=options['repeat']))
+            multi_pass = min(timeit.repeat(lambda: legacy_tokenize_concurrency_output(stdout), number=1, repeat=options['repeat']))
+            self.stdout.write(f"{size:>6} MB, {threads} threads: multi-pass {multi_pass * 1000:8.1f} ms, "
+                              f"single-pass {single_pass * 1000:8.1f} ms, speedup {multi_pass / single_pass:.2f}x")
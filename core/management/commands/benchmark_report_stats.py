@@ -0,0 +1,93 @@
+import math
+import random
+import timeit
+
+from django.core.management import BaseCommand
+
+from core.stats import describe, to_array
+from core.views.charts import assign_buckets, create_buckets
+
+
+def legacy_assign_buckets(buckets, data):
+    """
+    Previous binning of the report charts (a scan of the buckets for each value), used as the baseline.
+    """
+    for value in data:
+        for bucket in buckets:
+            if value >= bucket["min"] and value < bucket["max"]:
+                bucket["count"] += 1
+                break
+        if value == buckets[-1]["max"]:
+            buckets[-1]["count"] += 1
+
+
+def legacy_calculate_median(values, key=lambda x: x):
+    if values is None or len(values) == 0:
+        return 0
+
+    values = sorted([key(value) for value in values])
+    if len(values) % 2 == 1:
+        median = values[len(values) // 2]
+    else:
+        median = (values[len(values) // 2] + values[len(values) // 2 - 1]) / 2
+
+    return round(median, 2)
+
+
+def legacy_calculate_mean(values, key=lambda x: x):
+    if values is None or len(values) == 0:
+        return 0
+    total = sum([key(value) for value in values])
+    mean = total / len(values)
+    return round(mean, 2)
+
+
+def legacy_report(scores, max_score, time_spent):
+    """
+    Score and time spent histograms and mean and median score of a report, as rendered before core/stats.py.
+    """
+    score_buckets = create_buckets(0, max_score)
+    legacy_assign_buckets(score_buckets, scores)
+    minutes = [delta / 60 for delta in time_spent]
+    time_buckets = create_buckets(0, math.ceil(max(minutes)))
+    legacy_assign_buckets(time_buckets, minutes)
+    return [bucket["count"] for bucket in score_buckets], [bucket["count"] for bucket in time_buckets], \
+        legacy_calculate_mean(scores), legacy_calculate_median(scores)
+
+
+def report(scores, max_score, time_spent):
+    score_buckets = create_buckets(0, max_score)
+    assign_buckets(score_buckets, scores)
+    minutes = to_array(time_spent) / 60
+    time_buckets = create_buckets(0, math.ceil(minutes.max()))
+    assign_buckets(time_buckets, minutes)
+    score_stats = describe(scores)
+    return [bucket["count"] for bucket in score_buckets], [bucket["count"] for bucket in time_buckets], \
+        score_stats["mean"], score_stats["median"]
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark of the report histograms and score statistics against the previous pure Python implementation"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, nargs='+', default=[10000, 100000], help="numbers of attempts")
+        parser.add_argument('--max-score', type=int, default=100, help="maximum score of the assessment")
+        parser.add_argument('--repeat', type=int, default=5, help="number of runs per size (the best is reported)")
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        max_score = options['max_score']
+        for size in options['size']:
+            # integer scores and time spent in seconds, as read from values_list
+            scores = [rng.randint(0, max_score) for _ in range(size)]
+            time_spent = [rng.uniform(1, 2 * 60 * 60) for _ in range(size)]
+
+            # both implementations must produce the same result
+            if report(scores, max_score, time_spent) != legacy_report(scores, max_score, time_spent):
+                self.stderr.write(self.style.ERROR(f"Results differ for {size} attempts"))
+                return
+
+            vectorized = min(timeit.repeat(lambda: report(scores, max_score, time_spent), number=1, repeat=options['repeat']))
+            legacy = min(timeit.repeat(lambda: legacy_report(scores, max_score, time_spent), number=1, repeat=options['repeat']))
+            self.stdout.write(f"{size:>8} attempts: python {legacy * 1000:8.1f} ms, numpy {vectorized * 1000:8.1f} ms, "
+                              f"speedup {legacy / vectorized:.2f}x")
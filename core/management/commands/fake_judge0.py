@@ -0,0 +1,359 @@
+import base64
+import json
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import requests
+from django.core.management import BaseCommand, CommandError
+
+STATUS_DESCRIPTIONS = {
+    1: "In Queue",
+    2: "Processing",
+    3: "Accepted",
+    4: "Wrong Answer",
+    5: "Time Limit Exceeded",
+    6: "Compilation Error",
+    11: "Runtime Error (NZEC)",
+    13: "Internal Error",
+}
+
+# fields returned by GET /submissions/{token} when no fields are requested (same as judge0)
+DEFAULT_FIELDS = ["token", "stdout", "time", "memory", "stderr", "compile_output", "message", "status"]
+
+# fields that are base64 encoded when base64_encoded=true
+ENCODED_FIELDS = ["source_code", "stdin", "expected_output", "stdout", "stderr", "compile_output"]
+
+# minimum number of threads of a test case, as instrumented by core/concurrency.py
+MIN_THREADS_PATTERN = re.compile(r'numThreadsCreated\s*>=\s*(\d+)')
+
+
+def parse_latency(value):
+    """
+    Parses a latency distribution (seconds), "fixed:<s>", "uniform:<min>,<max>", "exp:<mean>" or "lognormal:<mu>,<sigma>".
+    Returns a function that samples it with a random.Random.
+    """
+    kind, _, args = value.partition(":")
+    try:
+        args = [float(x) for x in args.split(",")]
+        distributions = {
+            "fixed": lambda rng: args[0],
+            "uniform": lambda rng: rng.uniform(args[0], args[1]),
+            "exp": lambda rng: rng.expovariate(1 / args[0]),
+            "lognormal": lambda rng: rng.lognormvariate(args[0], args[1]),
+        }
+        sample = distributions[kind]
+        sample(random.Random(0))
+    except (KeyError, IndexError, ValueError, ZeroDivisionError):
+        raise CommandError(f"Invalid latency distribution: {value}")
+    return sample
+
+
+def parse_outcomes(value):
+    """
+    Parses the distribution of status_ids, e.g. "3:0.9,4:0.1". Returns (status_ids, weights).
+    """
+    try:
+        outcomes = [(int(status_id), float(weight)) for status_id, weight in (x.split(":") for x in value.split(","))]
+    except ValueError:
+        raise CommandError(f"Invalid outcomes: {value}")
+    for status_id, _ in outcomes:
+        if status_id not in STATUS_DESCRIPTIONS or status_id < 3:
+            raise CommandError(f"Unsupported status_id: {status_id}")
+    return [status_id for status_id, _ in outcomes], [weight for _, weight in outcomes]
+
+
+def encode(value):
+    if value is None:
+        return None
+    return base64.b64encode(value.encode("utf-8")).decode("ascii")
+
+
+def decode(value):
+    if not value:
+        return value
+    return base64.b64decode(value).decode("utf-8", errors="replace")
+
+
+def concurrency_output(min_threads, threads, rng):
+    """
+    Telemetry of the concurrency harness (written to stderr), for the given number of threads.
+    """
+    markers = ["AASP_0_THREADS_CREATED_INSUFFICIENT"]
+    ids = [rng.randrange(10 ** 14, 10 ** 15) for _ in range(threads)]
+    for i, thread_id in enumerate(ids):
+        sufficiency = "SUFFICIENT" if i + 1 >= min_threads else "INSUFFICIENT"
+        markers.append(f"AASP_STARTED_THREAD_{thread_id}_{i * 10}_AASPAASP_{i + 1}_THREADS_CREATED_{sufficiency}")
+    for i, thread_id in enumerate(ids):
+        markers.append(f"AASP_ENDED_THREAD_{thread_id}_{i * 10 + 500}_AASP")
+    return "".join(markers)
+
+
+class FakeJudge0:
+    """
+    In-memory judge0: submissions are queued and executed by a fixed number of workers, each taking a sampled latency
+    and finishing with a sampled status.
+    """
+
+    def __init__(self, workers, queue_size, latency, outcomes, insufficient_threads, max_submissions, seed):
+        self.latency = latency
+        self.status_ids, self.weights = outcomes
+        self.insufficient_threads = insufficient_threads
+        self.max_submissions = max_submissions
+        self.queue_size = queue_size
+        self.rng = random.Random(seed)
+        self.submissions = OrderedDict()
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.working = 0
+        self.workers = workers
+
+        for _ in range(workers):
+            threading.Thread(target=self.work, daemon=True).start()
+
+    def create(self, params):
+        """
+        Queues a submission. Returns its token, or None if the queue is full.
+        """
+        if self.queue.qsize() >= self.queue_size:
+            return None
+
+        token = str(uuid.uuid4())
+        submission = dict(params, token=token, status_id=1, stdout=None, stderr=None, compile_output=None, message=None,
+                          time=None, memory=None, finished=threading.Event())
+        with self.lock:
+            self.submissions[token] = submission
+            # forget the oldest submissions
+            while len(self.submissions) > self.max_submissions:
+                self.submissions.popitem(last=False)
+        self.queue.put(token)
+        return token
+
+    def get(self, token):
+        with self.lock:
+            return self.submissions.get(token)
+
+    def work(self):
+        while True:
+            token = self.queue.get()
+            submission = self.get(token)
+            if not submission:
+                continue
+
+            with self.lock:
+                self.working += 1
+                latency = self.latency(self.rng)
+                status_id = self.rng.choices(self.status_ids, self.weights)[0]
+            submission["status_id"] = 2
+            time.sleep(max(latency, 0))
+
+            self.finish(submission, status_id, latency)
+            with self.lock:
+                self.working -= 1
+
+    def finish(self, submission, status_id, latency):
+        """
+        Sets the outputs of a submission for its status and sends the callback.
+        """
+        expected_output = submission.get("expected_output")
+        source_code = submission.get("source_code") or ""
+
+        submission["time"] = f"{min(latency, float(submission.get('cpu_time_limit') or 5)):.3f}"
+        submission["memory"] = self.rng.randint(1000, 20000)
+        if status_id == 3:
+            # echo the input if there is no expected output (e.g. custom inputs)
+            submission["stdout"] = expected_output if expected_output is not None else submission.get("stdin") or ""
+        elif status_id == 4:
+            submission["stdout"] = "fake judge0 wrong answer\n"
+        elif status_id == 5:
+            submission["time"] = f"{float(submission.get('cpu_time_limit') or 5):.3f}"
+        elif status_id == 6:
+            submission["compile_output"] = "fake judge0 compilation error\n"
+        elif status_id == 11:
+            submission["stderr"] = "fake judge0 runtime error\n"
+        else:
+            submission["message"] = "fake judge0 internal error"
+
+        # code instrumented by the concurrency harness reports its threads on stderr
+        match = MIN_THREADS_PATTERN.search(source_code)
+        if match and status_id in [3, 4]:
+            min_threads = int(match.group(1))
+            with self.lock:
+                threads = min_threads - 1 if self.rng.random() < self.insufficient_threads else min_threads
+            submission["stderr"] = concurrency_output(min_threads, max(threads, 0), self.rng)
+
+        submission["status_id"] = status_id
+        submission["finished"].set()
+
+        if submission.get("callback_url"):
+            self.send_callback(submission)
+
+    def send_callback(self, submission):
+        """
+        PUTs the result to the callback_url, base64 encoded and with a nested status (same as judge0).
+        """
+        data = {
+            "token": submission["token"],
+            "time": submission["time"],
+            "memory": submission["memory"],
+            "status": {"id": submission["status_id"], "description": STATUS_DESCRIPTIONS[submission["status_id"]]},
+        }
+        for key in ["stdout", "stderr", "compile_output"]:
+            data[key] = encode(submission[key])
+        try:
+            requests.put(submission["callback_url"], json=data, timeout=10)
+        except requests.exceptions.RequestException:
+            pass
+
+    def render(self, submission, fields, base64_encoded):
+        """
+        Returns the requested fields of a submission.
+        """
+        if fields == ["*"]:
+            fields = [key for key in submission if key != "finished"] + ["status"]
+        data = {}
+        for field in fields:
+            if field == "status":
+                data["status"] = {"id": submission["status_id"], "description": STATUS_DESCRIPTIONS[submission["status_id"]]}
+            elif field in submission and field != "finished":
+                value = submission[field]
+                data[field] = encode(value) if base64_encoded and field in ENCODED_FIELDS else value
+        return data
+
+    def workers_status(self):
+        with self.lock:
+            working = self.working
+        size = self.queue.qsize()
+        return [{
+            "queue": "judge0", "size": size, "available": self.workers, "idle": self.workers - working,
+            "working": working, "paused": 0, "failed": 0,
+        }]
+
+
+class Handler(BaseHTTPRequestHandler):
+    judge0 = None
+    verbose = False
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+    def respond(self, data, status=200):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def parse(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        return url.path.rstrip("/"), query, query.get("base64_encoded") == "true"
+
+    def read_params(self, params, base64_encoded):
+        params = dict(params)
+        if base64_encoded:
+            for field in ENCODED_FIELDS:
+                if params.get(field):
+                    params[field] = decode(params[field])
+        return params
+
+    def do_POST(self):
+        path, query, base64_encoded = self.parse()
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            return self.respond({"error": "invalid json"}, 400)
+
+        if path == "/submissions/batch":
+            tokens = [self.judge0.create(self.read_params(params, base64_encoded)) for params in body.get("submissions", [])]
+            if any(token is None for token in tokens):
+                return self.respond({"error": "queue is full"}, 503)
+            return self.respond([{"token": token} for token in tokens], 201)
+
+        if path == "/submissions":
+            token = self.judge0.create(self.read_params(body, base64_encoded))
+            if token is None:
+                return self.respond({"error": "queue is full"}, 503)
+            if query.get("wait") == "true":
+                submission = self.judge0.get(token)
+                submission["finished"].wait()
+                return self.respond(self.judge0.render(submission, DEFAULT_FIELDS, base64_encoded), 201)
+            return self.respond({"token": token}, 201)
+
+        return self.respond({"error": "not found"}, 404)
+
+    def do_GET(self):
+        path, query, base64_encoded = self.parse()
+        fields = query["fields"].split(",") if query.get("fields") else DEFAULT_FIELDS
+
+        if path == "/workers":
+            return self.respond(self.judge0.workers_status())
+
+        if path == "/submissions/batch":
+            submissions = []
+            for token in query.get("tokens", "").split(","):
+                submission = self.judge0.get(token)
+                submissions.append(self.judge0.render(submission, fields, base64_encoded) if submission else None)
+            return self.respond({"submissions": submissions})
+
+        if path.startswith("/submissions/"):
+            submission = self.judge0.get(path[len("/submissions/"):])
+            if not submission:
+                return self.respond({"error": "Not found"}, 404)
+            return self.respond(self.judge0.render(submission, fields, base64_encoded))
+
+        return self.respond({"error": "not found"}, 404)
+
+
+class Command(BaseCommand):
+    help = "Runs a fake judge0 server (no code is executed) for load and latency tests of the submission, polling and " \
+           "scoring pipeline, e.g. JUDGE0_URL=http://127.0.0.1:2358"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default="127.0.0.1")
+        parser.add_argument('--port', type=int, default=2358)
+        parser.add_argument('--workers', type=int, default=8, help="number of submissions executed at the same time")
+        parser.add_argument('--queue-size', type=int, default=10000, help="max queued submissions (503 when full)")
+        parser.add_argument('--latency', default="lognormal:-1.5,0.5",
+                            help="execution time distribution (seconds): fixed:<s>, uniform:<min>,<max>, exp:<mean> or "
+                                 "lognormal:<mu>,<sigma>")
+        parser.add_argument('--outcomes', default="3:0.9,4:0.07,5:0.01,6:0.01,11:0.01",
+                            help="distribution of status_ids, <status_id>:<weight>,...")
+        parser.add_argument('--insufficient-threads', type=float, default=0.0,
+                            help="fraction of concurrency submissions that create too few threads")
+        parser.add_argument('--max-submissions', type=int, default=100000,
+                            help="submissions kept in memory, the oldest are forgotten")
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--verbose', action='store_true', help="log every request")
+
+    def handle(self, *args, **options):
+        Handler.judge0 = FakeJudge0(
+            workers=options['workers'],
+            queue_size=options['queue_size'],
+            latency=parse_latency(options['latency']),
+            outcomes=parse_outcomes(options['outcomes']),
+            insufficient_threads=options['insufficient_threads'],
+            max_submissions=options['max_submissions'],
+            seed=options['seed'],
+        )
+        Handler.verbose = options['verbose']
+
+        server = ThreadingHTTPServer((options['host'], options['port']), Handler)
+        server.daemon_threads = True
+        self.stdout.write(f"Fake judge0 listening on http://{options['host']}:{options['port']} "
+                          f"({options['workers']} workers, latency {options['latency']}, outcomes {options['outcomes']})")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
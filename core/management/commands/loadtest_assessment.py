@@ -0,0 +1,335 @@
+import csv
+import json
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from django.contrib.auth.models import Group
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import User, Assessment, CourseGroup, AssessmentAttempt, CodeQuestionAttempt, McqQuestionAttempt, \
+    McqQuestionOption, TestCase, CodeSnippet
+from core.judge0 import PENDING_STATUSES
+
+# prefix of the usernames of seeded students, so that they can be cleaned up
+USERNAME_PREFIX = "LOADTEST"
+
+# failed requests kept in the report per endpoint, and characters kept of bodies that are not json
+ERROR_SAMPLES = 10
+ERROR_BODY_LENGTH = 500
+
+
+def percentile(values, p):
+    """
+    Nearest-rank percentile of a sorted list.
+    """
+    if not values:
+        return None
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def get_error_detail(response):
+    """
+    Status and body of a failed request for the report, the body is its json or the start of its text (e.g. an html
+    error page).
+    """
+    try:
+        body = response.json()
+    except ValueError:
+        body = response.content[:ERROR_BODY_LENGTH].decode("utf-8", errors="replace")
+    return {"status": response.status_code, "body": body}
+
+
+class Recorder:
+    """
+    Collects the latency, status and number of DB queries of every request, per endpoint, and the details of the first
+    ERROR_SAMPLES failed requests of each endpoint.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.error_samples = {}
+        self.flows = []
+
+    def record(self, endpoint, elapsed, error, queries, detail=None):
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append((elapsed, error, queries))
+            error_samples = self.error_samples.setdefault(endpoint, [])
+            if error and len(error_samples) < ERROR_SAMPLES:
+                error_samples.append(detail)
+
+    def record_flow(self, elapsed, error):
+        with self.lock:
+            self.flows.append((elapsed, error))
+
+    def report(self, duration):
+        endpoints = {}
+        for endpoint, samples in sorted(self.samples.items()):
+            latencies = sorted(elapsed for elapsed, _, _ in samples)
+            queries = [count for _, _, count in samples]
+            errors = sum(1 for _, error, _ in samples if error)
+            endpoints[endpoint] = {
+                "count": len(samples),
+                "errors": errors,
+                "error_rate": errors / len(samples),
+                "throughput": len(samples) / duration,
+                "latency_mean": sum(latencies) / len(latencies),
+                "latency_p50": percentile(latencies, 50),
+                "latency_p95": percentile(latencies, 95),
+                "latency_p99": percentile(latencies, 99),
+                "latency_max": latencies[-1],
+                "queries_mean": sum(queries) / len(queries),
+                "queries_max": max(queries),
+                "error_samples": self.error_samples.get(endpoint, []),
+            }
+
+        requests = sum(endpoint["count"] for endpoint in endpoints.values())
+        errors = sum(endpoint["errors"] for endpoint in endpoints.values())
+        flow_latencies = sorted(elapsed for elapsed, _ in self.flows)
+        return {
+            "duration": duration,
+            "requests": requests,
+            "errors": errors,
+            "error_rate": errors / requests if requests else 0,
+            "throughput": requests / duration,
+            "flows": {
+                "count": len(self.flows),
+                "failed": sum(1 for _, error in self.flows if error),
+                "latency_p50": percentile(flow_latencies, 50),
+                "latency_p95": percentile(flow_latencies, 95),
+                "latency_p99": percentile(flow_latencies, 99),
+            },
+            "endpoints": endpoints,
+        }
+
+
+class Candidate:
+    """
+    Simulates the browser of one student taking the assessment.
+    """
+
+    def __init__(self, user, assessment, recorder, options):
+        self.user = user
+        self.assessment = assessment
+        self.recorder = recorder
+        self.options = options
+        self.client = Client(HTTP_HOST=options['host'], raise_request_exception=False)
+        self.client.force_login(user)
+        self.rng = random.Random(user.id)
+
+    def request(self, endpoint, method, url, data=None):
+        """
+        Calls a view and records its latency and query count. Returns the response.
+        """
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            try:
+                response = getattr(self.client, method)(url, data or {})
+            except Exception as e:
+                self.recorder.record(endpoint, time.perf_counter() - start, True, len(queries),
+                                     {"exception": f"{type(e).__name__}: {e}"})
+                raise
+        elapsed = time.perf_counter() - start
+        error = response.status_code >= 400
+        if not error and response.get("Content-Type", "").startswith("application/json"):
+            try:
+                error = response.json().get("result") == "error"
+            except ValueError:
+                error = True
+        self.recorder.record(endpoint, elapsed, error, len(queries), get_error_detail(response) if error else None)
+        return response
+
+    def think(self):
+        time.sleep(self.rng.uniform(0, self.options['think_time']))
+
+    def run(self):
+        start = time.perf_counter()
+        try:
+            self.take_assessment()
+            self.recorder.record_flow(time.perf_counter() - start, False)
+        except Exception:
+            self.recorder.record_flow(time.perf_counter() - start, True)
+        finally:
+            connection.close()
+
+    def take_assessment(self):
+        self.request("enter_assessment", "post", reverse('enter-assessment', args=[self.assessment.id]),
+                     {"pin": self.assessment.pin or ""})
+        assessment_attempt = AssessmentAttempt.objects.filter(assessment=self.assessment, candidate=self.user,
+                                                              time_submitted=None).latest('id')
+
+        mcq_attempts = list(McqQuestionAttempt.objects.filter(assessment_attempt=assessment_attempt).order_by('id'))
+        cq_attempts = list(CodeQuestionAttempt.objects.filter(assessment_attempt=assessment_attempt).order_by('id')
+                           .select_related('code_question__solution_code_language'))
+
+        for index, question_attempt in enumerate(mcq_attempts + cq_attempts):
+            self.think()
+            self.request("attempt_question", "get", reverse('attempt-question', args=[assessment_attempt.id, index]))
+            # the page tracks the time spent on the question from when it was opened
+            start_time = timezone.localtime().strftime("%Y-%m-%d %H:%M:%S")
+            if isinstance(question_attempt, McqQuestionAttempt):
+                self.answer_mcq(question_attempt, start_time)
+            elif question_attempt.code_question.is_software_language():
+                self.answer_code_question(question_attempt, start_time)
+
+        self.think()
+        self.request("submit_assessment", "post", reverse('submit-assessment', args=[assessment_attempt.id]))
+
+    def answer_mcq(self, mcq_attempt, start_time):
+        options = list(McqQuestionOption.objects.filter(mcq_question_id=mcq_attempt.mcq_question_id).values_list('id', flat=True))
+        if options:
+            self.request("save_mcq_attempt_options", "post", reverse('save-mcq-attempt-options', args=[mcq_attempt.id]),
+                         {"selected_option_ids": str(self.rng.choice(options)), "start_time": start_time})
+
+    def answer_code_question(self, cq_attempt, start_time):
+        code_question = cq_attempt.code_question
+        if code_question.solution_code and code_question.solution_code_language:
+            code, language = code_question.solution_code, code_question.solution_code_language
+        else:
+            snippet = CodeSnippet.objects.filter(code_question=code_question).select_related('language').first()
+            if not snippet:
+                return
+            code, language = snippet.code, snippet.language
+        lang_id = language.judge_language_id
+
+        # autosave while typing
+        for _ in range(self.options['autosaves']):
+            self.think()
+            self.request("save_code_attempt_snippet", "post", reverse('save-code-attempt-snippet', args=[cq_attempt.id]),
+                         {"code": code, "lang-id": lang_id})
+
+        # compile and run the sample test case
+        sample_tc = TestCase.objects.filter(code_question=code_question, sample=True).first()
+        if sample_tc:
+            self.think()
+            response = self.request("submit_single_test_case", "post",
+                                    reverse('submit-single-test-case', args=[sample_tc.id, code_question.id]),
+                                    {"code": code, "lang-id": lang_id, "run_stdin": sample_tc.stdin})
+            token = response.json().get("token") if response.status_code == 200 else None
+            if token:
+                self.poll("get_tc_details", reverse('get-tc-details'), {"token": token, "status_only": "true"},
+                          lambda data: data.get("data", {}).get("status_id") not in PENDING_STATUSES)
+
+        # submit and poll until all test cases are judged
+        self.think()
+        response = self.request("code_question_submission", "post", reverse('code-question-submission', args=[cq_attempt.id]),
+                                {"code": code, "lang-id": lang_id, "start_time": start_time})
+        cqs_id = response.json().get("cqs_id") if response.status_code == 200 else None
+        if cqs_id:
+            self.poll("get_cq_submission_status", reverse('get-cq-submission-status'), {"cqs_id": cqs_id},
+                      lambda data: all(status not in PENDING_STATUSES for _, status, _ in data.get("statuses", [])))
+
+    def poll(self, endpoint, url, params, finished):
+        for _ in range(self.options['max_polls']):
+            time.sleep(self.options['poll_interval'])
+            response = self.request(endpoint, "get", url, params)
+            if response.status_code != 200 or finished(response.json()):
+                return
+
+
+class Command(BaseCommand):
+    help = "Exam-scale load test: simulates students entering an assessment at the same time (answering, autosaving, " \
+           "compiling and running, submitting and polling) against the configured database and judge0 (see fake_judge0), " \
+           "and writes the latency percentiles, throughput, DB query counts and error rates per endpoint as json"
+
+    def add_arguments(self, parser):
+        parser.add_argument('assessment_id', type=int, help="a published, active assessment without webcam proctoring")
+        parser.add_argument('--students', type=int, default=600, help="number of simulated students")
+        parser.add_argument('--students-csv', help="students to seed, as generated by gen-students.py "
+                                                   "(first name, last name, username, course group)")
+        parser.add_argument('--concurrency', type=int, default=100, help="number of students active at the same time")
+        parser.add_argument('--ramp-up', type=float, default=10, help="seconds over which the students start")
+        parser.add_argument('--think-time', type=float, default=2, help="max seconds between the actions of a student")
+        parser.add_argument('--autosaves', type=int, default=3, help="autosaves per code question")
+        parser.add_argument('--poll-interval', type=float, default=1, help="seconds between status polls")
+        parser.add_argument('--max-polls', type=int, default=60, help="max status polls per submission")
+        parser.add_argument('--host', default="localhost", help="Host header of the requests (must be in ALLOWED_HOSTS)")
+        parser.add_argument('--output', default="loadtest.json", help="path of the json report")
+        parser.add_argument('--cleanup', action='store_true', help="delete the seeded students and their attempts afterwards")
+
+    def handle(self, *args, **options):
+        assessment = Assessment.objects.filter(id=options['assessment_id']).first()
+        if not assessment:
+            raise CommandError("Assessment does not exist.")
+        if not assessment.published or assessment.require_webcam:
+            raise CommandError("The assessment must be published and must not require a webcam.")
+
+        users = self.seed_students(assessment, options)
+        self.stdout.write(f"Seeded {len(users)} students, running with concurrency {options['concurrency']}")
+
+        recorder = Recorder()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            for i, user in enumerate(users):
+                delay = options['ramp_up'] * i / len(users)
+                executor.submit(self.start_candidate, user, assessment, recorder, options, start + delay)
+        report = recorder.report(time.perf_counter() - start)
+
+        report.update({
+            "time": datetime.now().isoformat(),
+            "assessment": assessment.id,
+            "students": len(users),
+            "options": {key: options[key] for key in ['concurrency', 'ramp_up', 'think_time', 'autosaves',
+                                                       'poll_interval', 'max_polls']},
+        })
+        with open(options['output'], "w") as f:
+            json.dump(report, f, indent=2)
+        self.print_report(report)
+        self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+
+        if options['cleanup']:
+            AssessmentAttempt.objects.filter(candidate__in=users).delete()
+            User.objects.filter(id__in=[user.id for user in users]).delete()
+
+    def start_candidate(self, user, assessment, recorder, options, start_at):
+        time.sleep(max(0, start_at - time.perf_counter()))
+        Candidate(user, assessment, recorder, options).run()
+
+    def seed_students(self, assessment, options):
+        """
+        Creates (or reuses) the students and enrolls them in a course group of the assessment's course.
+        """
+        if options['students_csv']:
+            with open(options['students_csv']) as f:
+                rows = [row for row in csv.reader(f) if row][:options['students']]
+        else:
+            rows = [[f"STUDENT {i}", "LOADTEST", f"{i:04d}", ""] for i in range(options['students'])]
+
+        student_group = Group.objects.get(name='student')
+        course_group, _ = CourseGroup.objects.get_or_create(name=USERNAME_PREFIX, course=assessment.course)
+
+        users = []
+        for first_name, last_name, username, _ in rows:
+            user, created = User.objects.get_or_create(username=f"{USERNAME_PREFIX}{username}".upper(), defaults={
+                "first_name": first_name, "last_name": last_name,
+                "email": f"{USERNAME_PREFIX}{username}@EXAMPLE.COM".upper(),
+            })
+            if created:
+                user.set_unusable_password()
+                user.save()
+                user.groups.add(student_group)
+            users.append(user)
+        course_group.students.add(*users)
+        return users
+
+    def print_report(self, report):
+        self.stdout.write(f"{'endpoint':<28}{'count':>8}{'err%':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}")
+        for endpoint, stats in report["endpoints"].items():
+            self.stdout.write(f"{endpoint:<28}{stats['count']:>8}{stats['error_rate'] * 100:>7.1f}"
+                              f"{stats['latency_p50'] * 1000:>9.0f}{stats['latency_p95'] * 1000:>9.0f}"
+                              f"{stats['latency_p99'] * 1000:>9.0f}{stats['queries_mean']:>9.1f}")
+        for endpoint, stats in report["endpoints"].items():
+            if stats["error_samples"]:
+                self.stdout.write(self.style.WARNING(f"{endpoint} failed with {json.dumps(stats['error_samples'][0])[:200]}"))
+        self.stdout.write(f"{report['requests']} requests in {report['duration']:.1f} s "
+                          f"({report['throughput']:.1f} req/s), error rate {report['error_rate'] * 100:.2f}%, "
+                          f"{report['flows']['failed']}/{report['flows']['count']} students failed")
@@ -0,0 +1,21 @@
+from django.core.management import BaseCommand, CommandError
+
+from core.models import Assessment, BestAttempt
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the best attempts (and best_attempt flags) of assessments from the scores of their attempts"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--assessment", type=int, help="only rebuild the best attempts of this assessment")
+
+    def handle(self, *args, **options):
+        assessments = Assessment.objects.filter(assessmentattempt__score__isnull=False).distinct()
+        if options["assessment"]:
+            assessments = Assessment.objects.filter(id=options["assessment"])
+            if not assessments.exists():
+                raise CommandError(f"Assessment {options['assessment']} does not exist")
+
+        for assessment in assessments:
+            count = BestAttempt.rebuild(assessment)
+            self.stdout.write(f"{assessment}: {count} best attempts")
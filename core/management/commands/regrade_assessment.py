@@ -0,0 +1,70 @@
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from core import judge0
+from core.models import Assessment, CodeQuestion, Regrade
+from core.regrade import advance_regrade, get_regrade_progress, start_regrade
+from core.tasks import run_regrade
+
+
+class Command(BaseCommand):
+    help = "Re-runs the stored code question submissions of an assessment (or one code question) against the current " \
+           "test cases and recomputes the scores and best attempts"
+
+    def add_arguments(self, parser):
+        parser.add_argument("assessment_id", type=int, nargs="?", help="assessment to regrade")
+        parser.add_argument("--question", type=int, help="only regrade this code question of the assessment")
+        parser.add_argument("--resume", type=int, metavar="REGRADE_ID", help="resume an interrupted regrade")
+        parser.add_argument("--status", type=int, metavar="REGRADE_ID", help="show the progress of a regrade")
+        parser.add_argument("--sync", action="store_true",
+                            help="run the regrade in this process instead of the celery worker, printing its progress")
+
+    def handle(self, *args, **options):
+        if options["status"]:
+            regrade = self.get_regrade(options["status"])
+            self.write_progress(regrade)
+            return
+
+        if options["resume"]:
+            regrade = self.get_regrade(options["resume"])
+            if regrade.status == "finished":
+                raise CommandError(f"Regrade {regrade.id} is already finished")
+        else:
+            if options["assessment_id"] is None:
+                raise CommandError("An assessment id (or --resume/--status) is required")
+            assessment = Assessment.objects.filter(id=options["assessment_id"]).first()
+            if not assessment:
+                raise CommandError(f"Assessment {options['assessment_id']} does not exist")
+            code_question = None
+            if options["question"]:
+                code_question = CodeQuestion.objects.filter(id=options["question"], assessment=assessment).first()
+                if not code_question:
+                    raise CommandError(f"Code question {options['question']} does not belong to assessment {assessment.id}")
+            regrade = start_regrade(assessment, code_question)
+            self.stdout.write(f"Started regrade {regrade.id} of {regrade.total} submissions")
+
+        if not options["sync"]:
+            run_regrade.delay(regrade.id)
+            self.stdout.write(f"Queued, follow it with --status {regrade.id}")
+            return
+
+        pool = judge0.get_pool()
+        while not advance_regrade(regrade, pool):
+            self.write_progress(regrade)
+            time.sleep(settings.REGRADE_INTERVAL)
+            regrade.refresh_from_db()
+        self.write_progress(regrade)
+
+    def get_regrade(self, regrade_id):
+        regrade = Regrade.objects.filter(id=regrade_id).first()
+        if not regrade:
+            raise CommandError(f"Regrade {regrade_id} does not exist")
+        return regrade
+
+    def write_progress(self, regrade):
+        regrade.refresh_from_db()
+        progress = get_regrade_progress(regrade)
+        self.stdout.write(f"Regrade {regrade.id} ({progress['status']}): {progress['submitted']}/{progress['total']} "
+                          f"submissions re-sent, {progress['judged']} judged")
@@ -0,0 +1,27 @@
+# Generated by Django 4.0.3 on 2026-10-18 12:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_hdl_update_data'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SolutionOutputCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('solution_hash', models.CharField(max_length=64)),
+                ('token', models.CharField(blank=True, db_index=True, max_length=36, null=True)),
+                ('stdout', models.TextField(blank=True, null=True)),
+                ('last_used', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('code_question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.codequestion')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.3 on 2026-10-18 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_solutionoutputcache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testcaseattempt',
+            name='result_key',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+    ]
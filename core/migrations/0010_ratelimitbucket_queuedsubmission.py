@@ -0,0 +1,37 @@
+# Generated by Django 4.0.3 on 2026-10-18 14:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_testcaseattempt_result_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, unique=True)),
+                ('tokens', models.FloatField()),
+                ('updated', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='QueuedSubmission',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('submission', 'Code Question Submission'), ('run', 'Test Case Run'), ('compile', 'Compile')], max_length=20)),
+                ('params', models.JSONField()),
+                ('tokens', models.JSONField(blank=True, null=True)),
+                ('time_queued', models.DateTimeField(auto_now_add=True)),
+                ('time_dispatched', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('cq_submission', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.codequestionsubmission')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.3 on 2026-10-18 15:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_ratelimitbucket_queuedsubmission'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='queuedsubmission',
+            name='lane',
+            field=models.CharField(choices=[('graded', 'Graded Submission'), ('educator', 'Educator Run'), ('practice', 'Practice Run')], db_index=True, default='graded', max_length=20),
+        ),
+    ]
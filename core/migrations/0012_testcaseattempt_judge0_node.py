@@ -0,0 +1,18 @@
+# Generated by Django 4.0.3 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_queuedsubmission_lane'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testcaseattempt',
+            name='judge0_node',
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.0.3 on 2026-10-18 16:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_testcaseattempt_judge0_node'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='testcaseattempt',
+            name='status',
+            field=models.IntegerField(choices=[(1, 'In Queue'), (2, 'Processing'), (3, 'Accepted'), (4, 'Wrong Answer'), (5, 'Time Limit Exceeded'), (6, 'Compilation Error'), (7, 'Runtime Error (SIGSEGV)'), (8, 'Runtime Error (SIGXFSZ)'), (9, 'Runtime Error (SIGFPE)'), (10, 'Runtime Error (SIGABRT)'), (11, 'Runtime Error (NZEC)'), (12, 'Runtime Error (Other)'), (13, 'Internal Error'), (14, 'Exec Format Error'), (15, 'Insufficient Threads Used'), (16, 'Data Race Detected'), (17, 'Exceeded Threads Limit')], db_index=True, default=1),
+        ),
+        migrations.AddField(
+            model_name='testcaseattempt',
+            name='next_poll',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='testcaseattempt',
+            name='poll_count',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.0.3 on 2026-10-18 18:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_testcaseattempt_reconciler'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codequestionsubmission',
+            name='passed_count',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='codequestionsubmission',
+            name='score',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.0.3 on 2026-10-18 18:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_codequestionsubmission_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Regrade',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('submitting', 'Submitting'), ('judging', 'Judging'), ('finished', 'Finished')], default='submitting', max_length=20)),
+                ('max_cqs_id', models.PositiveIntegerField(default=0)),
+                ('last_cqs_id', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('submitted', models.PositiveIntegerField(default=0)),
+                ('time_started', models.DateTimeField(auto_now_add=True)),
+                ('time_finished', models.DateTimeField(blank=True, null=True)),
+                ('assessment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.assessment')),
+                ('code_question', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.codequestion')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.3 on 2026-10-18 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_regrade'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='assessmentattempt',
+            name='time_submitted',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.0.3 on 2026-10-18 19:45
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_best_attempts(apps, schema_editor):
+    """
+    Creates the best attempts of the attempts scored so far (the earliest attempt with the highest score of each candidate).
+    """
+    AssessmentAttempt = apps.get_model("core", "AssessmentAttempt")
+    BestAttempt = apps.get_model("core", "BestAttempt")
+
+    best_attempts = {}
+    for attempt in AssessmentAttempt.objects.filter(score__isnull=False).order_by('id'):
+        key = (attempt.assessment_id, attempt.candidate_id)
+        if key not in best_attempts or attempt.score > best_attempts[key].score:
+            best_attempts[key] = BestAttempt(assessment_id=attempt.assessment_id, candidate_id=attempt.candidate_id,
+                                             assessment_attempt_id=attempt.id, score=attempt.score,
+                                             time_submitted=attempt.time_submitted)
+    BestAttempt.objects.bulk_create(best_attempts.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_assessmentattempt_time_submitted_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BestAttempt',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.PositiveIntegerField()),
+                ('time_submitted', models.DateTimeField(blank=True, null=True)),
+                ('assessment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.assessment')),
+                ('assessment_attempt', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='core.assessmentattempt')),
+                ('candidate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='bestattempt',
+            constraint=models.UniqueConstraint(fields=('assessment', 'candidate'), name='unique_best_attempt'),
+        ),
+        migrations.RunPython(populate_best_attempts, migrations.RunPython.noop),
+    ]
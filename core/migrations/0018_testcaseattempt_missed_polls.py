@@ -0,0 +1,18 @@
+# Generated by Django 4.0.3 on 2026-10-18 21:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_bestattempt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testcaseattempt',
+            name='missed_polls',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.0.3 on 2026-10-18 23:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_testcaseattempt_missed_polls'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='codequestionsubmission',
+            index=models.Index(condition=models.Q(('passed__isnull', True)), fields=['time_submitted'], name='cqs_processing_idx'),
+        ),
+    ]
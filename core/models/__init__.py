@@ -1,4 +1,6 @@
 from .assessments import Assessment
 from .users_management import User, Course, CourseGroup
-from .questions import QuestionBank, CodeQuestion, McqQuestion, McqQuestionOption, Tag, TestCase, Language, CodeSnippet, CodeTemplate
-from .attempts import AssessmentAttempt, CodeQuestionAttempt, CodeQuestionAttemptSnippet, CodeQuestionSubmission, TestCaseAttempt, McqQuestionAttempt, McqQuestionAttemptOption, CandidateSnapshot
+from .questions import QuestionBank, CodeQuestion, McqQuestion, McqQuestionOption, Tag, TestCase, Language, CodeSnippet, CodeTemplate, SolutionOutputCache
+from .attempts import AssessmentAttempt, BestAttempt, CodeQuestionAttempt, CodeQuestionAttemptSnippet, CodeQuestionSubmission, TestCaseAttempt, McqQuestionAttempt, McqQuestionAttemptOption, CandidateSnapshot
+from .admission import RateLimitBucket, QueuedSubmission
+from .regrade import Regrade
@@ -0,0 +1,48 @@
+from django.db import models
+
+
+class RateLimitBucket(models.Model):
+    """
+    Token bucket used for admission control of judge0 submissions (per user and global), see core/admission.py.
+    Tokens are refilled lazily from the time of the last update whenever the bucket is used.
+    """
+
+    class Meta:
+        pass
+
+    key = models.CharField(max_length=100, null=False, blank=False, unique=True)
+    tokens = models.FloatField(null=False, blank=False)
+    updated = models.DateTimeField(null=False, blank=False)
+
+
+class QueuedSubmission(models.Model):
+    """
+    Judge0 submissions that were not admitted immediately because judge0 was saturated.
+    Each lane (priority class) is a separate queue. They are sent to judge0 in order within a lane and weighted round robin
+    across lanes by the drain_submission_queue celery task, which then fills in the tokens.
+    """
+
+    class Meta:
+        pass
+
+    KINDS = [
+        ("submission", "Code Question Submission"),
+        ("run", "Test Case Run"),
+        ("compile", "Compile"),
+    ]
+
+    # priority classes, highest priority first
+    LANES = [
+        ("graded", "Graded Submission"),
+        ("educator", "Educator Run"),
+        ("practice", "Practice Run"),
+    ]
+
+    user = models.ForeignKey("User", null=False, blank=False, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=20, choices=KINDS, null=False, blank=False)
+    lane = models.CharField(max_length=20, choices=LANES, default="graded", null=False, blank=False, db_index=True)
+    cq_submission = models.ForeignKey("CodeQuestionSubmission", null=True, blank=True, on_delete=models.CASCADE)
+    params = models.JSONField(null=False, blank=False)
+    tokens = models.JSONField(null=True, blank=True)
+    time_queued = models.DateTimeField(auto_now_add=True)
+    time_dispatched = models.DateTimeField(null=True, blank=True, db_index=True)
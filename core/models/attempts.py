@@ -1,15 +1,18 @@
 import math
+from collections import defaultdict
 from datetime import timedelta
 from django.apps import apps
-from django.db import models
-from django.db.models import Sum
+from django.db import connection, models, transaction
+from django.db.models import Case, Count, Exists, F, Max, OuterRef, Q, Subquery, Sum, When
+from django.db.models.functions import Coalesce
+from django.utils.functional import cached_property
 
 
 class AssessmentAttempt(models.Model):
     candidate = models.ForeignKey("User", null=False, blank=False, on_delete=models.PROTECT)
     assessment = models.ForeignKey("Assessment", null=False, blank=False, on_delete=models.PROTECT)
     time_started = models.DateTimeField(auto_now_add=True)
-    time_submitted = models.DateTimeField(blank=True, null=True)
+    time_submitted = models.DateTimeField(blank=True, null=True, db_index=True)
     auto_submit = models.BooleanField(blank=True, null=True)
     score = models.PositiveIntegerField(blank=True, null=True)
     best_attempt = models.BooleanField(blank=True, null=True)
@@ -26,45 +29,61 @@ class AssessmentAttempt(models.Model):
             return "Finished"
 
     def compute_score(self):
-        TestCase = apps.get_model(app_label="core", model_name="TestCase")
-
-        # compute the total score of all CodeQuestionAttempts
-        total_score = 0
-        for cqa in self.codequestionattempt_set.all():
-            # find the max CodeQuestionSubmission for this CodeQuestionAttempt
-            max_score = 0
-            for cqs in CodeQuestionSubmission.objects.filter(cq_attempt=cqa):
-                cqs_score = TestCase.objects.filter(testcaseattempt__cq_submission=cqs, testcaseattempt__status=3).aggregate(Sum('score')).get(
-                    "score__sum")
-                cqs_score = cqs_score if cqs_score else 0
-                if cqs_score > max_score:
-                    max_score = cqs_score
-
-            # add to total
-            total_score += max_score
-
-        # compute the total score of all McqQuestionAttempts
-        for mqa in self.mcqquestionattempt_set.all():
-            total_score += mqa.score
-
-        self.score = total_score
-
-        # get the previous best attempt
-        prev_best_attempt = AssessmentAttempt.objects.filter(candidate=self.candidate, assessment=self.assessment, best_attempt=True).first()
-
-        # check the previous_best_attempt
-        if prev_best_attempt:
-            if self.score > prev_best_attempt.score:
-                prev_best_attempt.best_attempt = False
-                prev_best_attempt.save()
-                self.best_attempt = True
-            else:
-                self.best_attempt = False
-        else:
-            self.best_attempt = True
-
+        self.score = self.compute_code_question_score() + self.compute_mcq_question_score()
         self.save()
 
+        # update the best attempt of the candidate atomically, the best_attempt flags follow it
+        best_attempt_id = BestAttempt.upsert(self)
+        self.best_attempt = best_attempt_id == self.id
+        AssessmentAttempt.objects.filter(candidate=self.candidate_id, assessment=self.assessment_id, score__isnull=False) \
+            .update(best_attempt=Case(When(id=best_attempt_id, then=True), default=False))
+
+    def compute_score_if_complete(self):
+        """
+        Computes the score once the attempt has been submitted and all of its CodeQuestionSubmissions have been processed
+        by judge0. Called when the attempt is submitted and when each of its submissions is finished, so that the last of
+        these events computes the score exactly once (the attempt is locked, and an attempt that already has a score is
+        skipped). Returns True if the score was computed.
+        """
+        with transaction.atomic():
+            attempt = AssessmentAttempt.objects.select_for_update().get(id=self.id)
+            if attempt.time_submitted is None or attempt.score is not None or attempt.has_processing_submission():
+                return False
+            attempt.compute_score()
+        self.score = attempt.score
+        self.best_attempt = attempt.best_attempt
+        return True
+
+    @staticmethod
+    def get_unscored_attempts():
+        """
+        Submitted AssessmentAttempts without a score whose submissions have all been processed by judge0.
+        """
+        processing = CodeQuestionSubmission.objects.filter(cq_attempt__assessment_attempt=OuterRef('pk'), passed=None)
+        return AssessmentAttempt.objects.filter(time_submitted__isnull=False, score__isnull=True) \
+            .annotate(processing=Exists(processing)).filter(processing=False)
+
+    def compute_code_question_score(self):
+        """
+        Sum of the best CodeQuestionSubmission score of each CodeQuestionAttempt, in one grouped query.
+        The score of a submission is the sum of the scores of its accepted test cases.
+        """
+        submission_scores = TestCaseAttempt.objects.filter(cq_submission=OuterRef('pk'), status=3) \
+            .values('cq_submission').annotate(score=Sum('test_case__score')).values('score')
+        max_scores = CodeQuestionSubmission.objects.filter(cq_attempt__assessment_attempt=self) \
+            .annotate(accepted_score=Coalesce(Subquery(submission_scores), 0)) \
+            .values('cq_attempt').annotate(max_score=Max('accepted_score')).values_list('max_score', flat=True)
+        return sum(max_scores)
+
+    def compute_mcq_question_score(self):
+        """
+        Sum of the scores of the McqQuestionAttempts whose selected options are exactly the correct options (see
+        McqQuestionAttempt.score), in one query.
+        """
+        score = annotate_mcq_question_scores(McqQuestionAttempt.objects.filter(assessment_attempt=self)) \
+            .aggregate(score=Sum('earned_score')).get("score")
+        return score or 0
+
     def has_processing_submission(self):
         """
         Checks if this AssessmentAttempt still has CodeQuestionSubmissions that are still processing
@@ -109,6 +128,108 @@ class AssessmentAttempt(models.Model):
         return None
 
 
+class BestAttempt(models.Model):
+    """
+    Best AssessmentAttempt of each candidate of an assessment (the earliest one with the highest score), read by the
+    reports instead of filtering AssessmentAttempt by best_attempt.
+    Maintained with an upsert when an attempt is scored (see upsert), and rebuilt from the scores of the attempts by
+    rebuild (e.g. after a regrade, or with the rebuild_best_attempts command).
+    """
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['assessment', 'candidate'], name='unique_best_attempt'),
+        ]
+
+    assessment = models.ForeignKey("Assessment", null=False, blank=False, on_delete=models.CASCADE)
+    candidate = models.ForeignKey("User", null=False, blank=False, on_delete=models.CASCADE)
+    assessment_attempt = models.OneToOneField("AssessmentAttempt", null=False, blank=False, on_delete=models.CASCADE)
+    score = models.PositiveIntegerField(null=False, blank=False)
+    time_submitted = models.DateTimeField(null=True, blank=True)
+
+    @staticmethod
+    def upsert(assessment_attempt):
+        """
+        Makes a scored AssessmentAttempt the best attempt of its candidate if there is none yet, it has a higher score, or
+        the same score and it is earlier (as rebuild picks them), in one statement so that attempts scored concurrently
+        cannot both become the best one. The score of the best attempt is updated if it did not decrease, otherwise the
+        best attempt of the candidate is rebuilt, another attempt may now be the best one.
+        Returns the id of the best attempt.
+        """
+        table = BestAttempt._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (assessment_id, candidate_id, assessment_attempt_id, score, time_submitted) "
+                f"VALUES (%s, %s, %s, %s, %s) "
+                f"ON CONFLICT (assessment_id, candidate_id) DO UPDATE SET "
+                f"assessment_attempt_id = excluded.assessment_attempt_id, score = excluded.score, "
+                f"time_submitted = excluded.time_submitted "
+                f"WHERE excluded.score > {table}.score "
+                f"OR (excluded.score = {table}.score AND excluded.assessment_attempt_id <= {table}.assessment_attempt_id)",
+                [assessment_attempt.assessment_id, assessment_attempt.candidate_id, assessment_attempt.id,
+                 assessment_attempt.score, assessment_attempt.time_submitted],
+            )
+        best_attempt = BestAttempt.objects.filter(assessment=assessment_attempt.assessment_id,
+                                                  candidate=assessment_attempt.candidate_id)
+        best_attempt_id, score = best_attempt.values_list('assessment_attempt_id', 'score').get()
+        if best_attempt_id == assessment_attempt.id and score != assessment_attempt.score:
+            BestAttempt.rebuild(assessment_attempt.assessment_id, candidate=assessment_attempt.candidate_id)
+            best_attempt_id = best_attempt.values_list('assessment_attempt_id', flat=True).get()
+        return best_attempt_id
+
+    @staticmethod
+    def rebuild(assessment, candidate=None):
+        """
+        Recomputes the best attempts of an assessment (or of one of its candidates) and the best_attempt flags from the
+        scores of the attempts. Returns the number of best attempts.
+        """
+        attempts = AssessmentAttempt.objects.filter(assessment=assessment, score__isnull=False)
+        if candidate is not None:
+            attempts = attempts.filter(candidate=candidate)
+        best_attempts = {}
+        for attempt_id, candidate_id, score, time_submitted in attempts.order_by('id') \
+                .values_list('id', 'candidate_id', 'score', 'time_submitted'):
+            best = best_attempts.get(candidate_id)
+            if best is None or score > best.score:
+                best_attempts[candidate_id] = BestAttempt(assessment_id=getattr(assessment, 'id', assessment),
+                                                          candidate_id=candidate_id, assessment_attempt_id=attempt_id,
+                                                          score=score, time_submitted=time_submitted)
+
+        with transaction.atomic():
+            existing = BestAttempt.objects.filter(assessment=assessment)
+            if candidate is not None:
+                existing = existing.filter(candidate=candidate)
+            existing.delete()
+            BestAttempt.objects.bulk_create(best_attempts.values(), batch_size=500)
+            best_attempt_ids = BestAttempt.objects.filter(assessment=assessment).values('assessment_attempt_id')
+            attempts.update(best_attempt=Exists(best_attempt_ids.filter(assessment_attempt_id=OuterRef('pk'))))
+        return len(best_attempts)
+
+
+def annotate_mcq_question_scores(mcq_attempts):
+    """
+    Annotates a McqQuestionAttempt queryset with "earned_score", the score of the question if the selected options are
+    exactly the correct options and 0 otherwise, with subqueries instead of one query per attempt.
+    """
+    McqQuestionOption = apps.get_model(app_label="core", model_name="McqQuestionOption")
+    correct_options = McqQuestionOption.objects.filter(mcq_question=OuterRef('mcq_question'), correct=True) \
+        .values('mcq_question').annotate(count=Count('id')).values('count')
+    selected_options = McqQuestionAttemptOption.objects.filter(mcq_attempt=OuterRef('pk')).values('mcq_attempt')
+    selected_correct = selected_options.filter(selected_option__correct=True) \
+        .annotate(count=Count('selected_option', distinct=True)).values('count')
+    selected_incorrect = selected_options.filter(selected_option__correct=False) \
+        .annotate(count=Count('selected_option', distinct=True)).values('count')
+
+    return mcq_attempts.annotate(
+        correct=Coalesce(Subquery(correct_options), 0),
+        selected_correct=Coalesce(Subquery(selected_correct), 0),
+        selected_incorrect=Coalesce(Subquery(selected_incorrect), 0),
+    ).annotate(earned_score=Case(
+        When(correct=F('selected_correct'), selected_incorrect=0, then=F('mcq_question__score')),
+        default=0,
+    ))
+
+
 class CodeQuestionAttempt(models.Model):
     assessment_attempt = models.ForeignKey("AssessmentAttempt", null=False, blank=False, on_delete=models.CASCADE)
     code_question = models.ForeignKey("CodeQuestion", null=False, blank=False, on_delete=models.PROTECT)
@@ -143,11 +264,20 @@ class CodeQuestionAttemptSnippet(models.Model):
 
 
 class CodeQuestionSubmission(models.Model):
+    class Meta:
+        indexes = [
+            # submissions that are still processing (see finish_completed_submissions)
+            models.Index(fields=['time_submitted'], condition=Q(passed__isnull=True), name='cqs_processing_idx'),
+        ]
+
     cq_attempt = models.ForeignKey("CodeQuestionAttempt", null=False, blank=False, on_delete=models.CASCADE)
     time_submitted = models.DateTimeField(auto_now_add=True)
     passed = models.BooleanField(blank=True, null=True)
     language = models.ForeignKey("Language", null=False, blank=False, on_delete=models.PROTECT)
     code = models.TextField()
+    # persisted once all test cases are processed (see compute_results), None while processing
+    score = models.PositiveIntegerField(blank=True, null=True)
+    passed_count = models.PositiveIntegerField(blank=True, null=True)
 
     @property
     def outcome(self):
@@ -158,12 +288,19 @@ class CodeQuestionSubmission(models.Model):
         elif not self.passed:
             return "Failed"
 
-    @property
-    def score(self):
-        TestCase = apps.get_model(app_label="core", model_name="TestCase")
-        cqs_score = TestCase.objects.filter(testcaseattempt__cq_submission=self, testcaseattempt__status=3).aggregate(Sum('score')).get("score__sum")
-        cqs_score = cqs_score if cqs_score else 0
-        return cqs_score
+    def compute_results(self):
+        """
+        Sets the "passed" flag, the score (sum of the scores of the accepted test cases) and the number of accepted
+        test cases, in one query. Called once all test cases have been processed by judge0.
+        """
+        results = TestCaseAttempt.objects.filter(cq_submission=self).aggregate(
+            failed=Count('id', filter=Q(status__range=(4, 17))),
+            passed_count=Count('id', filter=Q(status=3)),
+            score=Sum('test_case__score', filter=Q(status=3)),
+        )
+        self.passed = not results["failed"]
+        self.passed_count = results["passed_count"]
+        self.score = results["score"] or 0
 
     @property
     def average_thread_usage(self):
@@ -199,12 +336,21 @@ class TestCaseAttempt(models.Model):
     cq_submission = models.ForeignKey("CodeQuestionSubmission", null=False, blank=False, on_delete=models.CASCADE)
     test_case = models.ForeignKey("TestCase", null=False, blank=False, on_delete=models.PROTECT)
     token = models.CharField(max_length=36, null=False, blank=False)
-    status = models.IntegerField(choices=STATUSES, default=1)
+    status = models.IntegerField(choices=STATUSES, default=1, db_index=True)
     stdout = models.TextField(blank=True, null=True)
     time = models.FloatField(blank=True, null=True)
     memory = models.FloatField(blank=True, null=True)
     threads = models.PositiveIntegerField(blank=True, null=True)
     thread_times = models.TextField(blank=True, null=True)
+    # hash of the judge0 submission (code, language, test case, limits), used to reuse results of identical submissions
+    result_key = models.CharField(max_length=64, null=True, blank=True, db_index=True)
+    # name of the judge0 node that owns the token (see core/judge0.py), null for the default node
+    judge0_node = models.CharField(max_length=20, null=True, blank=True)
+    # backoff of the background reconciler while the token is pending (see reconcile_test_case_attempts)
+    next_poll = models.DateTimeField(null=True, blank=True, db_index=True)
+    poll_count = models.PositiveSmallIntegerField(default=0)
+    # polls that judge0 did not know the token (or it was never sent), it is given up after RECONCILER_MAX_MISSES
+    missed_polls = models.PositiveSmallIntegerField(default=0)
 
 
 class McqQuestionAttempt(models.Model):
@@ -219,18 +365,50 @@ class McqQuestionAttempt(models.Model):
         """
         return McqQuestionAttemptOption.objects.filter(mcq_attempt=self).exists()
     
-    @property
+    @cached_property
     def score(self):
-        McqQuestionOption = apps.get_model(app_label="core", model_name="McqQuestionOption")
-        correct_option_ids = McqQuestionOption.objects.filter(mcq_question=self.mcq_question, correct=True).values_list('id', flat=True)
-
-        selected_option_ids = McqQuestionAttemptOption.objects.filter(mcq_attempt=self).values_list('selected_option__id', flat=True)
+        """
+        Score of the question if the selected options are exactly the correct options, 0 otherwise.
+        Set by grade_all for many attempts at once.
+        """
+        return McqQuestionAttempt.grade(McqQuestionAttempt.objects.filter(id=self.id))[self.id]
 
-        # if all options in selected_options match correct_options, then return score
-        score = 0
-        if set(correct_option_ids) == set(selected_option_ids):
-            score = self.mcq_question.score
-        return score
+    @staticmethod
+    def grade(mcq_attempts):
+        """
+        Scores of all McqQuestionAttempts of a queryset as a dict of id -> score, in three queries whatever their number:
+        the correct options of their questions are loaded once, the selected options of all attempts are grouped in
+        one query, and each attempt is compared as a set equality in memory.
+        """
+        McqQuestionOption = apps.get_model(app_label="core", model_name="McqQuestionOption")
+        attempts = list(mcq_attempts.values_list('id', 'mcq_question_id', 'mcq_question__score'))
+
+        correct_options = defaultdict(set)
+        for mcq_question_id, option_id in McqQuestionOption.objects \
+                .filter(mcq_question__in=mcq_attempts.values('mcq_question'), correct=True).values_list('mcq_question_id', 'id'):
+            correct_options[mcq_question_id].add(option_id)
+
+        selected_options = defaultdict(set)
+        for mcq_attempt_id, option_id in McqQuestionAttemptOption.objects \
+                .filter(mcq_attempt__in=mcq_attempts.values('id')).values_list('mcq_attempt_id', 'selected_option_id'):
+            selected_options[mcq_attempt_id].add(option_id)
+
+        # if all options in selected_options match correct_options, then the score of the question
+        return {
+            mcq_attempt_id: score if selected_options[mcq_attempt_id] == correct_options[mcq_question_id] else 0
+            for mcq_attempt_id, mcq_question_id, score in attempts
+        }
+
+    @staticmethod
+    def grade_all(mcq_attempts):
+        """
+        Evaluates a queryset of McqQuestionAttempts with their scores set (see grade), returns the list.
+        """
+        scores = McqQuestionAttempt.grade(mcq_attempts)
+        mcq_attempts = list(mcq_attempts)
+        for mcq_attempt in mcq_attempts:
+            mcq_attempt.score = scores[mcq_attempt.id]
+        return mcq_attempts
     
     @property
     def duration(self):
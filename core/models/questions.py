@@ -2,6 +2,7 @@ import uuid
 from django.core.exceptions import ValidationError
 from django.db import models
 from django.db.models import Sum
+from django.utils import timezone
 
 from core.models import User, Assessment
 
@@ -213,4 +214,22 @@ class HDLQuestionConfig(models.Model):
 class HDLQuestionSolution(models.Model):
     code_question = models.OneToOneField(CodeQuestion, null=True, blank=True, on_delete=models.CASCADE)
     module = models.TextField(blank=True, null=True)
-    testbench = models.TextField(blank=True, null=True)
\ No newline at end of file
+    testbench = models.TextField(blank=True, null=True)
+
+
+class SolutionOutputCache(models.Model):
+    """
+    Output of a CodeQuestion's solution code for a custom stdin, used as the expected output of custom test cases.
+    The key is a hash of (code question, solution code, language, stdin, limits), so changing any of them is a cache miss.
+    The stdout is null while the solution code is still being executed by judge0 (token).
+    """
+
+    class Meta:
+        pass
+
+    code_question = models.ForeignKey(CodeQuestion, null=False, blank=False, on_delete=models.CASCADE)
+    key = models.CharField(max_length=64, null=False, blank=False, unique=True)
+    solution_hash = models.CharField(max_length=64, null=False, blank=False)
+    token = models.CharField(max_length=36, null=True, blank=True, db_index=True)
+    stdout = models.TextField(null=True, blank=True)
+    last_used = models.DateTimeField(default=timezone.now, db_index=True)
@@ -0,0 +1,30 @@
+from django.db import models
+
+
+class Regrade(models.Model):
+    """
+    Re-run of the stored CodeQuestionSubmissions of an assessment (or of one of its code questions) against the current
+    test cases, see core/regrade.py.
+    Submissions are re-sent to judge0 in order of id, the last one that was re-sent is saved after every batch so that
+    an interrupted regrade resumes where it stopped.
+    """
+
+    class Meta:
+        pass
+
+    STATUSES = [
+        ("submitting", "Submitting"),
+        ("judging", "Judging"),
+        ("finished", "Finished"),
+    ]
+
+    assessment = models.ForeignKey("Assessment", null=False, blank=False, on_delete=models.CASCADE)
+    code_question = models.ForeignKey("CodeQuestion", null=True, blank=True, on_delete=models.CASCADE)
+    status = models.CharField(max_length=20, choices=STATUSES, default="submitting", null=False, blank=False)
+    # submissions made after the regrade was started are already judged against the current test cases
+    max_cqs_id = models.PositiveIntegerField(default=0)
+    last_cqs_id = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    submitted = models.PositiveIntegerField(default=0)
+    time_started = models.DateTimeField(auto_now_add=True)
+    time_finished = models.DateTimeField(null=True, blank=True)
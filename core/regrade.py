@@ -0,0 +1,232 @@
+# bulk regrading of the stored submissions of an assessment against its current test cases
+from collections import defaultdict
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max, Sum
+from django.utils import timezone
+
+from core.admission import admission_enabled, get_global_bucket, get_lane_reserve, pending_queue_size, refund_tokens, \
+    take_tokens
+from core.judge0 import PENDING_STATUSES, copy_test_case_result, find_reusable_results, get_callback_url, \
+    get_result_key, get_sending_token, refresh_test_case_attempts, result_reuse_enabled, update_finished_submissions
+from core.models import AssessmentAttempt, BestAttempt, CodeQuestionSubmission, McqQuestionAttempt, Regrade, TestCase, TestCaseAttempt
+from core.models.attempts import annotate_mcq_question_scores
+
+# regrades are started by educators, so they are sent to judge0 behind graded submissions
+REGRADE_LANE = "educator"
+
+
+def get_target_submissions(assessment, code_question=None):
+    """
+    CodeQuestionSubmissions that can be regraded. The testbench code of "Module and Testbench Design" submissions is
+    not stored, so those questions cannot be re-run.
+    """
+    submissions = CodeQuestionSubmission.objects.filter(cq_attempt__assessment_attempt__assessment=assessment) \
+        .exclude(cq_attempt__code_question__hdlquestionconfig__question_type=3)
+    if code_question:
+        submissions = submissions.filter(cq_attempt__code_question=code_question)
+    return submissions
+
+
+def get_regrade_submissions(regrade):
+    return get_target_submissions(regrade.assessment, regrade.code_question).filter(id__lte=regrade.max_cqs_id)
+
+
+def start_regrade(assessment, code_question=None):
+    """
+    Creates a Regrade of the submissions made so far, to be run with advance_regrade (e.g. by the run_regrade task).
+    """
+    submissions = get_target_submissions(assessment, code_question)
+    return Regrade.objects.create(
+        assessment=assessment,
+        code_question=code_question,
+        max_cqs_id=submissions.aggregate(Max('id')).get("id__max") or 0,
+        total=submissions.count(),
+    )
+
+
+def get_regrade_progress(regrade):
+    """
+    Number of submissions of the regrade that were re-sent to judge0 and that have their new score.
+    """
+    judged = get_regrade_submissions(regrade).filter(id__lte=regrade.last_cqs_id, passed__isnull=False).count()
+    return {
+        "status": regrade.status,
+        "total": regrade.total,
+        "submitted": regrade.submitted,
+        "judged": judged,
+    }
+
+
+def advance_regrade(regrade, pool):
+    """
+    Runs a regrade as far as possible: re-sends the submissions batch by batch until judge0 is saturated, then waits for
+    their results (delivered by callbacks and the reconciler, and polled here), then rescores the assessment attempts.
+    Returns True once the regrade is finished, otherwise it has to be called again later.
+    """
+    while regrade.status == "submitting":
+        count = resubmit_next_batch(regrade, pool)
+        if count is None:
+            return False
+        if count == 0:
+            Regrade.objects.filter(id=regrade.id, status="submitting").update(status="judging")
+        regrade.refresh_from_db()
+
+    if regrade.status == "judging":
+        pending = get_regrade_submissions(regrade).filter(passed__isnull=True)
+        if pending.exists():
+            tca_ids = list(TestCaseAttempt.objects.filter(cq_submission__in=pending, status__in=PENDING_STATUSES)
+                           .values_list('id', flat=True)[:settings.RECONCILER_BATCH_SIZE])
+            try:
+                refresh_test_case_attempts(TestCaseAttempt.objects.filter(id__in=tca_ids))
+            except requests.exceptions.RequestException:
+                pass
+            if pending.exists():
+                return False
+
+        rescore_assessment_attempts(regrade.assessment)
+        regrade.status = "finished"
+        regrade.time_finished = timezone.now()
+        regrade.save(update_fields=['status', 'time_finished'])
+    return True
+
+
+def resubmit_next_batch(regrade, pool):
+    """
+    Replaces the TestCaseAttempts of the next submissions of a regrade with new ones for the current test cases: up to
+    REGRADE_BATCH_SIZE submissions, with at most JUDGE0_BATCH_SIZE test cases to re-run (at least one submission).
+    Results of identical submissions are reused (see result_reuse_enabled), so only the test cases that changed are
+    re-run. The others are sent to judge0 in one batch, throttled by the global token bucket of core/admission.py
+    (leaving the reserve of REGRADE_LANE), and yielding to queued submissions.
+    The new TestCaseAttempts are saved with placeholder tokens and the regrade is advanced before they are sent, so
+    that judge0 is called without holding the locks of the regrade and of the bucket. If they cannot be sent, the
+    tokens are given back and the regrade resumes from the same submissions.
+    The scores of the submissions are computed again once their last test case is processed.
+    Returns the number of submissions that were re-sent, 0 if all of them were, and None if judge0 is saturated or
+    the regrade is being advanced by another worker.
+    """
+    # imported here, core.views.utils imports core.tasks
+    from core.views.utils import construct_judge0_params
+
+    with transaction.atomic():
+        regrade = Regrade.objects.select_for_update(skip_locked=True).filter(id=regrade.id).first()
+        if not regrade:
+            return None
+        candidates = list(get_regrade_submissions(regrade).filter(id__gt=regrade.last_cqs_id).order_by('id')
+                          .select_related('language', 'cq_attempt__code_question')[:settings.REGRADE_BATCH_SIZE])
+        if not candidates:
+            return 0
+
+        test_cases = {}
+        submissions = []
+        for cqs in candidates:
+            code_question = cqs.cq_attempt.code_question
+            if code_question.id not in test_cases:
+                test_cases[code_question.id] = list(TestCase.objects.filter(code_question=code_question)
+                                                    .select_related('code_question'))
+            runs = []
+            for test_case in test_cases[code_question.id]:
+                tca = TestCaseAttempt(cq_submission=cqs, test_case=test_case)
+                submission = construct_judge0_params(cqs.code, cqs.language.judge_language_id, test_case)
+                if result_reuse_enabled(code_question):
+                    tca.result_key = get_result_key(test_case, submission)
+                runs.append((tca, submission))
+            submissions.append((cqs, runs))
+
+        # reuse the results of identical submissions, e.g. of the test cases that were not edited
+        reusable = find_reusable_results([tca.result_key for _, runs in submissions for tca, _ in runs if tca.result_key])
+        batch = []
+        test_case_attempts = []
+        pending = []
+        for cqs, runs in submissions:
+            for tca, _ in runs:
+                if tca.result_key in reusable:
+                    copy_test_case_result(reusable[tca.result_key], tca)
+            remaining = [(tca, submission) for tca, submission in runs if tca.result_key not in reusable]
+            if batch and len(pending) + len(remaining) > settings.JUDGE0_BATCH_SIZE:
+                break
+            batch.append(cqs)
+            test_case_attempts += [tca for tca, _ in runs]
+            pending += remaining
+
+        throttled = bool(pending) and admission_enabled()
+        if throttled:
+            if pending_queue_size() or take_tokens([get_global_bucket()], len(pending), reserve=get_lane_reserve(REGRADE_LANE)):
+                return None
+
+        # test cases get placeholder tokens until they are sent to judge0, right after the commit
+        for index, (tca, _) in enumerate(pending):
+            tca.token = get_sending_token(tca.cq_submission_id, index)
+
+        cqs_ids = [cqs.id for cqs in batch]
+        TestCaseAttempt.objects.filter(cq_submission_id__in=cqs_ids).delete()
+        CodeQuestionSubmission.objects.filter(id__in=cqs_ids).update(passed=None, score=None, passed_count=None)
+        TestCaseAttempt.objects.bulk_create(test_case_attempts)
+
+        previous_cqs_id = regrade.last_cqs_id
+        regrade.last_cqs_id = batch[-1].id
+        regrade.submitted += len(batch)
+        regrade.save(update_fields=['last_cqs_id', 'submitted'])
+
+        # submissions whose results were all reused are already complete
+        update_finished_submissions(cqs_ids)
+
+    callback_url = get_callback_url()
+    sent = 0
+    try:
+        # more than one call only for a single submission with more than JUDGE0_BATCH_SIZE test cases
+        for i in range(0, len(pending), settings.JUDGE0_BATCH_SIZE):
+            chunk = pending[i:i + settings.JUDGE0_BATCH_SIZE]
+            if callback_url:
+                for _, submission in chunk:
+                    submission["callback_url"] = callback_url
+            node, data = pool.submit("/submissions/batch?base64_encoded=false",
+                                     {"submissions": [submission for _, submission in chunk]},
+                                     lane=REGRADE_LANE, count=len(chunk))
+            for (tca, _), x in zip(chunk, data):
+                tca.token = x['token']
+                tca.judge0_node = node.name
+            sent += len(chunk)
+    except requests.exceptions.RequestException:
+        if throttled:
+            refund_tokens([get_global_bucket()], len(pending) - sent)
+        # the test cases are created again when the regrade resumes, unless another worker advanced it in the meantime
+        # (they are then given up by the reconciler)
+        Regrade.objects.filter(id=regrade.id, last_cqs_id=batch[-1].id) \
+            .update(last_cqs_id=previous_cqs_id, submitted=F('submitted') - len(batch))
+        raise
+
+    if pending:
+        TestCaseAttempt.objects.bulk_update([tca for tca, _ in pending], ['token', 'judge0_node'])
+    return len(batch)
+
+
+def rescore_assessment_attempts(assessment):
+    """
+    Recomputes the score and best_attempt of the scored AssessmentAttempts of an assessment from the persisted scores
+    of their submissions, with grouped queries and one bulk update (see AssessmentAttempt.compute_score for one attempt),
+    then rebuilds their best attempts (see BestAttempt.rebuild).
+    """
+    attempts = list(AssessmentAttempt.objects.filter(assessment=assessment, score__isnull=False).order_by('id'))
+
+    # best submission of each code question attempt
+    code_scores = defaultdict(int)
+    best_submissions = CodeQuestionSubmission.objects \
+        .filter(cq_attempt__assessment_attempt__assessment=assessment, cq_attempt__assessment_attempt__score__isnull=False) \
+        .values('cq_attempt__assessment_attempt', 'cq_attempt').annotate(best_score=Max('score'))
+    for x in best_submissions:
+        code_scores[x['cq_attempt__assessment_attempt']] += x['best_score'] or 0
+
+    mcq_scores = dict(annotate_mcq_question_scores(McqQuestionAttempt.objects.filter(
+        assessment_attempt__assessment=assessment, assessment_attempt__score__isnull=False))
+        .values('assessment_attempt').annotate(score=Sum('earned_score')).values_list('assessment_attempt', 'score'))
+
+    for attempt in attempts:
+        attempt.score = code_scores[attempt.id] + (mcq_scores.get(attempt.id) or 0)
+
+    with transaction.atomic():
+        AssessmentAttempt.objects.bulk_update(attempts, ['score'], batch_size=500)
+        BestAttempt.rebuild(assessment)
+    return len(attempts)
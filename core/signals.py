@@ -2,7 +2,8 @@ from django.contrib.auth import user_logged_in
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 
-from core.models import QuestionBank
+from core.models import QuestionBank, CodeQuestion, SolutionOutputCache
+from core.views.utils import hash_text
 
 
 @receiver(post_save, sender=QuestionBank)
@@ -13,6 +14,13 @@ def clear_shared_with(sender, instance, created, **kwargs):
         instance.shared_with.clear()
 
 
+@receiver(post_save, sender=CodeQuestion)
+def clear_solution_output_cache(sender, instance, created, **kwargs):
+    # cached outputs of a previous version of the solution code can no longer be used
+    if not created:
+        SolutionOutputCache.objects.filter(code_question=instance).exclude(solution_hash=hash_text(instance.solution_code)).delete()
+
+
 @receiver(user_logged_in)
 def on_login(sender, user, request, **kwargs):
     """
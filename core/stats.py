@@ -0,0 +1,58 @@
+# vectorized statistics and histograms of report data (scores, time spent), see core/views/charts.py
+import numpy as np
+
+# percentiles included in describe()
+PERCENTILES = [25, 50, 75, 90]
+
+
+def to_array(values):
+    """
+    Float array of numbers from any iterable (list, dict values, values_list queryset or array).
+    """
+    if isinstance(values, np.ndarray):
+        return values.astype(float, copy=False)
+    return np.fromiter(values, dtype=float)
+
+
+def describe(values):
+    """
+    Count, mean, median, standard deviation, min, max and PERCENTILES of the values (0 for no values), rounded to 2
+    decimals. The percentiles (including the median) are computed together with a single partition of the array.
+    """
+    values = to_array(values)
+    if len(values) == 0:
+        stats = {"count": 0, "mean": 0, "median": 0, "std": 0, "min": 0, "max": 0}
+        stats.update({f"p{p}": 0 for p in PERCENTILES})
+        return stats
+
+    percentiles = np.percentile(values, PERCENTILES)
+    stats = {
+        "count": len(values),
+        "mean": round(float(values.mean()), 2),
+        "median": round(float(percentiles[PERCENTILES.index(50)]), 2),
+        "std": round(float(values.std()), 2),
+        "min": float(values.min()),
+        "max": float(values.max()),
+    }
+    stats.update({f"p{p}": round(float(x), 2) for p, x in zip(PERCENTILES, percentiles)})
+    return stats
+
+
+def histogram(values, mins, maxs):
+    """
+    Number of values in each bucket [mins[i], maxs[i]), the values equal to the max of the last bucket are counted in
+    it. Buckets must be sorted and must not overlap, values outside of all buckets are not counted.
+    Binning is a binary search of all values at once instead of a loop over the buckets for each value.
+    """
+    values = to_array(values)
+    mins = np.asarray(mins, dtype=float)
+    maxs = np.asarray(maxs, dtype=float)
+    if len(mins) == 0:
+        return []
+
+    index = np.searchsorted(mins, values, side="right") - 1
+    inside = index >= 0
+    inside[inside] = values[inside] < maxs[index[inside]]
+    counts = np.bincount(index[inside], minlength=len(mins))
+    counts[-1] += np.count_nonzero(values == maxs[-1])
+    return counts.tolist()
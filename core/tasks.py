@@ -1,48 +1,41 @@
 # celery tasks
-import requests
 import cv2
 import os
+from datetime import timedelta
 from celery import shared_task
 from insightface.app import FaceAnalysis
 from django.conf import settings
 from django.core import mail
+from django.db import transaction
+from django.db.models import Q
 from django.utils import timezone
 
-from core.models import TestCaseAttempt, CodeQuestionSubmission, AssessmentAttempt, CandidateSnapshot
+from core import admission, judge0, regrade
+from core.models import TestCaseAttempt, Assessment, AssessmentAttempt, CandidateSnapshot, Regrade
 
 @shared_task
 def update_test_case_attempt_status(tca_id: int, token: str):
     """
     Polls judge0 to get the status_id of a single submission (one test case)
     If status_id has been changed, save the change to db.
-    If the submission is still being processed, re-queue this task to be polled again later.
     """
-    try:
-        # call judge0
-        url = f"{settings.JUDGE0_URL}/submissions/{token}?base64_encoded=false&fields=status_id,stdout,time,memory"
-        res = requests.get(url)
-        data = res.json()
-
-        status_id = data.get('status_id')
-        stdout = data.get('stdout')
-        time = data.get('time')
-        memory = data.get('memory')
-
-        if status_id not in [1, 2]:
-            tca = TestCaseAttempt.objects.prefetch_related('cq_submission').get(id=tca_id)
-            tca.status = status_id
-            tca.stdout = stdout
-            tca.time = time
-            tca.memory = memory
-            tca.save()
-            # check if all test cases have been completed
-            finished = not TestCaseAttempt.objects.filter(cq_submission_id=tca.cq_submission.id, status__in=[1, 2]).exists()
-
-            # only continue if test cases are complete
-            if finished:
-                update_cqs_passed_flag.delay(tca.cq_submission.id)
-    except ConnectionError as e:
-        print(e.message)
+    judge0.refresh_test_case_attempts(TestCaseAttempt.objects.filter(id=tca_id, token=token))
+
+
+@shared_task
+def update_cq_submission_status(cqs_id):
+    """
+    Polls judge0 for all pending test cases of a CodeQuestionSubmission in one batched call.
+    """
+    judge0.refresh_test_case_attempts(TestCaseAttempt.objects.filter(cq_submission_id=cqs_id))
+
+
+@shared_task
+def update_assessment_test_case_statuses(assessment_id):
+    """
+    Polls judge0 for all pending test cases of an assessment, in batches of JUDGE0_BATCH_SIZE tokens.
+    """
+    judge0.refresh_test_case_attempts(TestCaseAttempt.objects.filter(cq_submission__cq_attempt__assessment_attempt__assessment_id=assessment_id))
 
 
 @shared_task
@@ -52,20 +45,91 @@ def update_cqs_passed_flag(cqs_id):
     Update the "passed" field of the CQS instance and initiates the computation of the submission score.
     If it was already calculated previously, nothing will be done.
     """
-    # # check if all test cases have been completed
-    # finished = not TestCaseAttempt.objects.filter(cq_submission_id=cqs_id, status__in=[1, 2]).exists()
+    judge0.update_cqs_passed_flag(cqs_id)
+
+
+@shared_task
+def reconcile_test_case_attempts():
+    """
+    Periodic task (CELERY_BEAT_SCHEDULE) that polls judge0 for test cases still pending, with per-token backoff.
+    """
+    judge0.reconcile_test_case_attempts()
+
+
+@shared_task
+def drain_submission_queue():
+    """
+    Sends queued submissions to judge0 at the rate allowed by the global token bucket (ADMISSION_GLOBAL_RATE).
+    Reschedules itself every ADMISSION_DRAIN_INTERVAL seconds until the queue is empty.
+    """
+    try:
+        admission.requeue_stalled_dispatches()
+        admission.dispatch_queued_submissions(judge0.get_pool())
+        admission.purge_dispatched(timezone.now() - timedelta(days=1))
+    finally:
+        # submissions claimed by a lost dispatch are put back in the queue by a later drain
+        if admission.pending_queue_size() or admission.get_dispatching().exists():
+            drain_submission_queue.apply_async(countdown=settings.ADMISSION_DRAIN_INTERVAL)
+
+
+@shared_task
+def run_regrade(regrade_id):
+    """
+    Advances a regrade (see core/regrade.py) and reschedules itself every REGRADE_INTERVAL seconds until it is finished.
+    A regrade that was interrupted (e.g. by a worker restart) is resumed by queueing this task again.
+    """
+    finished = False
+    try:
+        finished = regrade.advance_regrade(Regrade.objects.get(id=regrade_id), judge0.get_pool())
+    except Regrade.DoesNotExist:
+        finished = True
+    finally:
+        if not finished:
+            run_regrade.apply_async((regrade_id,), countdown=settings.REGRADE_INTERVAL)
+
+
+@shared_task
+def submit_expired_attempts():
+    """
+    Periodic task (CELERY_BEAT_SCHEDULE) for the server-side submission of assessments.
+    This ensures that AssessmentAttempts are marked as submitted when their duration runs out (plus
+    AUTO_SUBMIT_GRACE_PERIOD seconds), even if the user is not on the assessment page.
+    Expired attempts are found and submitted in bulk, then scored by compute_assessment_attempt_scores in batches of
+    AUTO_SUBMIT_BATCH_SIZE attempts (together with submitted attempts whose score was missed, see
+    AssessmentAttempt.get_unscored_attempts).
+    """
+    now = timezone.now()
+    grace_period = timedelta(seconds=settings.AUTO_SUBMIT_GRACE_PERIOD)
+
+    # one condition per distinct duration of the assessments that have open attempts (if duration is 0, unlimited time)
+    durations = Assessment.objects.filter(duration__gt=0, assessmentattempt__time_submitted__isnull=True) \
+        .values_list('duration', flat=True).distinct()
+    expired = Q()
+    for duration in durations:
+        expired |= Q(assessment__duration=duration, time_started__lt=now - timedelta(minutes=duration) - grace_period)
+
+    attempt_ids = []
+    if expired:
+        with transaction.atomic():
+            attempts = AssessmentAttempt.objects.select_for_update(skip_locked=True, of=('self',)) \
+                .filter(expired, time_submitted__isnull=True)
+            attempt_ids = list(attempts.values_list('id', flat=True))
+            AssessmentAttempt.objects.filter(id__in=attempt_ids).update(auto_submit=True, time_submitted=now)
 
-    # # only continue if test cases are complete
-    # if finished:
-    # get cqs object
-    cqs = CodeQuestionSubmission.objects.get(id=cqs_id)
+    # queue tasks to compute the scores of these AssessmentAttempts, and of submitted attempts whose score was not
+    # computed when their last submission finished (e.g. it finished while the attempt was being submitted)
+    attempt_ids += list(AssessmentAttempt.get_unscored_attempts().exclude(id__in=attempt_ids).values_list('id', flat=True))
+    for i in range(0, len(attempt_ids), settings.AUTO_SUBMIT_BATCH_SIZE):
+        compute_assessment_attempt_scores.delay(attempt_ids[i:i + settings.AUTO_SUBMIT_BATCH_SIZE])
 
-    # only continue if it was not previously calculated
-    if cqs.passed is None:
-        # update the passed flag
-        passed = not TestCaseAttempt.objects.filter(cq_submission_id=cqs_id, status__range=(4, 14)).exists()
-        cqs.passed = passed
-        cqs.save()
+
+@shared_task
+def compute_assessment_attempt_scores(assessment_attempt_ids):
+    """
+    Computes the scores of many AssessmentAttempts (see compute_assessment_attempt_score).
+    """
+    for assessment_attempt_id in assessment_attempt_ids:
+        compute_assessment_attempt_score(assessment_attempt_id)
 
 
 @shared_task
@@ -75,6 +139,7 @@ def force_submit_assessment(assessment_attempt_id):
     This ensures that an AssessmentAttempt will be marked as submitted when the duration runs out, even if the user is not on the
     assessment page.
     If the AssessmentAttempt was already submitted previously (i.e. by the user), nothing will be done.
+    Attempts are now submitted by submit_expired_attempts, this task only handles the ETA messages queued before.
     """
     try:
         assessment_attempt = AssessmentAttempt.objects.get(id=assessment_attempt_id, time_submitted=None)
@@ -93,18 +158,13 @@ def compute_assessment_attempt_score(assessment_attempt_id):
     """
     This task is queued when an AssessmentAttempt has been submitted (both user-initiated and server-side)
     This tasks calculates the total score of the AssessmentAttempt, and determines if it is the best attempt.
-    If the AssessmentAttempt contains a submission that is still being processed, the task will be delayed.
+    If the AssessmentAttempt contains a submission that is still being processed, nothing is done: the score is computed
+    when its last submission is finished (see judge0.update_cqs_passed_flag).
     """
     try:
         # get the instance
         assessment_attempt = AssessmentAttempt.objects.get(id=assessment_attempt_id)
-        
-        # if all test cases are complete, proceed to compute score
-        if not assessment_attempt.has_processing_submission():
-            assessment_attempt.compute_score()
-        # if still processing, queue it again with a 5s delay
-        else:
-            compute_assessment_attempt_score.apply_async((assessment_attempt_id,), countdown=5)
+        assessment_attempt.compute_score_if_complete()
     except:
         pass
 
@@ -1,3 +1,430 @@
-from django.test import TestCase
+import base64
+import json
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import requests
+
+from django.contrib.auth.models import Group
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core import judge0, tasks
+from core.admission import get_global_bucket, get_user_bucket
+from core.concurrency import HARNESSES
+from core.models import User, Course, Assessment, AssessmentAttempt, BestAttempt, CodeQuestion, TestCase as CodeTestCase, Language, \
+    CodeQuestionAttempt, CodeQuestionSubmission, TestCaseAttempt, McqQuestion, McqQuestionOption, McqQuestionAttempt, \
+    McqQuestionAttemptOption, RateLimitBucket
+
+
+class ConcurrencyHarnessTests(SimpleTestCase):
+    """
+    Insertion of the harness prologue at the entry point of C/C++ code, see ConcurrencyHarness.instrument.
+    """
+
+    def setUp(self):
+        self.harness = HARNESSES[75]
+        self.prologue = self.harness.main_prologue
+
+    def instrument(self, code, harness=None):
+        """
+        Returns the instrumented code without its prelude.
+        """
+        harness = harness or self.harness
+        instrumented = harness.instrument(code, 2)
+        prelude = harness.get_prelude(2)
+        self.assertTrue(instrumented.startswith(prelude))
+        return instrumented[len(prelude):]
+
+    def test_main_void_with_brace_on_next_line(self):
+        code = "int main(void)\n{\n    return 0;\n}\n"
+        self.assertEqual(self.instrument(code), f"int main(void)\n{{ {self.prologue}\n    return 0;\n}}\n")
+
+    def test_main_with_arguments(self):
+        code = "#include <stdio.h>\n\nint main(int argc, char *argv[]) {\n    return 0;\n}\n"
+        self.assertEqual(self.instrument(code),
+                         f"#include <stdio.h>\n\nint main(int argc, char *argv[]) {{ {self.prologue}\n    return 0;\n}}\n")
+
+    def test_main_in_comments_and_strings_is_skipped(self):
+        code = (
+            "// int main() { is the entry point\n"
+            "/* int main(void)\n{ } */\n"
+            "const char *usage = \"int main() {\";\n"
+            "char quote = '\"';\n"
+            "int main() {\n"
+            "    return 0;\n"
+            "}\n"
+        )
+        instrumented = self.instrument(code)
+        entry_point = code.rindex("int main() {") + len("int main() {")
+        self.assertEqual(instrumented, code[:entry_point] + " " + self.prologue + code[entry_point:])
+
+    def test_code_without_main(self):
+        code = "void *worker(void *args) {\n    return NULL;\n}\n"
+        self.assertEqual(self.instrument(code), code)
+
+    def test_prologue_inserted_once(self):
+        code = "int main() {\n    return 0;\n}\n\nint main() {\n    return 1;\n}\n"
+        for harness in [HARNESSES[75], HARNESSES[76]]:
+            instrumented = self.instrument(code, harness)
+            self.assertEqual(instrumented.count(harness.main_prologue), 1)
+            self.assertTrue(instrumented.startswith(f"int main() {{ {harness.main_prologue}\n"))
+
+
+class ComputeScoreQueryTests(TestCase):
+    """
+    AssessmentAttempt.compute_score runs a constant number of queries, however many submissions were made.
+    """
+
+    # score of the code questions, score of the mcq questions, save, best attempt upsert and select, best_attempt flags
+    QUERIES = 6
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.candidate = User.objects.create(username="STUDENT", email="STUDENT@EXAMPLE.COM", first_name="A", last_name="B")
+        course = Course.objects.create(name="Course", code="CS1010", year=2022)
+        cls.assessment = Assessment.objects.create(course=course, name="Assessment", duration=0, num_attempts=0,
+                                                   instructions="-")
+        cls.language = Language.objects.get(judge_language_id=75)
+        cls.code_questions = []
+        for i in range(2):
+            code_question = CodeQuestion.objects.create(name=f"Question {i}", description="-", assessment=cls.assessment)
+            test_cases = [CodeTestCase.objects.create(code_question=code_question, stdin=str(j), stdout=str(j), score=j + 1)
+                          for j in range(3)]
+            cls.code_questions.append((code_question, test_cases))
+        cls.mcq_question = McqQuestion.objects.create(name="Mcq", description="-", score=4, assessment=cls.assessment)
+        cls.mcq_option = McqQuestionOption.objects.create(mcq_question=cls.mcq_question, content="yes", correct=True)
+
+    def create_attempt(self, submissions):
+        """
+        Scored attempt with the given number of submissions per code question, the test cases of the last one are
+        accepted.
+        """
+        attempt = AssessmentAttempt.objects.create(candidate=self.candidate, assessment=self.assessment)
+        for code_question, test_cases in self.code_questions:
+            cq_attempt = CodeQuestionAttempt.objects.create(assessment_attempt=attempt, code_question=code_question)
+            for i in range(submissions):
+                cq_submission = CodeQuestionSubmission.objects.create(cq_attempt=cq_attempt, code="-", language=self.language)
+                status = 3 if i == submissions - 1 else 4
+                TestCaseAttempt.objects.bulk_create([TestCaseAttempt(cq_submission=cq_submission, test_case=test_case,
+                                                                     token=f"token-{i}", status=status)
+                                                     for test_case in test_cases])
+        mcq_attempt = McqQuestionAttempt.objects.create(assessment_attempt=attempt, mcq_question=self.mcq_question)
+        McqQuestionAttemptOption.objects.create(mcq_attempt=mcq_attempt, selected_option=self.mcq_option)
+        return attempt
+
+    def test_one_submission(self):
+        attempt = self.create_attempt(1)
+        with self.assertNumQueries(self.QUERIES):
+            attempt.compute_score()
+        self.assertEqual(attempt.score, 2 * (1 + 2 + 3) + 4)
+        self.assertTrue(attempt.best_attempt)
+
+    def test_many_submissions(self):
+        attempt = self.create_attempt(10)
+        with self.assertNumQueries(self.QUERIES):
+            attempt.compute_score()
+        self.assertEqual(attempt.score, 2 * (1 + 2 + 3) + 4)
+        self.assertTrue(attempt.best_attempt)
+
+
+class BestAttemptUpsertTests(TestCase):
+    """
+    BestAttempt.upsert keeps the same best attempt as BestAttempt.rebuild.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.candidate = User.objects.create(username="STUDENT", email="STUDENT@EXAMPLE.COM", first_name="A", last_name="B")
+        course = Course.objects.create(name="Course", code="CS1010", year=2022)
+        cls.assessment = Assessment.objects.create(course=course, name="Assessment", duration=0, num_attempts=0,
+                                                   instructions="-")
+
+    def score(self, attempt, score):
+        attempt.score = score
+        attempt.save()
+        return BestAttempt.upsert(attempt)
+
+    def assertRebuiltBestAttempt(self, best_attempt_id):
+        BestAttempt.rebuild(self.assessment)
+        self.assertEqual(BestAttempt.objects.get(assessment=self.assessment).assessment_attempt_id, best_attempt_id)
+
+    def test_tie_keeps_earliest_attempt(self):
+        first, second = [AssessmentAttempt.objects.create(candidate=self.candidate, assessment=self.assessment)
+                         for _ in range(2)]
+        # scored in reverse order
+        self.assertEqual(self.score(second, 5), second.id)
+        self.assertEqual(self.score(first, 5), first.id)
+        self.assertRebuiltBestAttempt(first.id)
+
+    def test_lower_rescore_moves_best_attempt(self):
+        first, second = [AssessmentAttempt.objects.create(candidate=self.candidate, assessment=self.assessment)
+                         for _ in range(2)]
+        self.score(first, 3)
+        self.assertEqual(self.score(second, 8), second.id)
+        # e.g. regraded against harder test cases
+        self.assertEqual(self.score(second, 1), first.id)
+        self.assertEqual(BestAttempt.objects.get(assessment=self.assessment).score, 3)
+        self.assertEqual(list(AssessmentAttempt.objects.filter(best_attempt=True).values_list('id', flat=True)), [first.id])
+        self.assertRebuiltBestAttempt(first.id)
+
+    def test_higher_rescore_updates_score(self):
+        attempt = AssessmentAttempt.objects.create(candidate=self.candidate, assessment=self.assessment)
+        self.score(attempt, 3)
+        self.assertEqual(self.score(attempt, 6), attempt.id)
+        self.assertEqual(BestAttempt.objects.get(assessment=self.assessment).score, 6)
+
+
+class Judge0CallbackTests(TestCase):
+    """
+    Results pushed by judge0 to judge0_callback, and their interplay with polling (refresh_test_case_attempts).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        candidate = User.objects.create(username="STUDENT", email="STUDENT@EXAMPLE.COM", first_name="A", last_name="B")
+        course = Course.objects.create(name="Course", code="CS1010", year=2022)
+        assessment = Assessment.objects.create(course=course, name="Assessment", duration=0, num_attempts=0,
+                                               instructions="-")
+        code_question = CodeQuestion.objects.create(name="Question", description="-", assessment=assessment)
+        cls.test_cases = [CodeTestCase.objects.create(code_question=code_question, stdin=str(i), stdout=str(i), score=i + 1)
+                          for i in range(2)]
+        attempt = AssessmentAttempt.objects.create(candidate=candidate, assessment=assessment)
+        cls.cq_attempt = CodeQuestionAttempt.objects.create(assessment_attempt=attempt, code_question=code_question)
+        cls.language = Language.objects.get(judge_language_id=75)
+
+    def setUp(self):
+        self.cq_submission = CodeQuestionSubmission.objects.create(cq_attempt=self.cq_attempt, code="-",
+                                                                   language=self.language)
+        self.tcas = [TestCaseAttempt.objects.create(cq_submission=self.cq_submission, test_case=test_case,
+                                                    token=f"token-{i}")
+                     for i, test_case in enumerate(self.test_cases)]
+
+    def callback(self, token, status_id, stdout="", key=None):
+        data = {
+            "token": token,
+            "status": {"id": status_id},
+            "stdout": base64.b64encode(stdout.encode()).decode(),
+            "time": "0.01",
+            "memory": 1024,
+        }
+        url = f"{reverse('judge0-callback')}?key={key or judge0.get_callback_key()}"
+        return self.client.put(url, json.dumps(data), content_type="application/json")
+
+    def poll(self, results):
+        """
+        Polls judge0 for the pending test cases of the submission, judge0 returning the given results by token.
+        """
+        fetched = {token: {"status_id": status_id, "stdout": "", "stderr": None, "time": 0.01, "memory": 1024}
+                   for token, status_id in results.items()}
+        with mock.patch.object(judge0, "fetch_submissions", lambda tokens, node_name=None: fetched):
+            return judge0.refresh_test_case_attempts(TestCaseAttempt.objects.filter(cq_submission=self.cq_submission))
+
+    def assertStatuses(self, statuses):
+        self.assertEqual([tca.status for tca in TestCaseAttempt.objects.filter(cq_submission=self.cq_submission)
+                          .order_by('id')], statuses)
+
+    def test_invalid_key(self):
+        response = self.callback("token-0", 3, key="invalid")
+        self.assertEqual(response.status_code, 403)
+        self.assertStatuses([1, 1])
+
+    def test_unknown_token(self):
+        response = self.callback("unknown", 3)
+        self.assertEqual(response.status_code, 404)
+
+    def test_callbacks_finish_submission(self):
+        self.assertEqual(self.callback("token-0", 3).status_code, 200)
+        self.cq_submission.refresh_from_db()
+        self.assertIsNone(self.cq_submission.passed)
+
+        self.assertEqual(self.callback("token-1", 4).status_code, 200)
+        self.assertStatuses([3, 4])
+        self.cq_submission.refresh_from_db()
+        self.assertFalse(self.cq_submission.passed)
+        self.assertEqual(self.cq_submission.score, 1)
+        self.assertEqual(self.cq_submission.passed_count, 1)
+
+    def test_duplicate_callback_is_ignored(self):
+        self.callback("token-0", 3)
+        response = self.callback("token-0", 4)
+        self.assertEqual(response.status_code, 200)
+        self.assertStatuses([3, 1])
+
+    def test_late_callback_after_poll_is_ignored(self):
+        self.assertEqual(len(self.poll({"token-0": 3, "token-1": 2})), 1)
+        response = self.callback("token-0", 4)
+        self.assertEqual(response.status_code, 200)
+        self.assertStatuses([3, 1])
+
+    def test_last_test_cases_finished_by_callback_and_poll(self):
+        self.callback("token-0", 3)
+        self.poll({"token-1": 3})
+        self.assertStatuses([3, 3])
+        self.cq_submission.refresh_from_db()
+        self.assertTrue(self.cq_submission.passed)
+        self.assertEqual(self.cq_submission.score, 3)
+
+    def test_last_test_cases_finished_by_poll_and_callback(self):
+        self.poll({"token-0": 3, "token-1": 2})
+        self.callback("token-1", 3)
+        self.cq_submission.refresh_from_db()
+        self.assertTrue(self.cq_submission.passed)
+
+    def test_reconciler_finishes_completed_submission(self):
+        # the results were saved but the submission was not finished, e.g. by concurrent transactions
+        TestCaseAttempt.objects.filter(cq_submission=self.cq_submission).update(status=3)
+        CodeQuestionSubmission.objects.filter(id=self.cq_submission.id) \
+            .update(time_submitted=timezone.now() - timedelta(minutes=1))
+        judge0.reconcile_test_case_attempts()
+        self.cq_submission.refresh_from_db()
+        self.assertTrue(self.cq_submission.passed)
+
+
+@override_settings(ADMISSION_CONTROL=False)
+class TestCaseRunTests(TestCase):
+    """
+    Runs that are not stored (submit_single_test_case and get_tc_details). The expected output of runs with custom
+    inputs is the cached output of the solution code.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="STUDENT", email="STUDENT@EXAMPLE.COM", first_name="A", last_name="B")
+        Group.objects.get(name="student").user_set.add(cls.user)
+        course = Course.objects.create(name="Course", code="CS1010", year=2022)
+        assessment = Assessment.objects.create(course=course, name="Assessment", duration=0, num_attempts=0,
+                                               instructions="-")
+        language = Language.objects.get(judge_language_id=75)
+        code_question = CodeQuestion.objects.create(name="Question", description="-", assessment=assessment,
+                                                    solution_code="solution", solution_code_language=language)
+        cls.test_case = CodeTestCase.objects.create(code_question=code_question, stdin="1", stdout="1", score=1)
+        cls.url = reverse('submit-single-test-case', args=[cls.test_case.id, code_question.id])
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.runs = []
+        self.results = {}
+        self.fetched = []
+
+    def submit(self, node_url, params, lane=None):
+        self.runs.append(params)
+        return None, {"token": f"token-{len(self.runs)}"}
+
+    def fetch(self, url):
+        self.fetched.append(url)
+        return self.results[url.split("?")[0].rpartition("/")[2]]
+
+    def run_custom_input(self):
+        """
+        Runs the code with a custom input, returns the token.
+        """
+        pool = mock.Mock(submit=self.submit, qualify_token=lambda node, token: token)
+        with mock.patch('core.views.attempts.get_pool', return_value=pool):
+            response = self.client.post(self.url, {"run_stdin": "2", "lang-id": 75, "code": "code"})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['token']
+
+    def get_details(self, token):
+        client = mock.Mock(get=self.fetch)
+        with mock.patch('core.views.attempts.get_token_client', lambda token: (token, client)):
+            response = self.client.get(reverse('get-tc-details'), {"token": token, "status_only": "true"})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['data']
+
+    def test_second_run_uses_cached_solution_output(self):
+        token = self.run_custom_input()
+        self.assertEqual(token, "token-1:token-2")
+        # the solution code is run without the expected output of the sample test case
+        self.assertIsNone(self.runs[1]["expected_output"])
+
+        self.results = {
+            "token-1": {"status_id": 3, "stdout": "4\n"},
+            "token-2": {"status_id": 3, "stdin": "2", "stdout": "4\n", "stderr": None},
+        }
+        self.assertEqual(self.get_details(token)["status_id"], 3)
+
+        self.assertEqual(self.run_custom_input(), "token-3")
+        self.assertEqual(len(self.runs), 3)
+        self.assertEqual(self.runs[2]["expected_output"], "4\n")
+
+    def test_status_of_concurrency_run(self):
+        self.results = {"token-1": {"status_id": 3, "stderr": "AASP_1_THREADS_CREATED_INSUFFICIENT"}}
+        self.assertEqual(self.get_details("token-1")["status_id"], 15)
+        self.assertIn("fields=status_id,stderr", self.fetched[0])
+
+
+@override_settings(ADMISSION_CONTROL=True)
+class SubmissionAdmissionTests(TestCase):
+    """
+    Tokens charged by admission control for submissions of code questions (code_question_submission).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="STUDENT", email="STUDENT@EXAMPLE.COM", first_name="A", last_name="B")
+        Group.objects.get(name="student").user_set.add(cls.user)
+        course = Course.objects.create(name="Course", code="CS1010", year=2022)
+        assessment = Assessment.objects.create(course=course, name="Assessment", duration=0, num_attempts=0,
+                                               instructions="-")
+        code_question = CodeQuestion.objects.create(name="Question", description="-", assessment=assessment)
+        for i in range(2):
+            CodeTestCase.objects.create(code_question=code_question, stdin=str(i), stdout=str(i), score=1)
+        attempt = AssessmentAttempt.objects.create(candidate=cls.user, assessment=assessment)
+        cls.cq_attempt = CodeQuestionAttempt.objects.create(assessment_attempt=attempt, code_question=code_question)
+
+    def test_tokens_refunded_when_judge0_is_down(self):
+        self.client.force_login(self.user)
+        pool = mock.Mock(submit=mock.Mock(side_effect=requests.exceptions.ConnectionError()))
+        with mock.patch('core.views.attempts.get_pool', return_value=pool):
+            response = self.client.post(reverse('code-question-submission', args=[self.cq_attempt.id]), {
+                "lang-id": 75,
+                "code": "code",
+                "start_time": timezone.localtime().strftime("%Y-%m-%d %H:%M:%S"),
+            })
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(pool.submit.call_args.kwargs["count"], 2)
+        self.assertFalse(CodeQuestionSubmission.objects.exists())
+        for key, rate, capacity in [get_user_bucket(self.user), get_global_bucket()]:
+            self.assertAlmostEqual(RateLimitBucket.objects.get(key=key).tokens, capacity, delta=1)
+
+
+@override_settings(AUTO_SUBMIT_GRACE_PERIOD=30, AUTO_SUBMIT_BATCH_SIZE=100)
+class SubmitExpiredAttemptsTests(TestCase):
+    """
+    Server-side submission of the attempts whose duration ran out (submit_expired_attempts).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.candidate = User.objects.create(username="STUDENT", email="STUDENT@EXAMPLE.COM", first_name="A",
+                                            last_name="B")
+        course = Course.objects.create(name="Course", code="CS1010", year=2022)
+        cls.timed = Assessment.objects.create(course=course, name="Timed", duration=10, num_attempts=0,
+                                              instructions="-")
+        cls.unlimited = Assessment.objects.create(course=course, name="Unlimited", duration=0, num_attempts=0,
+                                                  instructions="-")
+
+    def create_attempt(self, assessment, started_ago, **kwargs):
+        attempt = AssessmentAttempt.objects.create(candidate=self.candidate, assessment=assessment, **kwargs)
+        AssessmentAttempt.objects.filter(id=attempt.id).update(time_started=timezone.now() - started_ago)
+        return attempt
+
+    def test_expired_attempts_are_submitted(self):
+        expired = self.create_attempt(self.timed, timedelta(minutes=11))
+        in_grace_period = self.create_attempt(self.timed, timedelta(minutes=10, seconds=10))
+        unlimited = self.create_attempt(self.unlimited, timedelta(days=1))
+        unscored = self.create_attempt(self.timed, timedelta(minutes=5), time_submitted=timezone.now())
+        self.create_attempt(self.timed, timedelta(minutes=5), time_submitted=timezone.now(), score=0)
+
+        with mock.patch.object(tasks.compute_assessment_attempt_scores, "delay") as delay:
+            tasks.submit_expired_attempts()
+
+        expired.refresh_from_db()
+        self.assertTrue(expired.auto_submit)
+        self.assertIsNotNone(expired.time_submitted)
+        for attempt in [in_grace_period, unlimited]:
+            attempt.refresh_from_db()
+            self.assertIsNone(attempt.time_submitted)
+        delay.assert_called_once_with([expired.id, unscored.id])
@@ -94,6 +94,7 @@ urlpatterns = [
     path('api/get-tc-details/', attempts.get_tc_details, name='get-tc-details'),  # ajax
     path('api/code-question-submission/<int:code_question_attempt_id>/', attempts.code_question_submission, name='code-question-submission'),  # ajax
     path('api/get-cq-submission-status/', attempts.get_cq_submission_status, name='get-cq-submission-status'),  # ajax
+    path('api/judge0-callback/', attempts.judge0_callback, name='judge0-callback'),  # judge0
 
     # reports
     path('course/report/<int:course_id>/', reports.course_report, name='course-report'),
@@ -1,6 +1,5 @@
-from datetime import timedelta, datetime
+from datetime import datetime
 
-import re
 import base64
 import cv2
 import requests
@@ -17,7 +16,7 @@ from django.utils import timezone
 from insightface.app import FaceAnalysis
 from rest_framework import status
 from rest_framework.response import Response
-from rest_framework.decorators import api_view, renderer_classes
+from rest_framework.decorators import api_view, renderer_classes, authentication_classes, permission_classes
 from rest_framework.renderers import JSONRenderer
 
 from core.decorators import groups_allowed, UserGroup
@@ -25,9 +24,13 @@ from core.models import Assessment, AssessmentAttempt, \
     CodeQuestionAttempt, CodeQuestion, TestCase, CodeSnippet, CodeQuestionAttemptSnippet, CodeQuestionSubmission, TestCaseAttempt, Language, \
     McqQuestion, McqQuestionOption, McqQuestionAttempt, McqQuestionAttemptOption, \
     CandidateSnapshot
-from core.tasks import update_test_case_attempt_status, force_submit_assessment, detect_faces
-from core.views.utils import get_assessment_attempt_question, check_permissions_course, user_enrolled_in_course, construct_expected_output_judge0_params, construct_judge0_params, decode_judge0_params
-from core.concurrency import evaluate_concurrency_results, get_max_threads_used
+from core.tasks import detect_faces
+from core.views.utils import get_assessment_attempt_question, check_permissions_course, user_enrolled_in_course, construct_expected_output_judge0_params, construct_judge0_params, decode_judge0_params, \
+    get_cached_solution_output, reserve_solution_output_cache, save_solution_output, get_submission_lane, queue_judge0_submissions, rate_limited_response, queue_full_response
+from core.concurrency import evaluate_concurrency_results, has_concurrency_markers
+from core.admission import admit, release, RateLimited, QueueFull, get_queued_token, is_queued_token, resolve_queued_token, get_submission_queue_position
+from core.judge0 import get_pool, get_token_client, NODE_TOKEN_SEPARATOR, PENDING_STATUSES, get_callback_url, verify_callback_key, parse_callback_data, save_test_case_result, refresh_test_case_attempts, polling_needed, outputs_match, \
+    result_reuse_enabled, get_result_key, find_reusable_results, copy_test_case_result, update_finished_submissions, get_sending_token, is_sending_token
 
 @login_required()
 @groups_allowed(UserGroup.educator, UserGroup.lab_assistant, UserGroup.student)
@@ -190,12 +193,8 @@ def generate_assessment_attempt(user, assessment):
         cq_attempts = [CodeQuestionAttempt(assessment_attempt=assessment_attempt, code_question=cq) for cq in code_questions]
         CodeQuestionAttempt.objects.bulk_create(cq_attempts)
 
-    # queue celery task to automatically submit the attempt when duration has lapsed (30 seconds grace period)
-    # ensures that the attempt is automatically submitted even if the user has closed the page
-    duration = assessment_attempt.assessment.duration
-    if duration != 0:  # if duration is 0 (unlimited time), no need to auto submit
-        auto_submission_time = timezone.now() + timedelta(minutes=duration) + timedelta(seconds=30)
-        force_submit_assessment.apply_async((assessment_attempt.id,), eta=auto_submission_time)
+    # the attempt is automatically submitted when its duration has lapsed by the submit_expired_attempts periodic task,
+    # even if the user has closed the page
 
     return assessment_attempt
 
@@ -391,6 +390,10 @@ def submit_single_test_case(request, test_case_id, code_question_id):
     Submits a single test case to judge0 for execution, returns the token.
     This is used for the "Compile and Run" option for users to run the sample test case.
     This submission is not stored in the database.
+
+    For custom inputs, the solution code and the user's code are submitted together and a composite token
+    "<token>:<expected_output_token>" is returned. get_tc_details resolves the expected output once both are finished.
+    Outputs of the solution code are cached (see SolutionOutputCache), so it only runs once per distinct input.
     """
     try:
         if request.method == "POST":
@@ -416,8 +419,12 @@ def submit_single_test_case(request, test_case_id, code_question_id):
                 test_case.min_threads = request.data.get("run_min_threads")
 
             # evaluate expected_output using judge0 for custom inputs
+            expected_output_params = None
             if request.data.get("run_stdin") != test_case.stdin:
                 test_case.stdin = request.data["run_stdin"]
+                # the expected output is not known yet, the solution code is run without one and the output is compared
+                # by get_tc_details instead of judge0
+                test_case.stdout = None
                 expected_output_params = construct_expected_output_judge0_params(test_case)
                 if expected_output_params is None:
                     context = {
@@ -425,25 +432,12 @@ def submit_single_test_case(request, test_case_id, code_question_id):
                         "message": "No solution code provided for custom test cases.",
                     }
                     return Response(context, status=status.HTTP_400_BAD_REQUEST)
-                # call judge0
-                url = settings.JUDGE0_URL + "/submissions/?base64_encoded=false&wait=false"
-                res = requests.post(url, json=expected_output_params)
-                data = res.json()
 
-                # return error if no token
-                token = data.get("token")
-                if not token:
-                    error_context = {
-                        "result": "error",
-                        "message": "Judge0 error.",
-                    }
-                    return Response(error_context, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-                # wait for expected_output to be evaluated
-                expected_output_result = check_tc_result(token)
-                while expected_output_result["status_id"] in [1, 2]:
-                    expected_output_result = check_tc_result(token)
-                test_case.stdout = expected_output_result['stdout']
+                # reuse the output of the solution code if it was already run with this input
+                cached_output = get_cached_solution_output(test_case)
+                if cached_output is not None:
+                    test_case.stdout = cached_output
+                    expected_output_params = None
 
             lang_id = int(request.POST.get('lang-id'))
             if not test_case.code_question.is_software_language and test_case.code_question.hdlquestionconfig.get_question_type() == 'Module and Testbench Design':
@@ -452,27 +446,52 @@ def submit_single_test_case(request, test_case_id, code_question_id):
             else:
                 code = request.POST.get('code')
             params = construct_judge0_params(code, lang_id, test_case)
-            
+            runs = [params, expected_output_params] if expected_output_params else [params]
+
+            # judge0 is saturated, the runs are sent to judge0 once it is their turn
+            lane = get_submission_lane(request.user, "run")
+            if not admit(request.user, len(runs), lane):
+                # reserved with the placeholder token in the same transaction, so that the drain replaces it
+                with transaction.atomic():
+                    queued_submission, position = queue_judge0_submissions(request.user, "run", lane, runs)
+                    if expected_output_params:
+                        reserve_solution_output_cache(test_case, get_queued_token(queued_submission, 1))
+                context = {
+                    "result": "success",
+                    "token": get_queued_token(queued_submission),
+                    "queued": True,
+                    "position": position,
+                    "message": f"Queued, position {position}",
+                }
+                return Response(context, status=status.HTTP_200_OK)
+
             # call judge0
-            url = settings.JUDGE0_URL + "/submissions/?base64_encoded=false&wait=false"
-            res = requests.post(url, json=params)
-            data = res.json()
+            tokens = []
+            for run in runs:
+                node, data = get_pool().submit("/submissions/?base64_encoded=false&wait=false", run, lane=lane)
 
-            # return error if no token
-            token = data.get("token")
-            if not token:
-                error_context = {
-                    "result": "error",
-                    "message": "Judge0 error.",
-                }
-                return Response(error_context, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                # return error if no token
+                if not data.get("token"):
+                    error_context = {
+                        "result": "error",
+                        "message": "Judge0 error.",
+                    }
+                    return Response(error_context, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                tokens.append((node, data["token"]))
+
+            if expected_output_params:
+                reserve_solution_output_cache(test_case, tokens[1][1])
 
             context = {
                 "result": "success",
-                "token": token,
+                "token": ":".join(get_pool().qualify_token(node, token) for node, token in tokens),
             }
             return Response(context, status=status.HTTP_200_OK)
-    except requests.exceptions.ConnectionError:
+    except RateLimited:
+        return rate_limited_response()
+    except QueueFull:
+        return queue_full_response()
+    except requests.exceptions.RequestException:
         error_context = {
             "result": "error",
             "message": "Judge0 API seems to be down.",
@@ -484,11 +503,6 @@ def submit_single_test_case(request, test_case_id, code_question_id):
             "message": f"{ex}",
         } 
         return Response(error_context, status=status.HTTP_400_BAD_REQUEST)
-    
-    finally:
-        # delete zip file
-        if os.path.exists('submission.zip'):
-            os.remove('submission.zip')
 
 
 @api_view(["GET"])
@@ -500,6 +514,7 @@ def get_tc_details(request):
     Retrieves the status_id of a submission from Judge0, given a judge0 token.
     - Used for checking the status of a submitted sample test case => status_only=true
     - Used for viewing the details of a submitted test case (in the test case details modal) => status_only=false
+    - Accepts the composite "<token>:<expected_output_token>" returned by submit_single_test_case for custom inputs
     """
 
     try:
@@ -511,16 +526,42 @@ def get_tc_details(request):
             if not token:
                 return Response({ "result": "error" }, status=status.HTTP_400_BAD_REQUEST)
 
+            # test cases that are being sent to judge0 do not have a judge0 token yet
+            if is_sending_token(token):
+                context = {
+                    "result": "success",
+                    "data": {
+                        "status_id": 1,
+                        "status": "In Queue",
+                    },
+                }
+                return Response(context, status=status.HTTP_200_OK)
+
+            # runs that are still queued do not have a judge0 token yet
+            if is_queued_token(token):
+                token, position = resolve_queued_token(token)
+                if not token:
+                    context = {
+                        "result": "success",
+                        "data": {
+                            "status_id": 1,
+                            "status": f"Queued, position {position}",
+                            "position": position,
+                        },
+                    }
+                    return Response(context, status=status.HTTP_200_OK)
+            token, _, expected_output_token = token.partition(":")
+
             # call judge0
             try:
-                data = check_tc_result(token, status_only, vcd)
+                data = check_tc_result(token, status_only, vcd, expected_output_token or None)
                 context = {
                     "result": "success",
                     "data": data,
                 }
                 return Response(context, status=status.HTTP_200_OK)
 
-            except requests.exceptions.ConnectionError:
+            except requests.exceptions.RequestException:
                 error_context = {
                     "result": "error",
                     "message": "Judge0 API seems to be down.",
@@ -534,7 +575,7 @@ def get_tc_details(request):
         } 
         return Response(error_context, status=status.HTTP_400_BAD_REQUEST)
 
-def check_tc_result(token, status_only = False, vcd = False):
+def check_tc_result(token, status_only = False, vcd = False, expected_output_token = None):
     # friendly names of status_ids
     judge0_statuses = {
         1: "In Queue",
@@ -556,36 +597,64 @@ def check_tc_result(token, status_only = False, vcd = False):
         17: "Exceeded Threads Limit",
     }
     try:
+        # custom input, the expected output is the output of the solution code
+        if expected_output_token:
+            expected_output_result = check_tc_result(expected_output_token)
+            if expected_output_result['status_id'] in PENDING_STATUSES:
+                return {
+                    "status_id": expected_output_result['status_id'],
+                    "status": expected_output_result['status'],
+                }
+            # cache the output of any run that finished without an error (Accepted, or Wrong Answer for older runs that
+            # were sent with an expected output)
+            if expected_output_result['status_id'] in [3, 4]:
+                save_solution_output(expected_output_token.partition(NODE_TOKEN_SEPARATOR)[0], expected_output_result['stdout'])
+
+        # status lookups go to the judge0 node that owns the token
+        token, client = get_token_client(token)
+        test_case = TestCase.objects.select_related('code_question').filter(testcaseattempt__token=token).first()
+
         if status_only:
-            url = f"{settings.JUDGE0_URL}/submissions/{token}?base64_encoded=false&fields=status_id"
+            # the output of a custom input run is compared here instead of by judge0
+            fields = ["status_id", "stdout"] if expected_output_token else ["status_id"]
+            # the concurrency markers are in stderr (runs are not stored, so their question is not known)
+            if test_case is None or test_case.code_question.is_concurrency_question:
+                fields.append("stderr")
+            fields = ",".join(fields)
+            url = f"/submissions/{token}?base64_encoded=false&fields={fields}"
         elif vcd:
-            url = f"{settings.JUDGE0_URL}/submissions/{token}?base64_encoded=false&fields=status_id,stdout,stderr,expected_output,vcd_output"
+            url = f"/submissions/{token}?base64_encoded=false&fields=status_id,stdout,stderr,expected_output,vcd_output"
         else:
-            url = f"{settings.JUDGE0_URL}/submissions/{token}?base64_encoded=false&fields=status_id,stdin,stdout,stderr,expected_output,compile_output"
+            url = f"/submissions/{token}?base64_encoded=false&fields=status_id,stdin,stdout,stderr,expected_output,compile_output"
 
-        res = requests.get(url)
-        data = res.json()
+        data = client.get(url)
 
         # change to base64 encoding if needed
         if "error" in data:
             url = url.replace("base64_encoded=false", "base64_encoded=true")
-            res = requests.get(url)
-            data = res.json()
+            data = client.get(url)
             decode_judge0_params(data, "stdout")
             decode_judge0_params(data, "stdin")
             decode_judge0_params(data, "stderr")
             decode_judge0_params(data, "expected_output")
             decode_judge0_params(data, "compile_output")
 
-        stdout = data['stdout']
+        if expected_output_token and data['status_id'] not in PENDING_STATUSES:
+            data['expected_output'] = expected_output_result['stdout']
+            # submitted without an expected output, so judge0 reports Accepted for any successful run (only compared when
+            # the output was fetched)
+            if data['status_id'] == 3 and 'stdout' in data and not outputs_match(data['stdout'], data['expected_output']):
+                data['status_id'] = 4
+
+        stdout = data.get('stdout')
         
         # post processing for concurrency question
-        test_case = TestCase.objects.filter(testcaseattempt__token=token).first()
         max_threads = test_case.max_threads if test_case else 50
-        if stdout and re.match(r'AASP_\d+_THREADS_CREATED_INSUFFICIENT', stdout): 
-            concurrency_results = evaluate_concurrency_results(stdout, data['expected_output'], data['status_id'], data['stderr'], max_threads)
+        if has_concurrency_markers(data.get('stderr')) or has_concurrency_markers(stdout):
+            concurrency_results = evaluate_concurrency_results(stdout, data.get('expected_output'), data['status_id'], data.get('stderr'), max_threads)
             data["status_id"] = concurrency_results['status_id']
             data["stdout"] = concurrency_results['stdout']
+            data["stderr"] = concurrency_results['stderr']
 
         # append friendly status name
         data['status'] = judge0_statuses[int(data['status_id'])]
@@ -598,7 +667,7 @@ def check_tc_result(token, status_only = False, vcd = False):
 
         return data
     
-    except requests.exceptions.ConnectionError:
+    except requests.exceptions.RequestException:
         raise requests.exceptions.ConnectionError
 
 @api_view(["POST"])
@@ -611,7 +680,9 @@ def code_question_submission(request, code_question_attempt_id):
 
     Algorithm:
     - Generates 'CodeQuestionSubmission' and 'TestCaseAttempt's and stores in the database.
-    - Calls Judge0 api to submit the test cases
+    - Reuses the results of test cases that were already judged with identical code (see result_reuse_enabled)
+    - Calls Judge0 api to submit the remaining test cases, once their TestCaseAttempts are committed (so that judge0
+      callbacks find them)
     - Queues celery tasks for updating the statuses of TestCaseAttempt (by polling judge0)
     """
     try:
@@ -634,7 +705,7 @@ def code_question_submission(request, code_question_attempt_id):
                 return Response(error_context, status=status.HTTP_401_UNAUTHORIZED)
 
             # get test cases
-            test_cases = TestCase.objects.filter(code_question__codequestionattempt=cqa)
+            test_cases = list(TestCase.objects.filter(code_question__codequestionattempt=cqa))
 
             # generate params for judge0 call
             language_id = int(request.POST.get('lang-id'))
@@ -656,35 +727,52 @@ def code_question_submission(request, code_question_attempt_id):
                 code = request.POST.get('code')
                 submissions = [construct_judge0_params(code, language_id, test_case) for test_case in test_cases]
 
-            params = {"submissions": submissions}
-            # call judge0
-            try:
-                url = settings.JUDGE0_URL + "/submissions/batch?base64_encoded=false"
-                res = requests.post(url, json=params)
-                data = res.json()
-            except ConnectionError:
-                error_context = {
-                    "result": "error",
-                    "message": "Judge0 API seems to be down.",
-                }
-                return Response(error_context, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-            finally:
-                # delete zip file
-                if os.path.exists('submission.zip'):
-                    os.remove('submission.zip')
-            
-            # retrieve tokens from judge0 response
-            tokens = [x['token'] for x in data]
+            test_case_attempts = [TestCaseAttempt(test_case=tc) for tc in test_cases]
+
+            # reuse the results of identical submissions that were already judged
+            pending = list(zip(test_case_attempts, submissions))
+            if result_reuse_enabled(cqa.code_question):
+                for tca, submission in pending:
+                    tca.result_key = get_result_key(tca.test_case, submission)
+                reusable = find_reusable_results([tca.result_key for tca in test_case_attempts])
+                for tca in test_case_attempts:
+                    if tca.result_key in reusable:
+                        copy_test_case_result(reusable[tca.result_key], tca)
+                pending = [(tca, submission) for tca, submission in pending if tca.result_key not in reusable]
+
+            # judge0 will push the results to judge0_callback when each test case is finished
+            callback_url = get_callback_url()
+            if callback_url:
+                for _, submission in pending:
+                    submission["callback_url"] = callback_url
+
+            # judge0 is saturated, the test cases are sent to judge0 once it is their turn
+            lane = get_submission_lane(request.user, "submission")
+            queued = bool(pending) and not admit(request.user, len(pending), lane)
 
             with transaction.atomic():
                 # create CodeQuestionSubmission
                 cqs = CodeQuestionSubmission.objects.create(cq_attempt=cqa, code=code,
                                                             language=Language.objects.get(judge_language_id=language_id))
 
+                # test cases get placeholder tokens until they are sent to judge0 (queued, or right after the commit)
+                if queued:
+                    queued_submission, position = queue_judge0_submissions(request.user, "submission", lane,
+                                                                           [submission for _, submission in pending], cqs)
+                    for index, (tca, _) in enumerate(pending):
+                        tca.token = get_queued_token(queued_submission, index)
+                else:
+                    for index, (tca, _) in enumerate(pending):
+                        tca.token = get_sending_token(cqs.id, index)
+
                 # create TestCaseAttempts
-                test_case_attempts = TestCaseAttempt.objects.bulk_create([
-                    TestCaseAttempt(cq_submission=cqs, test_case=tc, token=token) for tc, token in zip(test_cases, tokens)
-                ])
+                for tca in test_case_attempts:
+                    tca.cq_submission = cqs
+                test_case_attempts = TestCaseAttempt.objects.bulk_create(test_case_attempts)
+
+                # all results were reused, so the submission is already complete
+                if not pending:
+                    update_finished_submissions([cqs.id])
 
                 start_time = request.POST.get('start_time')
                 current_time = timezone.localtime()
@@ -692,6 +780,28 @@ def code_question_submission(request, code_question_attempt_id):
                 cqa.time_spent = time_spent        
                 cqa.save()
 
+            if pending and not queued:
+                params = {"submissions": [submission for _, submission in pending]}
+                # call judge0
+                try:
+                    node, data = get_pool().submit("/submissions/batch?base64_encoded=false", params, lane=lane,
+                                                   count=len(pending))
+                except requests.exceptions.RequestException:
+                    # none of the test cases were sent, the submission is discarded
+                    cqs.delete()
+                    release(request.user, len(pending))
+                    error_context = {
+                        "result": "error",
+                        "message": "Judge0 API seems to be down.",
+                    }
+                    return Response(error_context, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+                # retrieve tokens from judge0 response
+                for (tca, _), x in zip(pending, data):
+                    tca.token = x['token']
+                    tca.judge0_node = node.name
+                TestCaseAttempt.objects.bulk_update([tca for tca, _ in pending], ['token', 'judge0_node'])
+
             # queue celery tasks
             # for tca in test_case_attempts:
             #     for i in range(1, 6):
@@ -703,8 +813,18 @@ def code_question_submission(request, code_question_attempt_id):
                 "time_submitted": timezone.localtime(cqs.time_submitted).strftime("%d/%m/%Y %I:%M %p"),
                 "statuses": [[tca.id, tca.status, tca.token] for tca in test_case_attempts]
             }
+            if queued:
+                context.update({
+                    "queued": True,
+                    "position": position,
+                    "message": f"Queued, position {position}",
+                })
             return Response(context, status=status.HTTP_200_OK)
 
+    except RateLimited:
+        return rate_limited_response()
+    except QueueFull:
+        return queue_full_response()
     except Exception as ex:
         error_context = { 
             "result": "error",
@@ -712,69 +832,40 @@ def code_question_submission(request, code_question_attempt_id):
         }
         return Response(error_context, status=status.HTTP_400_BAD_REQUEST)
 
-def update_test_case_attempt_status(tca_id: int, token: str):
+@api_view(["PUT"])
+@renderer_classes([JSONRenderer])
+@authentication_classes([])
+@permission_classes([])
+def judge0_callback(request):
     """
-    Polls judge0 to get the status_id of a single submission (one test case)
-    If status_id has been changed, save the change to db.
-    If the submission is still being processed, re-queue this task to be polled again later.
+    Called by judge0 (callback_url) when a submission (one test case) has finished executing.
+    The result is saved to the TestCaseAttempt, so that get_cq_submission_status does not have to poll judge0.
+    Unknown tokens (their TestCaseAttempt is saved once the POST to judge0 returns) are answered with 404, so that judge0
+    tries again (CALLBACKS_MAX_TRIES), and the test case is polled by the reconciler if the token is still unknown.
     """
+    if not verify_callback_key(request.GET.get("key")):
+        return Response({ "result": "error" }, status=status.HTTP_403_FORBIDDEN)
+
     try:
-        # call judge0
-        url = f"{settings.JUDGE0_URL}/submissions/{token}?base64_encoded=false&fields=status_id,stdout,stderr,time,memory"
-        res = requests.get(url)
-        data = res.json()
+        data = parse_callback_data(request.data)
 
-        status_id = data.get('status_id')
-        stdout = data.get('stdout')
-        stderr = data.get('stderr')
-        time = data.get('time')
-        memory = data.get('memory')
-
-        if status_id not in [1, 2]:
-            tca = TestCaseAttempt.objects.prefetch_related('cq_submission').get(id=tca_id)
-            tca.status = status_id
-            tca.time = time
-            tca.memory = memory
-            
-            # post processing for concurrency question
-            if tca.test_case.code_question.is_concurrency_question:
-                concurrency_results = evaluate_concurrency_results(stdout, tca.test_case.stdout, status_id, stderr, tca.test_case.max_threads)
-                tca.status = concurrency_results['status_id']
-                
-                # save number of threads used
-                tca.threads = get_max_threads_used(stdout)
-                tca.thread_times = "|".join(concurrency_results['thread_times'])
-            tca.stdout = stdout
-            tca.save()
-            # check if all test cases have been completed
-            finished = not TestCaseAttempt.objects.filter(cq_submission_id=tca.cq_submission.id, status__in=[1, 2]).exists()
-
-            # only continue if test cases are complete
-            if finished:
-                update_cqs_passed_flag(tca.cq_submission.id)
-    except ConnectionError as e:
-        print(e.message)
-
-def update_cqs_passed_flag(cqs_id):
-    """
-    Checks if all test cases of a CodeQuestionSubmission has been processed by judge0.
-    Update the "passed" field of the CQS instance and initiates the computation of the submission score.
-    If it was already calculated previously, nothing will be done.
-    """
-    # # check if all test cases have been completed
-    # finished = not TestCaseAttempt.objects.filter(cq_submission_id=cqs_id, status__in=[1, 2]).exists()
+        with transaction.atomic():
+            # ignore callbacks for test cases that were already updated (e.g. by polling)
+            tca = TestCaseAttempt.objects.select_for_update(of=('self',)).select_related('test_case__code_question') \
+                .filter(token=data['token'], status__in=PENDING_STATUSES).first()
+            if tca:
+                save_test_case_result(tca, data['status_id'], data['stdout'], data['stderr'], data['time'], data['memory'])
+            elif not TestCaseAttempt.objects.filter(token=data['token']).exists():
+                return Response({ "result": "error", "message": "Unknown token." }, status=status.HTTP_404_NOT_FOUND)
 
-    # # only continue if test cases are complete
-    # if finished:
-    # get cqs object
-    cqs = CodeQuestionSubmission.objects.get(id=cqs_id)
+        return Response({ "result": "success" }, status=status.HTTP_200_OK)
 
-    # only continue if it was not previously calculated
-    if cqs.passed is None:
-        # update the passed flag
-        passed = not TestCaseAttempt.objects.filter(cq_submission_id=cqs_id, status__range=(4, 17)).exists()
-        cqs.passed = passed
-        cqs.save()
+    except Exception as ex:
+        error_context = {
+            "result": "error",
+            "message": f"{ex}",
+        }
+        return Response(error_context, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(["GET"])
 @renderer_classes([JSONRenderer])
@@ -787,17 +878,7 @@ def get_cq_submission_status(request):
     try:
         if request.method == "GET":
             cq_submission_id = request.GET.get("cqs_id")
-
-            # get test case attempts
-            test_cases = list(
-                TestCaseAttempt.objects.filter(cq_submission=cq_submission_id).values_list('id', 'token'))
-            
-            for test_case in test_cases:
-                update_test_case_attempt_status(test_case[0], test_case[1])
-
-            test_cases = list(
-                TestCaseAttempt.objects.filter(cq_submission=cq_submission_id).values_list('id', 'status', 'token'))
-            cqs = CodeQuestionSubmission.objects.get(id=cq_submission_id)
+            cqs = CodeQuestionSubmission.objects.select_related('cq_attempt__assessment_attempt').get(id=cq_submission_id)
 
             # check if the cqa belongs to the request user
             if cqs.cq_attempt.assessment_attempt.candidate != request.user:
@@ -806,13 +887,31 @@ def get_cq_submission_status(request):
                     "message": "You do not have permissions to perform this action.",
                 }
                 return Response(error_context, status=status.HTTP_401_UNAUTHORIZED)
-            
+
+            # results are pushed by judge0_callback, only poll judge0 for test cases whose callback never arrived
+            if cqs.passed is None:
+                pending_test_cases = TestCaseAttempt.objects.filter(cq_submission=cqs)
+                if not polling_needed(cqs):
+                    pending_test_cases = pending_test_cases.none()
+
+                # fetch all pending test cases in one batched judge0 call
+                if refresh_test_case_attempts(pending_test_cases):
+                    cqs.refresh_from_db(fields=['passed'])
+
+            test_cases = list(
+                TestCaseAttempt.objects.filter(cq_submission=cqs).values_list('id', 'status', 'token'))
+
             context = {
                 "result": "success",
                 "cqs_id": cq_submission_id,
                 "outcome": cqs.outcome,
                 "statuses": test_cases
             }
+
+            # position in the submission queue, if judge0 was saturated when it was submitted
+            position = get_submission_queue_position(cqs)
+            if position:
+                context["position"] = position
             return Response(context, status=status.HTTP_200_OK)
     
     except Exception as ex:
@@ -855,11 +954,12 @@ def compute_assessment_attempt_score(assessment_attempt_id):
     """
     This task is queued when an AssessmentAttempt has been submitted (both user-initiated and server-side)
     This tasks calculates the total score of the AssessmentAttempt, and determines if it is the best attempt.
-    If the AssessmentAttempt contains a submission that is still being processed, the task will be delayed.
+    If the AssessmentAttempt contains a submission that is still being processed, the score is computed when its last
+    submission is finished instead.
     """
     # get the instance
     assessment_attempt = AssessmentAttempt.objects.get(id=assessment_attempt_id)
-    assessment_attempt.compute_score()
+    assessment_attempt.compute_score_if_complete()
 
 @api_view(["POST"])
 @renderer_classes([JSONRenderer])
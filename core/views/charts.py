@@ -3,10 +3,11 @@ import math
 from datetime import timedelta
 from django.db.models import Avg
 from core.models import CodeQuestionAttempt, McqQuestionAttempt, CodeQuestion, McqQuestion
+from core.stats import histogram, to_array
 
 def generate_score_distribution_graph(scores, max_value, title = "Score Distribution", x_title = "Score", y_title = "Number of Students"):
     buckets = create_buckets(0, max_value)
-    assign_buckets(buckets, [score for score in scores])
+    assign_buckets(buckets, scores)
     y_values, x_values = get_bucket_items(buckets)
 
     return {
@@ -65,14 +66,16 @@ def calculate_average_question_delta(question):
 
 def generate_question_time_spent_graph(question):
     if isinstance(question, CodeQuestion):
-        all_time_spent = [delta.total_seconds()/60 for delta in CodeQuestionAttempt.objects \
-            .filter(code_question=question, assessment_attempt__best_attempt=True, time_spent__gt=timedelta(seconds=0)) \
-            .values_list('time_spent', flat=True)]
+        all_time_spent = CodeQuestionAttempt.objects \
+            .filter(code_question=question, assessment_attempt__bestattempt__isnull=False, time_spent__gt=timedelta(seconds=0)) \
+            .values_list('time_spent', flat=True)
     elif isinstance(question, McqQuestion):
-        all_time_spent = [delta.total_seconds()/60 for delta in McqQuestionAttempt.objects \
-            .filter(mcq_question=question, assessment_attempt__best_attempt=True, time_spent__gt=timedelta(seconds=0)) \
-            .values_list('time_spent', flat=True)]
-    max_time_spent = max(all_time_spent) if len(all_time_spent) > 0 else 0
+        all_time_spent = McqQuestionAttempt.objects \
+            .filter(mcq_question=question, assessment_attempt__bestattempt__isnull=False, time_spent__gt=timedelta(seconds=0)) \
+            .values_list('time_spent', flat=True)
+    # minutes, converted as the rows are read
+    all_time_spent = to_array(delta.total_seconds() for delta in all_time_spent) / 60
+    max_time_spent = all_time_spent.max() if len(all_time_spent) > 0 else 0
     buckets = create_buckets(0, math.ceil(max_time_spent))
     assign_buckets(buckets, all_time_spent)
     y_values, x_values = get_bucket_items(buckets)
@@ -123,13 +126,10 @@ def create_buckets(min_value, max_value):
     return buckets
 
 def assign_buckets(buckets, data):
-    for value in data:
-        for bucket in buckets:
-            if value >= bucket["min"] and value < bucket["max"]:
-                bucket["count"] += 1
-                break
-        if value == buckets[-1]["max"]:
-            buckets[-1]["count"] += 1
+    # values in [min, max) of a bucket, and the values equal to the max of the last bucket, binned at once (see core/stats.py)
+    counts = histogram(data, [bucket["min"] for bucket in buckets], [bucket["max"] for bucket in buckets])
+    for bucket, count in zip(buckets, counts):
+        bucket["count"] += count
 
 def get_bucket_items(buckets):
     items = []
@@ -141,22 +141,3 @@ def get_bucket_items(buckets):
         else:
             labels.append("{} - {}".format(bucket["min"], bucket["max"]))
     return items, labels
-
-def calculate_median(values, key = lambda x: x):
-    if values is None or len(values) == 0:
-        return 0
-    
-    values = sorted([key(value) for value in values])
-    if len(values) % 2 == 1:
-        median = values[len(values)//2]
-    else:
-        median = (values[len(values)//2] + values[len(values)//2 - 1])/2
-
-    return round(median, 2)
-
-def calculate_mean(values, key = lambda x: x):
-    if values is None or len(values) == 0:
-        return 0
-    total = sum([key(value) for value in values])
-    mean = total / len(values)
-    return round(mean, 2)
\ No newline at end of file
@@ -1,10 +1,6 @@
 import re
-import zipfile
-import base64
-import os
 import requests
 
-from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import PermissionDenied
@@ -17,12 +13,15 @@ from rest_framework.response import Response
 from rest_framework.decorators import api_view, renderer_classes
 from rest_framework.renderers import JSONRenderer
 
+from core.admission import admit, RateLimited, QueueFull, get_queued_token
 from core.decorators import groups_allowed, UserGroup
+from core.judge0 import get_pool
 from core.forms.question_banks import CodeQuestionForm, ModuleGenerationForm, QuestionSolutionForm, QuestionTypeForm
 from core.models import QuestionBank, Assessment, CodeQuestion
 from core.models.questions import HDLQuestionConfig, TestCase, CodeSnippet, Language, Tag
 from core.serializers import CodeQuestionsSerializer
-from core.views.utils import TestbenchGenerator, check_permissions_course, check_permissions_question, embed_inout_module, embed_inout_testbench, generate_module
+from core.views.utils import TestbenchGenerator, check_permissions_course, check_permissions_question, embed_inout_module, embed_inout_testbench, generate_module, package_hdl_submission, \
+    get_submission_lane, queue_judge0_submissions, rate_limited_response, queue_full_response
 
 
 @login_required()
@@ -553,29 +552,31 @@ def compile_code(request):
                 except Exception as ex:
                     pass
             
-            # create zip file
-            with zipfile.ZipFile('submission.zip', 'w') as zip_file:
-                zip_file.writestr('main.v', module)
-                zip_file.writestr('testbench.v', testbench)
-                zip_file.writestr('compile', 'iverilog -o a.out main.v testbench.v')
-                zip_file.writestr('run', "vvp -n a.out | find -name '*.vcd' -exec python3 -m vcd2wavedrom.vcd2wavedrom --aasp -i {} + | tr -d '[:space:]'")
-
-            # encode zip file
-            with open('submission.zip', 'rb') as f:
-                encoded = base64.b64encode(f.read()).decode('utf-8')
+            encoded = package_hdl_submission(module, testbench)
 
             # judge0 params
             params = {
                 "additional_files": encoded,
                 "language_id": request.POST.get('lang-id'),
             }
-            
+
+            # judge0 is saturated, the code is compiled once it is its turn
+            lane = get_submission_lane(request.user, "compile")
+            if not admit(request.user, 1, lane):
+                queued_submission, position = queue_judge0_submissions(request.user, "compile", lane, [params])
+                context = {
+                    "result": "success",
+                    "token": get_queued_token(queued_submission),
+                    "queued": True,
+                    "position": position,
+                    "message": f"Queued, position {position}",
+                }
+                return Response(context, status=status.HTTP_200_OK)
+
             # call judge0
             try:
-                url = settings.JUDGE0_URL + "/submissions/?base64_encoded=false&wait=false"
-                res = requests.post(url, json=params)
-                data = res.json()
-            except requests.exceptions.ConnectionError:
+                node, data = get_pool().submit("/submissions/?base64_encoded=false&wait=false", params, lane=lane)
+            except requests.exceptions.RequestException:
                 error_context = {
                     "result": "error",
                     "message": "Judge0 API seems to be down.",
@@ -593,18 +594,17 @@ def compile_code(request):
 
             context = {
                 "result": "success",
-                "token": token,
+                "token": get_pool().qualify_token(node, token),
             }
             return Response(context, status=status.HTTP_200_OK)
     
+    except RateLimited:
+        return rate_limited_response()
+    except QueueFull:
+        return queue_full_response()
     except Exception as ex:
         error_context = {
             "result": "error",
             "message": f"{ex}",
         } 
-        return Response(error_context, status=status.HTTP_400_BAD_REQUEST)
-    
-    finally:
-        # delete zip file
-        if os.path.exists('submission.zip'):
-            os.remove('submission.zip')
\ No newline at end of file
+        return Response(error_context, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
@@ -3,7 +3,7 @@ import csv
 from datetime import timedelta
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import PermissionDenied
-from django.db.models import Q, Avg
+from django.db.models import Q
 from django.http import HttpResponse, Http404
 from django.shortcuts import render, get_object_or_404
 from django.utils import timezone
@@ -14,9 +14,10 @@ from rest_framework.decorators import api_view, renderer_classes
 from rest_framework.renderers import JSONRenderer
 
 from core.decorators import UserGroup, groups_allowed
-from core.models import Course, Assessment, AssessmentAttempt, CodeQuestionSubmission, CodeQuestion, McqQuestion, McqQuestionOption, McqQuestionAttempt, McqQuestionAttemptOption, TestCaseAttempt, TestCase, CandidateSnapshot
+from core.models import Course, Assessment, AssessmentAttempt, BestAttempt, CodeQuestionSubmission, CodeQuestion, McqQuestion, McqQuestionOption, McqQuestionAttempt, McqQuestionAttemptOption, TestCaseAttempt, TestCase, CandidateSnapshot
+from core.stats import describe
 from core.views.utils import check_permissions_assessment, get_question_instance
-from core.views.charts import generate_score_distribution_graph, generate_assessment_time_spent_graph, generate_question_time_spent_graph, generate_thread_timelines, calculate_median, calculate_mean
+from core.views.charts import generate_score_distribution_graph, generate_assessment_time_spent_graph, generate_question_time_spent_graph, generate_thread_timelines
 
 @login_required()
 @groups_allowed(UserGroup.educator)
@@ -31,26 +32,25 @@ def course_report(request, course_id):
     # calculate total weightage
     total_weightage = sum(assessment.weightage for assessment in assessments)
 
-    best_attempts = AssessmentAttempt.objects \
+    best_attempts = BestAttempt.objects \
                     .select_related("assessment") \
-                    .filter(assessment__in=assessments, best_attempt=True)
+                    .filter(assessment__in=assessments)
 
     # aggregate scores by candidate
     candidates = {}
     for attempt in best_attempts:
-        candidate = attempt.candidate
+        candidate = attempt.candidate_id
         weighted_score = attempt.score / attempt.assessment.total_score * attempt.assessment.weightage
         if candidate not in candidates:
             candidates[candidate] = weighted_score
         else:
             candidates[candidate] += weighted_score
 
-    # calculate mean score
+    # calculate mean and median score
     num_of_candidates = len(candidates)
-    mean_score = calculate_mean(candidates.values())
-
-    # calculate median score
-    median_score = calculate_median(candidates.values())
+    score_stats = describe(candidates.values())
+    mean_score = score_stats["mean"]
+    median_score = score_stats["median"]
 
     # # generate graph data
     score_graph = generate_score_distribution_graph(candidates.values(), total_weightage)
@@ -77,23 +77,19 @@ def assessment_report(request, assessment_id):
 
     best_attempts = AssessmentAttempt.objects \
                     .select_related("assessment") \
-                    .filter(assessment=assessment, best_attempt=True).order_by("-score")
+                    .filter(bestattempt__assessment=assessment).order_by("-score")
     ongoing_ungraded_attempts = AssessmentAttempt.objects \
                                 .select_related("assessment") \
                                 .filter(Q(assessment=assessment, time_submitted__isnull=True) | Q(time_submitted__isnull=False, score__isnull=True))
 
     # calculate mean and median score
-    mean_score = best_attempts.aggregate(Avg('score'))['score__avg']
-    count = best_attempts.count()
-    if count == 0:
-        median_score = 0
-    elif count % 2 == 0:
-        median_score = (best_attempts[count // 2 - 1].score + best_attempts[count // 2].score) / 2
-    else:
-        median_score = best_attempts[count // 2].score
+    scores = [attempt.score for attempt in best_attempts]
+    score_stats = describe(scores)
+    mean_score = score_stats["mean"]
+    median_score = score_stats["median"]
 
     # generate graph data
-    score_graph = generate_score_distribution_graph([attempt.score for attempt in best_attempts], assessment.total_score)
+    score_graph = generate_score_distribution_graph(scores, assessment.total_score)
     time_spent_graph = generate_assessment_time_spent_graph(questions)
 
     context = {
@@ -125,13 +121,14 @@ def question_report(request, assessment_id, question_id):
 @login_required()
 @groups_allowed(UserGroup.educator)
 def code_question_report(request, assessment, question):
-    # get best submission for each student
+    # get best submission for each student (from the persisted scores, submissions still processing have none yet)
     submissions_from_best_attempts = CodeQuestionSubmission.objects \
         .select_related('cq_attempt', 'cq_attempt__assessment_attempt') \
         .filter(
             Q(cq_attempt__code_question=question) &
-            Q(cq_attempt__assessment_attempt__best_attempt=True) &
-            Q(cq_attempt__time_spent__gt=timedelta(seconds=0))
+            Q(cq_attempt__assessment_attempt__bestattempt__isnull=False) &
+            Q(cq_attempt__time_spent__gt=timedelta(seconds=0)) &
+            Q(score__isnull=False)
         )
     
     user_submissions = {}
@@ -142,8 +139,10 @@ def code_question_report(request, assessment, question):
     best_submissions = list(user_submissions.values())
 
     # calculate mean and median score
-    mean_score = calculate_mean(best_submissions, key = lambda x : x.score)
-    median_score = calculate_median(best_submissions, key = lambda x : x.score)
+    scores = [submission.score for submission in best_submissions]
+    score_stats = describe(scores)
+    mean_score = score_stats["mean"]
+    median_score = score_stats["median"]
 
     # get all submissions regardless of best attempt
     all_submissions = CodeQuestionSubmission.objects \
@@ -151,7 +150,7 @@ def code_question_report(request, assessment, question):
         .filter(cq_attempt__code_question=question, cq_attempt__time_spent__gt=timedelta(seconds=0))
     
     # generate graph data
-    score_graph = generate_score_distribution_graph([submission.score for submission in best_submissions], question.max_score())
+    score_graph = generate_score_distribution_graph(scores, question.max_score())
     time_spent_graph = generate_question_time_spent_graph(question)
 
     context = {
@@ -169,26 +168,23 @@ def code_question_report(request, assessment, question):
 @login_required()
 @groups_allowed(UserGroup.educator)
 def mcq_question_report(request, assessment, question):
-    # get best submission for each student
-    best_attempts = list(McqQuestionAttempt.objects \
+    # get all attempts regardless of best attempt, graded at once
+    all_attempts = McqQuestionAttempt.grade_all(McqQuestionAttempt.objects \
         .select_related('assessment_attempt') \
-        .filter(
-            Q(mcq_question=question) &
-            Q(assessment_attempt__best_attempt=True) &
-            Q(time_spent__gt=timedelta(seconds=0))
-        ))
+        .filter(mcq_question=question, time_spent__gt=timedelta(seconds=0)))
+
+    # get best submission for each student
+    best_attempt_ids = set(BestAttempt.objects.filter(assessment=assessment).values_list('assessment_attempt_id', flat=True))
+    best_attempts = [attempt for attempt in all_attempts if attempt.assessment_attempt_id in best_attempt_ids]
 
     # calculate mean and median score
-    mean_score = calculate_mean(best_attempts, key = lambda x : x.score)
-    median_score = calculate_median(best_attempts, key = lambda x : x.score)
+    scores = [attempt.score for attempt in best_attempts]
+    score_stats = describe(scores)
+    mean_score = score_stats["mean"]
+    median_score = score_stats["median"]
 
-    # get all attempts regardless of best attempt
-    all_attempts = McqQuestionAttempt.objects \
-        .select_related('assessment_attempt') \
-        .filter(mcq_question=question, time_spent__gt=timedelta(seconds=0))
-    
     # generate graph data
-    score_graph = generate_score_distribution_graph([attempt.score for attempt in best_attempts], question.max_score())
+    score_graph = generate_score_distribution_graph(scores, question.max_score())
     time_spent_graph = generate_question_time_spent_graph(question)
 
     context = {
@@ -257,9 +253,11 @@ def get_candidate_attempts(request, assessment_id):
 def assessment_attempt_details(request):
     assessment_attempt_id = request.GET.get("attempt_id")
     assessment_attempt = get_object_or_404(AssessmentAttempt, id=assessment_attempt_id)
+    mcq_attempts = McqQuestionAttempt.grade_all(assessment_attempt.mcqquestionattempt_set.select_related('mcq_question'))
 
     context = {
-        "assessment_attempt": assessment_attempt
+        "assessment_attempt": assessment_attempt,
+        "mcq_attempts": mcq_attempts,
     }
     return render(request, "reports/assessment-attempt-details.html", context)
 
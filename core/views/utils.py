@@ -1,10 +1,20 @@
 import zipfile
 import base64
+import functools
+import hashlib
+import io
 import re
 
-from core.models import CodeQuestion, CodeQuestionAttempt, McqQuestion, McqQuestionAttempt, CourseGroup, User
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from core.admission import enqueue, get_queue_position, drain_stalled
+from core.models import CodeQuestion, CodeQuestionAttempt, McqQuestion, McqQuestionAttempt, CourseGroup, User, SolutionOutputCache
 from core.models.questions import Language
-from core.tasks import send_assessment_published_email
+from core.tasks import send_assessment_published_email, drain_submission_queue
 from core.concurrency import modify_concurrency_params
 
 
@@ -212,6 +222,105 @@ def construct_expected_output_judge0_params(test_case):
 
     return params
 
+def hash_text(text):
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+def get_solution_output_cache_key(test_case):
+    """
+    Cache key of the solution code's output for a (custom) test case.
+    Includes everything that affects the output: code question, solution code, language, stdin and limits.
+    """
+    code_question = test_case.code_question
+    limits = [test_case.time_limit, test_case.memory_limit]
+    if code_question.is_concurrency_question:
+        limits += [test_case.min_threads, test_case.max_threads]
+    parts = [code_question.id, hash_text(code_question.solution_code), code_question.solution_code_language_id, hash_text(test_case.stdin)] + limits
+    return hash_text("|".join(str(part) for part in parts))
+
+
+def get_cached_solution_output(test_case):
+    """
+    Returns the cached output of the solution code for this test case, or None if it has not been evaluated before.
+    """
+    key = get_solution_output_cache_key(test_case)
+    updated = SolutionOutputCache.objects.filter(key=key, stdout__isnull=False).update(last_used=timezone.now())
+    if not updated:
+        return None
+    return SolutionOutputCache.objects.filter(key=key).values_list('stdout', flat=True).first()
+
+
+def reserve_solution_output_cache(test_case, token):
+    """
+    Creates a pending cache entry for a solution code submission, its output is filled in by save_solution_output.
+    The least recently used entries are evicted when there are more than SOLUTION_OUTPUT_CACHE_SIZE entries.
+    """
+    code_question = test_case.code_question
+    SolutionOutputCache.objects.update_or_create(
+        key=get_solution_output_cache_key(test_case),
+        defaults={
+            "code_question": code_question,
+            "solution_hash": hash_text(code_question.solution_code),
+            "token": token,
+            "stdout": None,
+            "last_used": timezone.now(),
+        }
+    )
+
+    # evict least recently used entries
+    excess = SolutionOutputCache.objects.count() - settings.SOLUTION_OUTPUT_CACHE_SIZE
+    if excess > 0:
+        evicted = SolutionOutputCache.objects.order_by('last_used').values_list('id', flat=True)[:excess]
+        SolutionOutputCache.objects.filter(id__in=list(evicted)).delete()
+
+
+def save_solution_output(token, stdout):
+    """
+    Stores the output of a finished solution code submission in its pending cache entry.
+    """
+    SolutionOutputCache.objects.filter(token=token, stdout__isnull=True).update(stdout=stdout or "")
+
+
+def get_submission_lane(user, kind):
+    """
+    Priority class of judge0 traffic: graded submissions, then runs of educators (e.g. validating solutions and test cases),
+    then practice runs of students.
+    """
+    if kind == "submission":
+        return "graded"
+    return "educator" if is_educator(user) else "practice"
+
+
+def queue_judge0_submissions(user, kind, lane, submissions, cq_submission=None):
+    """
+    Queues judge0 submissions that were not admitted, and makes sure that the queue is being drained.
+    Returns the QueuedSubmission and its position in the queue of its lane.
+    """
+    queued_submission = enqueue(user, kind, lane, submissions, cq_submission)
+    position = get_queue_position(queued_submission)
+
+    # the drain task reschedules itself until the queue is empty
+    if position == 1 or drain_stalled():
+        transaction.on_commit(lambda: drain_submission_queue.apply_async(countdown=settings.ADMISSION_DRAIN_INTERVAL))
+    return queued_submission, position
+
+
+def rate_limited_response():
+    error_context = {
+        "result": "error",
+        "message": "You are submitting too frequently, please wait a moment and try again.",
+    }
+    return Response(error_context, status=status.HTTP_429_TOO_MANY_REQUESTS)
+
+
+def queue_full_response():
+    error_context = {
+        "result": "error",
+        "message": "The system is busy, please try again later.",
+    }
+    return Response(error_context, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
 def construct_judge0_params(code, lang_id, test_case) -> dict:
     """
     Constructs the parameters needed to send to Judge0 API.
@@ -266,21 +375,12 @@ def construct_judge0_params(code, lang_id, test_case) -> dict:
 
         try:
             main, input_ports, output_ports = embed_inout_module(main)
-            testbench = embed_inout_testbench(testbench, input_ports, output_ports)
+            testbench = embed_inout_testbench_cached(testbench, tuple(input_ports), tuple(output_ports))
         except:
             main = code
             testbench = test_case.stdin
-        
-        # create zip file
-        with zipfile.ZipFile('submission.zip', 'w') as zip_file:
-            zip_file.writestr('main.v', main)
-            zip_file.writestr('testbench.v', testbench)
-            zip_file.writestr('compile', 'iverilog -o a.out main.v testbench.v')
-            zip_file.writestr('run', "vvp -n a.out | find -name '*.vcd' -exec python3 -m vcd2wavedrom.vcd2wavedrom --aasp -i {} + | tr -d '[:space:]'")
-        
-        # encode zip file
-        with open('submission.zip', 'rb') as f:
-            encoded = base64.b64encode(f.read()).decode('utf-8')
+
+        encoded = package_hdl_submission(main, testbench)
 
         # judge0 params
         params = {
@@ -294,6 +394,36 @@ def construct_judge0_params(code, lang_id, test_case) -> dict:
     
     return params
 
+# files of a verilog submission that are the same for every submission
+HDL_COMPILE_SCRIPT = 'iverilog -o a.out main.v testbench.v'
+HDL_RUN_SCRIPT = "vvp -n a.out | find -name '*.vcd' -exec python3 -m vcd2wavedrom.vcd2wavedrom --aasp -i {} + | tr -d '[:space:]'"
+
+# fixed timestamp of the zipped files, so that identical submissions produce identical zips
+HDL_ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+def package_hdl_submission(main, testbench):
+    """
+    Zips the files of a verilog submission in memory and returns the base64 encoded zip ("additional_files" for judge0).
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zip_file:
+        for name, content in [('main.v', main), ('testbench.v', testbench), ('compile', HDL_COMPILE_SCRIPT), ('run', HDL_RUN_SCRIPT)]:
+            zip_info = zipfile.ZipInfo(name, date_time=HDL_ZIP_DATE_TIME)
+            zip_info.external_attr = 0o600 << 16
+            zip_file.writestr(zip_info, content)
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+
+@functools.lru_cache(maxsize=256)
+def embed_inout_testbench_cached(testbench_code, input_ports, output_ports):
+    """
+    embed_inout_testbench for a test case's testbench, which is the same for every submission with the same ports.
+    The ports must be given as tuples.
+    """
+    return embed_inout_testbench(testbench_code, list(input_ports), list(output_ports))
+
+
 def decode_judge0_params(data, key):
     if data[key]:
         data[key] = base64.b64decode(data[key])